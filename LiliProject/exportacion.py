@@ -0,0 +1,105 @@
+"""
+Exportación de listados a Excel con memoria constante
+
+El libro se escribe en modo write-only de openpyxl: cada fila se vuelca a
+disco apenas se agrega, en vez de mantener todas las celdas en memoria.
+Los estilos se registran una sola vez como estilos con nombre y cada celda
+solo copia la referencia.
+
+Cada listado exportable define una función `parametros -> Hoja` registrada
+en EXPORTACIONES; los trabajos en segundo plano (autenticacion.trabajos)
+la usan para generar el archivo sin ocupar un worker web.
+"""
+from copy import copy
+from dataclasses import dataclass
+from typing import Callable
+
+from django.utils.module_loading import import_string
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Filas que se leen de la base de datos por viaje
+TAMANO_LOTE = 2000
+
+# Listados exportables: tipo -> (función que arma la Hoja, parámetros GET que acepta).
+# El tipo coincide con el módulo de permisos que exige la acción 'exportar'.
+EXPORTACIONES = {
+    'usuarios': ('autenticacion.exportaciones.usuarios', ['search', 'rol', 'estado', 'sort', 'order']),
+    'proveedores': ('maestros.exportaciones.proveedores', ['search', 'estado', 'condicion_pago', 'sort', 'order']),
+}
+
+
+@dataclass
+class Hoja:
+    titulo: str
+    columnas: list          # [(encabezado, ancho), ...]
+    queryset: object        # values_list() con las columnas a leer
+    fila: Callable          # tupla del queryset -> lista de valores de la fila
+
+
+def parametros_de(tipo, query_params):
+    """Solo los parámetros que usa la exportación (sin vacíos ni paginación)"""
+    _, aceptados = EXPORTACIONES[tipo]
+    return {clave: query_params[clave] for clave in aceptados if query_params.get(clave)}
+
+
+def obtener_hoja(tipo, parametros):
+    ruta, _ = EXPORTACIONES[tipo]
+    return import_string(ruta)(parametros)
+
+
+def _estilos(color):
+    borde = Border(left=Side(style='thin'), right=Side(style='thin'),
+                   top=Side(style='thin'), bottom=Side(style='thin'))
+    encabezado = NamedStyle(
+        name='encabezado',
+        fill=PatternFill(start_color=color, end_color=color, fill_type='solid'),
+        font=Font(bold=True, color='FFFFFF', size=12),
+        alignment=Alignment(horizontal='center', vertical='center'),
+        border=borde,
+    )
+    celda = NamedStyle(name='celda', alignment=Alignment(vertical='center'), border=borde)
+    return encabezado, celda
+
+
+def escribir_xlsx(archivo, hoja, progreso=None, cada=1000, color='0066CC'):
+    """
+    Escribe la hoja en `archivo` y retorna el número de filas escritas.
+
+    Si se entrega `progreso`, se llama con las filas escritas cada `cada` filas.
+    """
+    wb = Workbook(write_only=True)
+    estilo_encabezado, estilo_celda = _estilos(color)
+    wb.add_named_style(estilo_encabezado)
+    wb.add_named_style(estilo_celda)
+
+    ws = wb.create_sheet(hoja.titulo)
+    for i, (_, ancho) in enumerate(hoja.columnas, 1):
+        ws.column_dimensions[get_column_letter(i)].width = ancho
+
+    # Celda modelo: las demás copian su arreglo de estilo en vez de resolverlo
+    modelo = WriteOnlyCell(ws)
+    modelo.style = estilo_encabezado.name
+    ws.append([_celda(ws, nombre, modelo) for nombre, _ in hoja.columnas])
+
+    modelo.style = estilo_celda.name
+    escritas = 0
+    for tupla in hoja.queryset.iterator(chunk_size=TAMANO_LOTE):
+        ws.append([_celda(ws, valor, modelo) for valor in hoja.fila(tupla)])
+        escritas += 1
+        if progreso and escritas % cada == 0:
+            progreso(escritas)
+
+    wb.save(archivo)
+    return escritas
+
+
+def _celda(ws, valor, modelo):
+    celda = WriteOnlyCell(ws, value=valor)
+    celda._style = copy(modelo._style)
+    return celda
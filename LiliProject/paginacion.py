@@ -0,0 +1,172 @@
+"""
+Paginación de listados por cursor (keyset)
+
+OFFSET obliga a la base de datos a recorrer y descartar todas las filas de
+las páginas anteriores, y el Paginator de Django agrega un COUNT en cada
+carga. Aquí cada página se pide "después de" (o "antes de") la última fila
+vista según el campo de orden más `id`, que es una búsqueda por índice sin
+importar qué tan profunda sea la página. Los cursores viajan firmados y son
+opacos para el navegador.
+
+El total mostrado es aproximado: sale de la tabla de contadores cuando los
+filtros lo permiten y, si no, de un COUNT cacheado brevemente.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+
+from autenticacion.contadores import clave
+
+
+TAMANOS_PAGINA = (10, 20, 30)
+SALT_CURSOR = 'LiliProject.paginacion.cursor'
+
+
+def tamano_pagina(valor, defecto=10):
+    """Registros por página acotados a TAMANOS_PAGINA"""
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return defecto
+    return valor if valor in TAMANOS_PAGINA else defecto
+
+
+class PaginaCursor:
+    """Una página de resultados con los cursores para moverse a sus vecinas"""
+
+    def __init__(self, object_list, has_next, has_previous, cursor_siguiente, cursor_anterior, total):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class PaginadorCursor:
+    """
+    Pagina `queryset` por `orden` (p. ej. 'razon_social' o '-created_at') e `id`.
+
+    Los campos de texto que admiten NULL se ordenan como cadena vacía, para
+    que la comparación fila a fila sea siempre válida.
+    """
+
+    def __init__(self, queryset, orden, per_page, total=None):
+        self.descendente = orden.startswith('-')
+        self.campo = orden.lstrip('-')
+        self.orden = orden
+        self.per_page = per_page
+        self.total = total
+
+        if self.campo in queryset.query.annotations:
+            # Orden por una anotación (p. ej. la relevancia de una búsqueda)
+            campo_modelo = queryset.query.annotations[self.campo].output_field
+        else:
+            campo_modelo = self._campo_modelo(queryset.model, self.campo)
+        self._to_python = campo_modelo.to_python
+        expresion = F(self.campo)
+        if campo_modelo.null:
+            expresion = Coalesce(expresion, Value(''))
+        self.queryset = queryset.annotate(_clave_orden=expresion)
+
+    @staticmethod
+    def _campo_modelo(modelo, ruta):
+        """Resuelve 'user__username' al campo final del modelo relacionado"""
+        *relaciones, nombre = ruta.split('__')
+        for relacion in relaciones:
+            modelo = modelo._meta.get_field(relacion).related_model
+        return modelo._meta.get_field(nombre)
+
+    def _codificar(self, fila, direccion):
+        valor = fila._clave_orden
+        if hasattr(valor, 'isoformat'):
+            valor = valor.isoformat()
+        return signing.dumps([self.orden, direccion, valor, fila.pk], salt=SALT_CURSOR, compress=True)
+
+    def _decodificar(self, cursor):
+        """Retorna (direccion, valor, pk) o None si el cursor no es válido para este orden"""
+        try:
+            orden, direccion, valor, pk = signing.loads(cursor, salt=SALT_CURSOR)
+        except (signing.BadSignature, ValueError, TypeError):
+            return None
+        if orden != self.orden or direccion not in ('siguiente', 'anterior'):
+            return None
+        return direccion, self._to_python(valor) if valor != '' else valor, pk
+
+    def page(self, cursor=None):
+        """Página siguiente/anterior al cursor; sin cursor (o inválido), la primera"""
+        posicion = self._decodificar(cursor) if cursor else None
+        direccion = posicion[0] if posicion else 'siguiente'
+
+        # Hacia atrás se recorre en el orden inverso y luego se da vuelta
+        descendente = self.descendente != (direccion == 'anterior')
+        queryset = self.queryset
+        if posicion:
+            _, valor, pk = posicion
+            op = 'lt' if descendente else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'_clave_orden__{op}': valor}) | Q(_clave_orden=valor, **{f'pk__{op}': pk})
+            )
+        signo = '-' if descendente else ''
+        filas = list(queryset.order_by(f'{signo}_clave_orden', f'{signo}pk')[:self.per_page + 1])
+
+        hay_mas = len(filas) > self.per_page
+        filas = filas[:self.per_page]
+        if direccion == 'anterior':
+            filas.reverse()
+            has_previous, has_next = hay_mas, True
+        else:
+            has_previous, has_next = posicion is not None, hay_mas
+
+        return PaginaCursor(
+            filas,
+            has_next=has_next and bool(filas),
+            has_previous=has_previous and bool(filas),
+            cursor_siguiente=self._codificar(filas[-1], 'siguiente') if has_next and filas else None,
+            cursor_anterior=self._codificar(filas[0], 'anterior') if has_previous and filas else None,
+            total=self.total,
+        )
+
+
+def total_listado(queryset, prefijo, contadores, filtros, **otros):
+    """
+    Total de filas del listado filtrado.
+
+    - `contadores`: dict ya leído con `leer_contadores`; debe incluir la clave
+      total del prefijo y la de cada filtro activo en `filtros`.
+    - `filtros`: {campo: valor} de igualdad sobre campos con contador.
+    - `otros`: resto de filtros (búsqueda, rol...); si alguno está activo hay
+      que contar en la base de datos.
+
+    Sin filtros, o con un solo filtro con contador, no se hace ninguna consulta.
+    """
+    activos = {campo: valor for campo, valor in filtros.items() if valor}
+    if not any(otros.values()):
+        if not activos:
+            return contadores[clave(prefijo)]
+        if len(activos) == 1:
+            (campo, valor), = activos.items()
+            return contadores[clave(prefijo, campo, valor)]
+
+    # Los valores de los contadores forman parte de la firma: al crear,
+    # eliminar o cambiar de estado un registro la entrada cacheada se descarta
+    firma = repr((sorted(activos.items()), sorted(otros.items()), sorted(contadores.items())))
+    cache_key = f'listado:{prefijo}:total:{hashlib.md5(firma.encode()).hexdigest()}'
+    total = cache.get(cache_key)
+    if total is None:
+        total = queryset.order_by().count()
+        cache.set(cache_key, total, getattr(settings, 'LISTADO_TOTAL_TTL', 30))
+    return total
@@ -59,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'autenticacion.middleware.RoleBasedAdminMiddleware',  # Middleware personalizado para roles
+    'autenticacion.middleware.RegistroActividadMiddleware',  # Último acceso (escritura por lotes)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -111,10 +112,21 @@ else:  # SQLite por defecto
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / os.getenv("DB_NAME", "db.sqlite3"),
+            # Base de pruebas en archivo: la de memoria compartida bloquea tablas
+            # completas y rechaza escrituras concurrentes en vez de esperarlas
+            # (ver las pruebas de concurrencia de inventario)
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
 
+# Backend que carga User + perfil Usuario + Rol en una sola consulta (y los cachea)
+AUTHENTICATION_BACKENDS = ['autenticacion.backends.PerfilRolBackend']
+
+# Segundos que se cachea el usuario autenticado con su perfil y rol
+AUTENTICACION_CACHE_TTL = int(os.getenv('AUTENTICACION_CACHE_TTL', '60'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -187,6 +199,61 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
+# Dashboard: segundos que se cachean los KPIs antes de recalcularlos
+DASHBOARD_KPIS_TTL = int(os.getenv('DASHBOARD_KPIS_TTL', '30'))
+
+# Permisos: segundos que se cachea el rol de cada usuario y la versión de cada rol.
+# Con una caché compartida (Redis/Memcached) los cambios se ven de inmediato;
+# con la caché local por proceso, a más tardar al vencer este TTL.
+PERMISOS_CACHE_TTL = int(os.getenv('PERMISOS_CACHE_TTL', '60'))
+
+# Listados: segundos que se cachea el total de un listado con búsqueda o varios filtros
+LISTADO_TOTAL_TTL = int(os.getenv('LISTADO_TOTAL_TTL', '30'))
+
+# Escáner EAN/SKU: cada cuántos segundos se buscan productos modificados y cada
+# cuántos se recarga el índice completo (para descartar productos eliminados)
+ESCANER_REFRESCO = int(os.getenv('ESCANER_REFRESCO', '5'))
+ESCANER_RECARGA_COMPLETA = int(os.getenv('ESCANER_RECARGA_COMPLETA', '600'))
+
+# Exportaciones a Excel: las genera `manage.py procesar_exportaciones` y se
+# borran pasados EXPORTACION_TTL segundos. Con EXPORTACION_ASINCRONA=False se
+# generan dentro del mismo request (desarrollo sin worker).
+EXPORTACION_ASINCRONA = os.getenv('EXPORTACION_ASINCRONA', 'True') == 'True'
+EXPORTACION_TTL = int(os.getenv('EXPORTACION_TTL', '3600'))
+
+# Exportación analítica (Parquet) de movimientos y stock: carpeta de destino y
+# segundos de margen que se dejan atrás de la hora actual, para no saltarse
+# movimientos guardados en transacciones que aún no confirman
+ANALITICA_DIR = os.getenv('ANALITICA_DIR', str(BASE_DIR / 'analitica'))
+ANALITICA_MARGEN = int(os.getenv('ANALITICA_MARGEN', '60'))
+
+# Vencimiento de lotes (`manage.py procesar_vencimientos`): días de
+# anticipación con que se avisa un lote POR_VENCER
+VENCIMIENTO_DIAS_AVISO = int(os.getenv('VENCIMIENTO_DIAS_AVISO', '30'))
+
+# Reservas de stock: minutos que dura una reserva sin confirmar antes de que
+# `manage.py expirar_reservas` la libere
+RESERVA_MINUTOS = int(os.getenv('RESERVA_MINUTOS', '15'))
+
+# Disponibilidad de stock cacheada por (producto, bodega): segundos que dura
+# una entrada. Cada cambio de stock la invalida al confirmarse; el TTL solo
+# limita lo que sobrevive a cambios hechos fuera de la aplicación. La caché en
+# memoria local por defecto guarda solo 300 entradas: en producción conviene
+# una compartida (Redis/Memcached) dimensionada con /inventario/disponibilidad/metricas/
+DISPONIBILIDAD_CACHE_TTL = int(os.getenv('DISPONIBILIDAD_CACHE_TTL', '300'))
+
+# Actividad: cada cuántos segundos se escriben los últimos accesos acumulados
+ACTIVIDAD_FLUSH_INTERVALO = int(os.getenv('ACTIVIDAD_FLUSH_INTERVALO', '60'))
+
+# Retención (días) usada por `manage.py purgar_retencion`
+RETENCION_DIAS = {
+    'sesiones': 30,           # Sesiones del sistema expiradas
+    'tokens_reseteo': 7,      # Tokens de reseteo expirados o usados
+    'django_session': 0,      # Sesiones de Django expiradas
+    'alertas_cerradas': 180,  # Alertas de stock resueltas o ignoradas
+    'exportaciones': 30,      # Trabajos de exportación expirados o fallidos
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -197,3 +264,9 @@ RESEND_API_KEY = 're_U7GLhZyZ_9GCv9DF3aVgDepLzuA9NNjyS'
 RESEND_FROM_EMAIL = 'onboarding@resend.dev'
 RESEND_TEST_EMAIL = 'alvaro.elo@alumnos.ucn.cl'  # Email verificado en Resend para pruebas
 COMPANY_NAME = 'Dulcería Lilis'
+
+# Bandeja de salida de correos (ver `manage.py enviar_correos`)
+# Transportes: autenticacion.correo.TransporteResend | TransporteArchivo | TransporteConsola
+CORREO_TRANSPORTE = os.getenv('CORREO_TRANSPORTE', 'autenticacion.correo.TransporteResend')
+CORREO_DIRECTORIO = BASE_DIR / 'correos_enviados'  # Usado por TransporteArchivo
+CORREO_MAX_INTENTOS = 5
@@ -22,11 +22,15 @@ from autenticacion.views import (
     login_view, dashboard_view, logout_view,
     usuarios_list, usuario_create, usuario_edit, usuario_delete,
     password_reset_request, password_reset_confirm,
-    exportar_usuarios_excel
+    exportar_usuarios_excel, exportacion_estado, exportacion_descargar
 )
 from maestros.views import (
     proveedores_list, proveedor_create, proveedor_edit, proveedor_delete,
-    exportar_proveedores_excel
+    exportar_proveedores_excel, escanear_producto
+)
+from inventario.views import (
+    exportar_analitica, cargar_movimientos, stock_historico, kardex_producto, salida_fefo,
+    crear_reserva, terminar_reserva, consultar_disponibilidad, metricas_disponibilidad
 )
 from LiliProject.views import error_404, error_500
 
@@ -51,6 +55,10 @@ urlpatterns = [
     path('usuarios/<int:usuario_id>/delete/', usuario_delete, name='usuario_delete'),
     path('usuarios/exportar-excel/', exportar_usuarios_excel, name='exportar_usuarios_excel'),
     
+    # Exportaciones en segundo plano
+    path('exportaciones/<int:trabajo_id>/', exportacion_estado, name='exportacion_estado'),
+    path('exportaciones/<int:trabajo_id>/descargar/', exportacion_descargar, name='exportacion_descargar'),
+    
     # Gestión de Proveedores
     path('proveedores/', proveedores_list, name='proveedores_list'),
     path('proveedores/create/', proveedor_create, name='proveedor_create'),
@@ -58,6 +66,21 @@ urlpatterns = [
     path('proveedores/<int:proveedor_id>/delete/', proveedor_delete, name='proveedor_delete'),
     path('proveedores/exportar-excel/', exportar_proveedores_excel, name='exportar_proveedores_excel'),
     
+    # Productos: lectura de códigos de barras (EAN/SKU)
+    path('productos/escanear/<str:codigo>/', escanear_producto, name='escanear_producto'),
+    
+    # Inventario: cargas de movimientos, salidas FEFO, reservas, disponibilidad, stock histórico,
+    # kardex y exportación analítica (Parquet)
+    path('inventario/movimientos/cargas/', cargar_movimientos, name='cargar_movimientos'),
+    path('inventario/movimientos/salidas-fefo/', salida_fefo, name='salida_fefo'),
+    path('inventario/reservas/', crear_reserva, name='crear_reserva'),
+    path('inventario/reservas/<int:reserva_id>/<str:accion>/', terminar_reserva, name='terminar_reserva'),
+    path('inventario/stock/historico/', stock_historico, name='stock_historico'),
+    path('inventario/disponibilidad/', consultar_disponibilidad, name='consultar_disponibilidad'),
+    path('inventario/disponibilidad/metricas/', metricas_disponibilidad, name='metricas_disponibilidad'),
+    path('inventario/kardex/<int:producto_id>/<int:bodega_id>/', kardex_producto, name='kardex_producto'),
+    path('inventario/analitica/<str:conjunto>/', exportar_analitica, name='exportar_analitica'),
+    
     # Rutas de prueba para páginas de error (SOLO PARA DESARROLLO)
     path('test-404/', error_404, name='test_404'),
     path('test-500/', error_500, name='test_500'),
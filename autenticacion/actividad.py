@@ -0,0 +1,104 @@
+"""
+Registro de actividad de usuarios y sesiones (escritura diferida)
+
+Cada request autenticado solo anota en memoria la hora de acceso. Cada
+ACTIVIDAD_FLUSH_INTERVALO segundos el proceso escribe todo lo acumulado con
+un UPDATE por tabla, así que muchos accesos de un mismo usuario se
+convierten en una sola escritura de `Usuario.ultimo_acceso` y
+`Sesion.ultimo_actividad`.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import Usuario, Sesion
+
+
+logger = logging.getLogger(__name__)
+
+# Máximo de filas por UPDATE (limita el tamaño del CASE generado)
+TAMANO_LOTE = 500
+
+
+class RegistroActividad:
+    """Acumula el último acceso por usuario y por sesión y lo escribe por lotes"""
+
+    def __init__(self):
+        self._usuarios = {}   # user_id -> datetime
+        self._sesiones = {}   # session_key -> datetime
+        self._lock = threading.Lock()
+        self._ultimo_flush = time.monotonic()
+
+    def registrar(self, user_id, session_key, momento):
+        with self._lock:
+            self._usuarios[user_id] = momento
+            if session_key:
+                self._sesiones[session_key] = momento
+            vencido = time.monotonic() - self._ultimo_flush >= getattr(settings, 'ACTIVIDAD_FLUSH_INTERVALO', 60)
+
+        if vencido:
+            self.flush()
+
+    def flush(self):
+        """Escribe en la base de datos lo acumulado desde el último flush"""
+        with self._lock:
+            usuarios, self._usuarios = self._usuarios, {}
+            sesiones, self._sesiones = self._sesiones, {}
+            self._ultimo_flush = time.monotonic()
+
+        try:
+            _actualizar_por_lotes(Usuario, 'user_id', 'ultimo_acceso', usuarios)
+            _actualizar_por_lotes(Sesion, 'token_sesion', 'ultimo_actividad', sesiones)
+        except Exception:
+            # Perder una ventana de actividad es preferible a romper el request
+            logger.exception('No se pudo registrar la actividad de %s usuarios', len(usuarios))
+
+
+def _actualizar_por_lotes(modelo, campo_clave, campo_fecha, valores):
+    """UPDATE modelo SET campo_fecha = CASE campo_clave WHEN ... END WHERE campo_clave IN (...)"""
+    claves = list(valores)
+    for i in range(0, len(claves), TAMANO_LOTE):
+        lote = claves[i:i + TAMANO_LOTE]
+        modelo.objects.filter(**{f'{campo_clave}__in': lote}).update(**{
+            campo_fecha: Case(
+                *[When(**{campo_clave: clave}, then=Value(valores[clave])) for clave in lote],
+                output_field=DateTimeField(),
+            )
+        })
+
+
+# Un registro por proceso; lo pendiente se escribe también al terminar el proceso
+registro_actividad = RegistroActividad()
+atexit.register(registro_actividad.flush)
+
+
+# --- Sesiones (conectado a user_logged_in / user_logged_out en signals.py) ---
+
+def iniciar_sesion(sender, request, user, **kwargs):
+    """Registra la sesión del usuario para poder seguir su actividad"""
+    if not hasattr(user, 'usuario_profile') or not request.session.session_key:
+        return
+    perfil = user.usuario_profile
+    ahora = timezone.now()
+    Sesion.objects.update_or_create(
+        token_sesion=request.session.session_key,
+        defaults={
+            'usuario': perfil,
+            'ip_address': request.META.get('REMOTE_ADDR'),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'ultimo_actividad': ahora,
+            'expira_en': request.session.get_expiry_date(),
+        },
+    )
+    Usuario.objects.filter(pk=perfil.pk).update(ultimo_acceso=ahora)
+
+
+def cerrar_sesion(sender, request, user, **kwargs):
+    """Marca la sesión como expirada (la purga la limpieza periódica)"""
+    if request is not None and request.session.session_key:
+        Sesion.objects.filter(token_sesion=request.session.session_key).update(expira_en=timezone.now())
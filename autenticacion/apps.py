@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AutenticacionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'autenticacion'
+
+    def ready(self):
+        # Registrar señales (invalidación de cachés del dashboard)
+        from . import signals  # noqa: F401
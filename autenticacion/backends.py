@@ -0,0 +1,57 @@
+"""
+Backend de autenticación del proyecto
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .models import Usuario
+
+
+def _clave_usuario(user_id):
+    return f'auth:usuario:{user_id}'
+
+
+class PerfilRolBackend(ModelBackend):
+    """
+    ModelBackend que carga User, Usuario (perfil) y Rol en una sola consulta.
+
+    El backend por defecto solo carga `auth_user`; el middleware, el context
+    processor y las vistas terminan accediendo a `user.usuario_profile.rol`,
+    lo que costaba dos consultas perezosas adicionales en cada request.
+
+    El usuario cargado se cachea por un tiempo corto (AUTENTICACION_CACHE_TTL)
+    y se invalida cuando cambian el User, su perfil o su rol.
+    """
+
+    def get_user(self, user_id):
+        clave = _clave_usuario(user_id)
+        user = cache.get(clave)
+        if user is None:
+            UserModel = get_user_model()
+            user = (
+                UserModel._default_manager
+                .select_related('usuario_profile__rol')
+                .filter(pk=user_id)
+                .first()
+            )
+            if user is None:
+                return None
+            cache.set(clave, user, getattr(settings, 'AUTENTICACION_CACHE_TTL', 60))
+        return user if self.user_can_authenticate(user) else None
+
+
+# --- Invalidación (conectada en signals.py) ---------------------------------
+
+def user_modificado(sender, instance, **kwargs):
+    cache.delete(_clave_usuario(instance.pk))
+
+
+def perfil_modificado(sender, instance, **kwargs):
+    cache.delete(_clave_usuario(instance.user_id))
+
+
+def rol_modificado(sender, instance, **kwargs):
+    user_ids = Usuario.objects.filter(rol=instance).values_list('user_id', flat=True)
+    cache.delete_many([_clave_usuario(user_id) for user_id in user_ids])
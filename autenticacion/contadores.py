@@ -0,0 +1,188 @@
+"""
+Contadores desnormalizados para el dashboard y los listados
+
+Cada contador es una fila (clave -> entero) de la tabla `contadores`. Las
+señales de guardado/eliminación ajustan los contadores en la misma
+transacción que el cambio, de modo que leer una estadística cuesta una
+búsqueda por clave en vez de un COUNT(*) sobre la tabla completa.
+
+Claves: "<prefijo>.total" y "<prefijo>.<campo>.<valor>",
+por ejemplo "proveedores.estado.ACTIVO" o "bodegas.activo.True".
+"""
+from collections import Counter
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import kpis
+
+
+# prefijo -> (modelo, campos por los que se cuenta)
+REGISTRO = {
+    'productos': ('maestros.Producto', ['estado']),
+    'proveedores': ('maestros.Proveedor', ['estado', 'condiciones_pago']),
+    'alertas': ('inventario.AlertaStock', ['estado']),
+    'bodegas': ('inventario.Bodega', ['activo']),
+    'ordenes': ('compras.OrdenCompra', ['estado']),
+    'usuarios': ('autenticacion.Usuario', ['estado']),
+}
+
+
+def clave(prefijo, campo=None, valor=None):
+    """Construye la clave de un contador"""
+    if campo is None:
+        return f'{prefijo}.total'
+    return f'{prefijo}.{campo}.{valor}'
+
+
+def _registro_de(modelo):
+    for prefijo, (label, campos) in REGISTRO.items():
+        if modelo._meta.label == label:
+            return prefijo, campos
+    return None, None
+
+
+def claves_de(instancia):
+    """Claves de contador a las que aporta una instancia"""
+    prefijo, campos = _registro_de(type(instancia))
+    return [clave(prefijo)] + [clave(prefijo, campo, getattr(instancia, campo)) for campo in campos]
+
+
+def _claves_de_valores(prefijo, campos, valores):
+    return [clave(prefijo)] + [clave(prefijo, campo, valores[campo]) for campo in campos]
+
+
+def aplicar_deltas(deltas):
+    """
+    Suma los deltas (clave -> entero) a la tabla de contadores.
+
+    Usa UPDATE ... SET valor = valor + delta, por lo que no hay lecturas
+    previas ni actualizaciones perdidas entre procesos. Las claves se
+    actualizan en orden para que dos transacciones nunca se bloqueen
+    mutuamente.
+    """
+    Contador = apps.get_model('autenticacion', 'Contador')
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        for k in sorted(deltas):
+            actualizados = Contador.objects.filter(clave=k).update(valor=F('valor') + deltas[k])
+            if not actualizados:
+                Contador.objects.get_or_create(clave=k)
+                Contador.objects.filter(clave=k).update(valor=F('valor') + deltas[k])
+        transaction.on_commit(kpis.invalidar_kpis_dashboard)
+
+
+def leer_contadores(claves):
+    """Lee varios contadores en una sola consulta (los inexistentes valen 0)"""
+    Contador = apps.get_model('autenticacion', 'Contador')
+    valores = dict(Contador.objects.filter(clave__in=claves).values_list('clave', 'valor'))
+    return {k: valores.get(k, 0) for k in claves}
+
+
+def actualizar_masivo(queryset, **valores):
+    """
+    Equivalente a queryset.update(**valores) que además ajusta los contadores.
+
+    QuerySet.update() no dispara señales, así que primero se agrupan las filas
+    afectadas por los campos contados y se traslada cada grupo a sus nuevas
+    claves. Retorna el número de filas actualizadas.
+    """
+    # update() tampoco aplica auto_now: se completa para que los lectores
+    # incrementales por updated_at (p. ej. el índice del escáner) vean el cambio
+    for campo in queryset.model._meta.concrete_fields:
+        if getattr(campo, 'auto_now', False) and campo.name not in valores:
+            valores[campo.name] = timezone.now()
+
+    prefijo, campos = _registro_de(queryset.model)
+    if prefijo is None or not set(campos) & set(valores):
+        return queryset.update(**valores)
+
+    with transaction.atomic():
+        deltas = Counter()
+        grupos = queryset.order_by().values(*campos).annotate(n=Count('pk'))
+        for grupo in grupos:
+            n = grupo.pop('n')
+            nuevos = {**grupo, **{c: valores[c] for c in campos if c in valores}}
+            deltas.subtract({k: n for k in _claves_de_valores(prefijo, campos, grupo)})
+            deltas.update({k: n for k in _claves_de_valores(prefijo, campos, nuevos)})
+        actualizados = queryset.update(**valores)
+        aplicar_deltas(deltas)
+    return actualizados
+
+
+def eliminar_masivo(queryset):
+    """
+    Borra las filas del queryset con un solo DELETE y ajusta los contadores.
+
+    Solo debe usarse con modelos sin relaciones en cascada: a diferencia de
+    QuerySet.delete() no carga las instancias ni dispara señales por fila.
+    Retorna el número de filas eliminadas.
+    """
+    prefijo, campos = _registro_de(queryset.model)
+    queryset = queryset.order_by()
+
+    with transaction.atomic(using=queryset.db):
+        deltas = Counter()
+        if prefijo is not None:
+            for grupo in queryset.values(*campos).annotate(n=Count('pk')):
+                n = grupo.pop('n')
+                deltas.subtract({k: n for k in _claves_de_valores(prefijo, campos, grupo)})
+        eliminados = queryset._raw_delete(queryset.db)
+        aplicar_deltas(deltas)
+    return eliminados
+
+
+def calcular_contadores():
+    """Recalcula todos los contadores desde las tablas de origen"""
+    esperados = {}
+    for prefijo, (label, campos) in REGISTRO.items():
+        modelo = apps.get_model(*label.split('.'))
+        esperados[clave(prefijo)] = modelo.objects.count()
+        for campo in campos:
+            for fila in modelo.objects.order_by().values(campo).annotate(n=Count('pk')):
+                esperados[clave(prefijo, campo, fila[campo])] = fila['n']
+    return esperados
+
+
+# --- Señales ----------------------------------------------------------------
+#
+# Las claves originales de una instancia se leen recién al guardarla (pre_save,
+# una consulta por índice de la clave primaria), no al cargarla: los listados y
+# exportaciones cargan miles de instancias que nunca se guardan. Después de
+# guardar quedan en la instancia para el siguiente guardado o eliminación.
+
+def preparar_guardado(sender, instance, raw=False, **kwargs):
+    """pre_save: lee las claves actuales de la fila para calcular el delta al guardar"""
+    if raw or instance._state.adding or hasattr(instance, '_claves_contador'):
+        return
+    prefijo, campos = _registro_de(sender)
+    fila = sender._base_manager.filter(pk=instance.pk).values(*campos).first()
+    if fila is not None:
+        instance._claves_contador = _claves_de_valores(prefijo, campos, fila)
+
+
+def actualizar_por_guardado(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    anteriores = [] if created else getattr(instance, '_claves_contador', [])
+    nuevas = claves_de(instance)
+    deltas = Counter(nuevas)
+    deltas.subtract(anteriores)
+    aplicar_deltas(deltas)
+    instance._claves_contador = nuevas
+
+
+def preparar_eliminacion(sender, instance, **kwargs):
+    """pre_delete: con campos contados diferidos, leerlos mientras la fila existe"""
+    prefijo, campos = _registro_de(sender)
+    if not hasattr(instance, '_claves_contador') and set(campos) & instance.get_deferred_fields():
+        instance._claves_contador = claves_de(instance)
+
+
+def actualizar_por_eliminacion(sender, instance, **kwargs):
+    aplicar_deltas({k: -1 for k in getattr(instance, '_claves_contador', claves_de(instance))})
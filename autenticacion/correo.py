@@ -0,0 +1,172 @@
+"""
+Envío asíncrono de correos mediante una bandeja de salida
+
+Las vistas solo encolan (`encolar_correo`), así su latencia no depende del
+proveedor de email. El worker `manage.py enviar_correos` toma lotes de la
+tabla `correos_salientes` y los envía con el transporte configurado en
+CORREO_TRANSPORTE, reintentando con espera exponencial si falla.
+
+Un worker se reserva cada correo marcándolo ENVIANDO hasta una hora
+(`proximo_intento`) que hace de marca de propiedad: la reserva se renueva
+justo antes de cada envío y el resultado se guarda solo si el correo sigue
+ENVIANDO con esa misma marca. Si otro worker lo tomó (la reserva venció),
+el primero lo salta en vez de enviarlo dos veces.
+"""
+import random
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import CorreoSaliente
+
+
+# Timeout de cada envío HTTP, en segundos
+TIMEOUT_ENVIO = 10
+
+# Tiempo que un worker se reserva un correo antes de que otro pueda tomarlo.
+# Se renueva antes de cada envío; al tomar el lote se suma lo que pueden
+# tardar los envíos anteriores del mismo lote (TIMEOUT_ENVIO por correo)
+RESERVA_ENVIO = timedelta(minutes=5)
+
+
+def encolar_correo(destinatario, asunto, plantilla, contexto):
+    """Renderiza la plantilla (compilada y cacheada por Django) y encola el correo"""
+    html = get_template(plantilla).render(contexto)
+    return CorreoSaliente.objects.create(destinatario=destinatario, asunto=asunto, html=html)
+
+
+# --- Transportes --------------------------------------------------------------
+
+class Transporte:
+    """Interfaz de transporte: `enviar` lanza una excepción si el envío falla"""
+
+    def enviar(self, correo):
+        raise NotImplementedError
+
+
+class TransporteResend(Transporte):
+    """Envía por la API HTTP de Resend reutilizando conexiones (requests.Session)"""
+
+    def __init__(self):
+        self.url = f"{getattr(settings, 'RESEND_API_URL', 'https://api.resend.com')}/emails"
+        self.sesion = requests.Session()
+        self.sesion.headers['Authorization'] = f'Bearer {settings.RESEND_API_KEY}'
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.sesion.mount('https://', adaptador)
+
+    def enviar(self, correo):
+        respuesta = self.sesion.post(self.url, timeout=TIMEOUT_ENVIO, json={
+            'from': settings.RESEND_FROM_EMAIL,
+            'to': correo.destinatario,
+            'subject': correo.asunto,
+            'html': correo.html,
+        })
+        respuesta.raise_for_status()
+
+
+class TransporteArchivo(Transporte):
+    """Para desarrollo y pruebas: guarda cada correo como .html en CORREO_DIRECTORIO"""
+
+    def __init__(self):
+        self.directorio = Path(getattr(settings, 'CORREO_DIRECTORIO', settings.BASE_DIR / 'correos_enviados'))
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    def enviar(self, correo):
+        nombre = f'{timezone.now():%Y%m%d_%H%M%S}_{correo.pk}.html'
+        contenido = f'<!-- Para: {correo.destinatario} | Asunto: {correo.asunto} -->\n{correo.html}'
+        (self.directorio / nombre).write_text(contenido, encoding='utf-8')
+
+
+class TransporteConsola(Transporte):
+    """Para desarrollo: imprime el correo en la salida estándar"""
+
+    def enviar(self, correo):
+        sys.stdout.write(f'[CORREO] Para: {correo.destinatario} | Asunto: {correo.asunto}\n{correo.html}\n')
+
+
+def obtener_transporte():
+    ruta = getattr(settings, 'CORREO_TRANSPORTE', 'autenticacion.correo.TransporteResend')
+    return import_string(ruta)()
+
+
+# --- Worker -----------------------------------------------------------------
+
+def _reservar_lote(tamano):
+    """
+    Toma hasta `tamano` correos listos para enviar y los marca como ENVIANDO.
+
+    Con SKIP LOCKED varios workers pueden trabajar a la vez sin tomar el mismo
+    correo. Los ENVIANDO cuya reserva venció (worker caído) se vuelven a tomar.
+    """
+    ahora = timezone.now()
+    hasta = ahora + RESERVA_ENVIO + timedelta(seconds=TIMEOUT_ENVIO * tamano)
+    with transaction.atomic():
+        correos = list(
+            CorreoSaliente.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(estado='PENDIENTE') | Q(estado='ENVIANDO'), proximo_intento__lte=ahora)
+            .order_by('proximo_intento')[:tamano]
+        )
+        CorreoSaliente.objects.filter(pk__in=[c.pk for c in correos]).update(
+            estado='ENVIANDO', proximo_intento=hasta,
+        )
+    for correo in correos:
+        correo.estado, correo.proximo_intento = 'ENVIANDO', hasta
+    return correos
+
+
+def _propio(correo):
+    """El correo, solo si sigue reservado por este worker (ENVIANDO con su marca)"""
+    return CorreoSaliente.objects.filter(pk=correo.pk, estado='ENVIANDO', proximo_intento=correo.proximo_intento)
+
+
+def _renovar(correo):
+    """Extiende la reserva antes de enviar; False si otro worker ya tomó el correo"""
+    hasta = timezone.now() + RESERVA_ENVIO
+    if not _propio(correo).update(proximo_intento=hasta):
+        return False
+    correo.proximo_intento = hasta
+    return True
+
+
+def _espera_reintento(intentos):
+    """Espera exponencial con variación aleatoria: ~1, 2, 4, 8... minutos (máx. 1 hora)"""
+    base = min(60 * 2 ** (intentos - 1), 3600)
+    return timedelta(seconds=base * random.uniform(0.8, 1.2))
+
+
+def procesar_cola(transporte=None, tamano_lote=50):
+    """Envía un lote de la bandeja de salida. Retorna (enviados, fallidos)"""
+    transporte = transporte or obtener_transporte()
+    max_intentos = getattr(settings, 'CORREO_MAX_INTENTOS', 5)
+    enviados = fallidos = 0
+
+    for correo in _reservar_lote(tamano_lote):
+        if not _renovar(correo):
+            continue
+        try:
+            transporte.enviar(correo)
+        except Exception as error:
+            intentos = correo.intentos + 1
+            _propio(correo).update(
+                estado='FALLIDO' if intentos >= max_intentos else 'PENDIENTE',
+                intentos=intentos,
+                proximo_intento=timezone.now() + _espera_reintento(intentos),
+                ultimo_error=str(error)[:2000],
+            )
+            fallidos += 1
+        else:
+            _propio(correo).update(
+                estado='ENVIADO', intentos=correo.intentos + 1, enviado_en=timezone.now(), ultimo_error=None,
+            )
+            enviados += 1
+
+    return enviados, fallidos
@@ -0,0 +1,69 @@
+"""
+Listados de autenticación exportables a Excel (ver LiliProject.exportacion)
+"""
+from django.db.models import Q
+
+from LiliProject.exportacion import Hoja
+from .models import Usuario
+
+
+def usuarios(parametros):
+    """Usuarios con los mismos filtros y orden que el listado"""
+    queryset = Usuario.objects.all()
+
+    search = parametros.get('search', '').strip()
+    if search:
+        queryset = queryset.filter(
+            Q(user__username__icontains=search) |
+            Q(user__first_name__icontains=search) |
+            Q(user__last_name__icontains=search) |
+            Q(user__email__icontains=search) |
+            Q(telefono__icontains=search)
+        )
+
+    if parametros.get('rol'):
+        queryset = queryset.filter(rol_id=parametros['rol'])
+
+    if parametros.get('estado'):
+        queryset = queryset.filter(estado=parametros['estado'])
+
+    sort_fields = {
+        'username': 'user__username',
+        'nombre': 'user__first_name',
+        'email': 'user__email',
+        'rol': 'rol__nombre',
+        'estado': 'estado',
+        'created_at': 'created_at',
+    }
+    sort_by = parametros.get('sort', 'created_at')
+    if sort_by in sort_fields:
+        order_field = sort_fields[sort_by]
+        if parametros.get('order', 'desc') == 'desc':
+            order_field = f'-{order_field}'
+        queryset = queryset.order_by(order_field)
+
+    def fila(tupla):
+        username, first_name, last_name, email, telefono, rol, area_unidad, estado, created_at = tupla
+        return [
+            username,
+            f'{first_name} {last_name}'.strip() or '-',
+            email or '-',
+            telefono or '-',
+            rol or '-',
+            area_unidad or '-',
+            'Activo' if estado == 'ACTIVO' else 'Inactivo',
+            created_at.strftime('%d/%m/%Y %H:%M') if created_at else '-',
+        ]
+
+    return Hoja(
+        titulo='Usuarios',
+        columnas=[
+            ('Usuario', 15), ('Nombre Completo', 30), ('Email', 35), ('Teléfono', 15),
+            ('Rol', 20), ('Área/Unidad', 25), ('Estado', 12), ('Fecha Creación', 20),
+        ],
+        queryset=queryset.values_list(
+            'user__username', 'user__first_name', 'user__last_name', 'user__email',
+            'telefono', 'rol__nombre', 'area_unidad', 'estado', 'created_at',
+        ),
+        fila=fila,
+    )
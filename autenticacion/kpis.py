@@ -0,0 +1,91 @@
+"""
+Indicadores (KPIs) del dashboard
+
+Todos los indicadores se leen de la tabla de contadores en una sola consulta
+y se guardan en caché con un TTL corto. Cuando el valor vence, solo un
+proceso lo recalcula (el que obtiene el candado); el resto sigue sirviendo
+el valor anterior.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import contadores
+
+
+CACHE_KEY = 'dashboard:kpis'
+LOCK_KEY = 'dashboard:kpis:lock'
+
+# Estados de orden de compra que se consideran "abiertas"
+ESTADOS_ORDEN_ABIERTA = ['BORRADOR', 'ENVIADA', 'CONFIRMADA']
+
+
+def _calcular_kpis():
+    claves_ordenes = [contadores.clave('ordenes', 'estado', e) for e in ESTADOS_ORDEN_ABIERTA]
+    valores = contadores.leer_contadores([
+        contadores.clave('productos', 'estado', 'ACTIVO'),
+        contadores.clave('alertas', 'estado', 'ACTIVA'),
+        contadores.clave('bodegas', 'activo', True),
+        *claves_ordenes,
+    ])
+    alertas = valores[contadores.clave('alertas', 'estado', 'ACTIVA')]
+    return {
+        'productos_count': valores[contadores.clave('productos', 'estado', 'ACTIVO')],
+        'alertas_count': alertas,
+        'ordenes_count': sum(valores[k] for k in claves_ordenes),
+        'bodegas_count': valores[contadores.clave('bodegas', 'activo', True)],
+        # La campana de notificaciones muestra las mismas alertas activas
+        'notification_count': alertas,
+    }
+
+
+def obtener_kpis_dashboard():
+    """
+    Retorna los KPIs del dashboard desde la caché, recalculándolos si vencieron.
+
+    La entrada se guarda con una expiración "blanda" (DASHBOARD_KPIS_TTL) y una
+    expiración real más larga, para poder servir el valor anterior mientras un
+    único proceso lo recalcula (protección contra estampidas).
+    """
+    ttl = getattr(settings, 'DASHBOARD_KPIS_TTL', 30)
+    ahora = time.time()
+
+    entrada = cache.get(CACHE_KEY)
+    if entrada and entrada['vence'] > ahora:
+        return entrada['kpis']
+
+    # Solo un proceso recalcula; el candado vence solo si el proceso muere
+    if cache.add(LOCK_KEY, 1, timeout=ttl):
+        try:
+            kpis = _calcular_kpis()
+            cache.set(CACHE_KEY, {'kpis': kpis, 'vence': ahora + ttl}, timeout=ttl * 10)
+            return kpis
+        finally:
+            cache.delete(LOCK_KEY)
+
+    # Otro proceso está recalculando: servir el valor anterior si existe
+    if entrada:
+        return entrada['kpis']
+
+    # Sin valor previo (arranque en frío): esperar brevemente al que recalcula
+    for _ in range(10):
+        time.sleep(0.05)
+        entrada = cache.get(CACHE_KEY)
+        if entrada:
+            return entrada['kpis']
+
+    return _calcular_kpis()
+
+
+def invalidar_kpis_dashboard(**kwargs):
+    """
+    Marca los KPIs como vencidos sin borrarlos, de modo que el siguiente
+    request los recalcule mientras los demás siguen viendo el valor anterior.
+
+    Acepta **kwargs para poder conectarse directamente a señales de Django.
+    """
+    entrada = cache.get(CACHE_KEY)
+    if entrada:
+        entrada['vence'] = 0
+        cache.set(CACHE_KEY, entrada, timeout=getattr(settings, 'DASHBOARD_KPIS_TTL', 30) * 10)
@@ -0,0 +1,45 @@
+"""
+Worker de la bandeja de salida de correos
+
+Uso:
+    python manage.py enviar_correos              # procesa lo pendiente y termina
+    python manage.py enviar_correos --loop       # queda escuchando la cola
+    python manage.py enviar_correos --transporte autenticacion.correo.TransporteArchivo
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from autenticacion.correo import obtener_transporte, procesar_cola
+
+
+class Command(BaseCommand):
+    help = 'Envía por lotes los correos encolados en la bandeja de salida'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='No terminar: seguir revisando la cola')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos de espera cuando la cola está vacía (default: 2)')
+        parser.add_argument('--lote', type=int, default=50,
+                            help='Correos por lote (default: 50)')
+        parser.add_argument('--transporte',
+                            help='Ruta de la clase de transporte (sobrescribe CORREO_TRANSPORTE)')
+
+    def handle(self, *args, **options):
+        # Un único transporte para todo el proceso: reutiliza las conexiones HTTP
+        if options['transporte']:
+            transporte = import_string(options['transporte'])()
+        else:
+            transporte = obtener_transporte()
+
+        while True:
+            enviados, fallidos = procesar_cola(transporte, tamano_lote=options['lote'])
+            if enviados or fallidos:
+                self.stdout.write(f'📧 {enviados} enviados, {fallidos} con error')
+
+            if enviados + fallidos < options['lote']:
+                if not options['loop']:
+                    break
+                time.sleep(options['intervalo'])
@@ -0,0 +1,36 @@
+"""
+Worker de las exportaciones a Excel en segundo plano
+
+Uso:
+    python manage.py procesar_exportaciones           # procesa lo pendiente y termina
+    python manage.py procesar_exportaciones --loop    # queda escuchando la cola
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from autenticacion.trabajos import expirar_archivos, procesar_cola
+
+
+class Command(BaseCommand):
+    help = 'Genera los archivos de las exportaciones encoladas y borra los vencidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='No terminar: seguir revisando la cola')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos de espera cuando la cola está vacía (default: 2)')
+
+    def handle(self, *args, **options):
+        while True:
+            expirados = expirar_archivos()
+            if expirados:
+                self.stdout.write(f'🗑️  {expirados} exportaciones expiradas')
+
+            completados, fallidos = procesar_cola()
+            if completados or fallidos:
+                self.stdout.write(f'📊 {completados} exportaciones generadas, {fallidos} con error')
+
+            if not options['loop']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,47 @@
+"""
+Purga filas vencidas según las políticas de retención
+
+Uso:
+    python manage.py purgar_retencion
+    python manage.py purgar_retencion --politica sesiones --lote 500 --pausa 0.2
+    python manage.py purgar_retencion --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+from autenticacion.retencion import POLITICAS, dias_retencion, purgar
+
+
+class Command(BaseCommand):
+    help = 'Elimina por lotes las sesiones, tokens y alertas cerradas que superan su retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--politica', action='append', choices=[p.nombre for p in POLITICAS],
+                            help='Política a ejecutar (repetible). Por defecto, todas')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Tamaño del rango de clave primaria por transacción (default: 1000)')
+        parser.add_argument('--pausa', type=float, default=0.05,
+                            help='Segundos de espera entre lotes (default: 0.05)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo contar las filas purgables')
+
+    def handle(self, *args, **options):
+        seleccionadas = options['politica'] or [p.nombre for p in POLITICAS]
+
+        for politica in POLITICAS:
+            if politica.nombre not in seleccionadas:
+                continue
+
+            resultado = purgar(politica, tamano_lote=options['lote'],
+                               pausa=options['pausa'], dry_run=options['dry_run'])
+
+            if options['dry_run']:
+                self.stdout.write(
+                    f'🔎 {politica.nombre}: {resultado.eliminadas} filas purgables '
+                    f'(retención {dias_retencion(politica)} días)'
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'✅ {politica.nombre}: {resultado.eliminadas} filas eliminadas en '
+                    f'{resultado.lotes} lotes, {resultado.segundos:.1f}s '
+                    f'({resultado.filas_por_segundo:.0f} filas/s)'
+                ))
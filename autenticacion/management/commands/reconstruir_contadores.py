@@ -0,0 +1,58 @@
+"""
+Reconstruye la tabla de contadores desde las tablas de origen
+
+Uso:
+    python manage.py reconstruir_contadores            # reporta diferencias y corrige
+    python manage.py reconstruir_contadores --dry-run  # solo reporta diferencias
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from autenticacion.contadores import calcular_contadores
+from autenticacion.kpis import invalidar_kpis_dashboard
+from autenticacion.models import Contador
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores desnormalizados y reporta las diferencias encontradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo reportar diferencias, sin modificar la tabla')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Bloquear los contadores mientras se recalculan para no perder
+            # ajustes concurrentes hechos por las señales
+            actuales = dict(Contador.objects.select_for_update().values_list('clave', 'valor'))
+            esperados = calcular_contadores()
+
+            # Claves que ya no tienen filas (p. ej. un estado sin registros) quedan en 0
+            claves = sorted(set(actuales) | set(esperados))
+            diferencias = [
+                (k, actuales.get(k, 0), esperados.get(k, 0))
+                for k in claves
+                if actuales.get(k, 0) != esperados.get(k, 0)
+            ]
+
+            for k, actual, esperado in diferencias:
+                self.stdout.write(f'  {k}: {actual} -> {esperado} (desvío {actual - esperado:+d})')
+
+            if not options['dry_run']:
+                existentes = Contador.objects.in_bulk(claves, field_name='clave')
+                nuevos = []
+                for k in claves:
+                    if k in existentes:
+                        existentes[k].valor = esperados.get(k, 0)
+                    else:
+                        nuevos.append(Contador(clave=k, valor=esperados.get(k, 0)))
+                Contador.objects.bulk_update(existentes.values(), ['valor'], batch_size=500)
+                Contador.objects.bulk_create(nuevos, batch_size=500)
+                transaction.on_commit(invalidar_kpis_dashboard)
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS(f'✅ {len(claves)} contadores sin desvíos'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'⚠️  {len(diferencias)} contadores con desvío (sin cambios, --dry-run)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ {len(diferencias)} contadores corregidos'))
@@ -3,8 +3,10 @@ from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import admin
 from django.http import HttpResponseForbidden
+from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
 from autenticacion.models import Usuario
+from autenticacion.actividad import registro_actividad
 
 
 class RoleBasedAdminMiddleware(MiddlewareMixin):
@@ -45,4 +47,19 @@ class RoleBasedAdminMiddleware(MiddlewareMixin):
             
         # Para rutas específicas de modelos, Django manejará los permisos
         # Este middleware solo bloquea accesos no autorizados básicos
-        return None
\ No newline at end of file
+        return None
+
+
+class RegistroActividadMiddleware(MiddlewareMixin):
+    """
+    Middleware que anota el último acceso del usuario y de su sesión.
+
+    No escribe en la base de datos en cada request: el registro acumula los
+    accesos en memoria y los escribe por lotes (ver autenticacion.actividad).
+    """
+
+    def process_response(self, request, response):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            registro_actividad.registrar(user.pk, request.session.session_key, timezone.now())
+        return response
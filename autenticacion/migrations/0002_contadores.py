@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:35
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Copia de autenticacion.contadores.REGISTRO al crear la tabla: la migración
+# no debe cambiar si el registro cambia después
+REGISTRO = {
+    'productos': ('maestros.Producto', ['estado']),
+    'proveedores': ('maestros.Proveedor', ['estado', 'condiciones_pago']),
+    'alertas': ('inventario.AlertaStock', ['estado']),
+    'bodegas': ('inventario.Bodega', ['activo']),
+    'ordenes': ('compras.OrdenCompra', ['estado']),
+    'usuarios': ('autenticacion.Usuario', ['estado']),
+}
+
+
+def poblar_contadores(apps, schema_editor):
+    """Carga inicial de los contadores desde las tablas existentes"""
+    Contador = apps.get_model('autenticacion', 'Contador')
+    contadores = []
+    for prefijo, (label, campos) in REGISTRO.items():
+        modelo = apps.get_model(*label.split('.'))
+        contadores.append(Contador(clave=f'{prefijo}.total', valor=modelo.objects.count()))
+        for campo in campos:
+            for fila in modelo.objects.order_by().values(campo).annotate(n=Count('pk')):
+                contadores.append(Contador(clave=f'{prefijo}.{campo}.{fila[campo]}', valor=fila['n']))
+    Contador.objects.bulk_create(contadores)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0001_initial'),
+        ('maestros', '0001_initial'),
+        ('inventario', '0001_initial'),
+        ('compras', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Contador',
+                'verbose_name_plural': 'Contadores',
+                'db_table': 'contadores',
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0002_contadores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rol',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Aumenta en cada guardado para invalidar permisos cacheados'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0004_correos_salientes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text='Clave en LiliProject.exportacion.EXPORTACIONES', max_length=50)),
+                ('parametros', models.JSONField(default=dict, help_text='Filtros y orden del listado')),
+                ('firma', models.CharField(help_text='Hash de tipo + parámetros, para deduplicar', max_length=64)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido'), ('EXPIRADO', 'Expirado')], default='PENDIENTE', max_length=20)),
+                ('filas_procesadas', models.PositiveIntegerField(default=0)),
+                ('filas_totales', models.PositiveIntegerField(blank=True, null=True)),
+                ('archivo', models.FileField(blank=True, null=True, upload_to='exportaciones/')),
+                ('nombre_archivo', models.CharField(blank=True, default='', max_length=255)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('reservado_hasta', models.DateTimeField(blank=True, help_text='Si el worker cae, otro lo retoma pasada esta fecha', null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('terminado_en', models.DateTimeField(blank=True, null=True)),
+                ('expira_en', models.DateTimeField(blank=True, null=True)),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Exportación',
+                'verbose_name_plural': 'Trabajos de Exportación',
+                'db_table': 'trabajos_exportacion',
+                'indexes': [models.Index(fields=['firma', 'estado'], name='trabajos_ex_firma_d9c028_idx'), models.Index(fields=['estado', 'created_at'], name='trabajos_ex_estado_e10f59_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -15,6 +16,8 @@ class Rol(models.Model):
     nombre = models.CharField(max_length=50, unique=True, choices=ROLES_CHOICES)
     descripcion = models.CharField(max_length=255, null=True, blank=True)
     permisos = models.JSONField(null=True, blank=True, help_text='JSON con permisos del rol')
+    version = models.PositiveIntegerField(default=1, editable=False,
+                                          help_text='Aumenta en cada guardado para invalidar permisos cacheados')
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -25,6 +28,27 @@ class Rol(models.Model):
     def __str__(self):
         return f"{self.get_nombre_display()}"
 
+    def save(self, *args, **kwargs):
+        """
+        Incrementa la versión para que se recompilen los permisos cacheados.
+
+        El incremento lo hace la base de datos (F('version') + 1) antes de
+        guardar el resto de los campos: dos guardados simultáneos obtienen
+        versiones distintas y el último en confirmar queda con la mayor. La
+        versión ya leída está en la instancia cuando corren las señales.
+        """
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():
+            Rol.objects.filter(pk=self.pk).update(version=F('version') + 1)
+            self.refresh_from_db(fields=['version'])
+            campos = kwargs.get('update_fields') or [
+                campo.name for campo in self._meta.concrete_fields if not campo.primary_key
+            ]
+            kwargs['update_fields'] = [campo for campo in campos if campo != 'version']
+            super().save(*args, **kwargs)
+
 
 class Usuario(models.Model):
     ESTADO_CHOICES = [
@@ -98,3 +122,89 @@ class Sesion(models.Model):
 
     def __str__(self):
         return f"Sesión de {self.usuario.user.username}"
+
+
+class Contador(models.Model):
+    """Contador desnormalizado (clave -> entero) mantenido por señales"""
+    clave = models.CharField(max_length=100, unique=True)
+    valor = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'contadores'
+        verbose_name = 'Contador'
+        verbose_name_plural = 'Contadores'
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
+
+
+class CorreoSaliente(models.Model):
+    """Bandeja de salida: los correos se encolan aquí y los envía `manage.py enviar_correos`"""
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADO', 'Enviado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+
+    destinatario = models.EmailField()
+    asunto = models.CharField(max_length=255)
+    html = models.TextField()
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now,
+                                           help_text='No se intenta enviar antes de esta fecha')
+    ultimo_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'correos_salientes'
+        verbose_name = 'Correo Saliente'
+        verbose_name_plural = 'Correos Salientes'
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento']),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} -> {self.destinatario} ({self.get_estado_display()})"
+
+
+class TrabajoExportacion(models.Model):
+    """Exportación a Excel en segundo plano (la procesa `manage.py procesar_exportaciones`)"""
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('COMPLETADO', 'Completado'),
+        ('FALLIDO', 'Fallido'),
+        ('EXPIRADO', 'Expirado'),
+    ]
+
+    tipo = models.CharField(max_length=50, help_text='Clave en LiliProject.exportacion.EXPORTACIONES')
+    parametros = models.JSONField(default=dict, help_text='Filtros y orden del listado')
+    firma = models.CharField(max_length=64, help_text='Hash de tipo + parámetros, para deduplicar')
+    solicitado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    filas_totales = models.PositiveIntegerField(null=True, blank=True)
+    archivo = models.FileField(upload_to='exportaciones/', null=True, blank=True)
+    nombre_archivo = models.CharField(max_length=255, blank=True, default='')
+    error = models.TextField(null=True, blank=True)
+    reservado_hasta = models.DateTimeField(null=True, blank=True,
+                                           help_text='Si el worker cae, otro lo retoma pasada esta fecha')
+    created_at = models.DateTimeField(default=timezone.now)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+    expira_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'trabajos_exportacion'
+        verbose_name = 'Trabajo de Exportación'
+        verbose_name_plural = 'Trabajos de Exportación'
+        indexes = [
+            models.Index(fields=['firma', 'estado']),
+            models.Index(fields=['estado', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.get_estado_display()})"
@@ -0,0 +1,180 @@
+"""
+Permisos por rol compilados y cacheados
+
+El JSON `Rol.permisos` se compila una sola vez por (rol, versión) en un
+objeto inmutable que se comparte entre todos los requests del proceso.
+`Rol.version` aumenta en cada guardado, por lo que un cambio de permisos
+genera una clave nueva y los objetos anteriores dejan de usarse.
+
+Para no consultar la base de datos en cada request se cachean además el rol
+de cada usuario y la versión vigente de cada rol (ver PERMISOS_CACHE_TTL).
+"""
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Usuario
+
+
+# Módulos y acciones que maneja el sistema de permisos
+MODULOS = {
+    'usuarios': ('ver', 'crear', 'editar', 'eliminar', 'exportar'),
+    'proveedores': ('ver', 'crear', 'editar', 'eliminar', 'exportar'),
+    'productos': ('ver', 'crear', 'editar', 'eliminar'),
+    'compras': ('ver', 'crear', 'editar', 'eliminar'),
+    'inventario': ('ver', 'crear', 'editar', 'eliminar', 'exportar'),
+}
+
+# Permisos por defecto que reciben las vistas cuando el rol no define el módulo
+PERMISOS_VISTA_DEFECTO = MappingProxyType({
+    'ver': True, 'crear': True, 'editar': True, 'eliminar': True, 'exportar': True,
+})
+
+
+class PermisosCompilados(Mapping):
+    """
+    Permisos inmutables de un rol.
+
+    Como Mapping expone los permisos por módulo para los templates
+    (`permisos_modulos.usuarios.ver`). `puede()` y `de_modulo()` conservan la
+    semántica de las vistas: lo que el rol no define está permitido.
+    """
+
+    def __init__(self, permisos_rol=None, superusuario=False):
+        rol = permisos_rol if isinstance(permisos_rol, dict) and permisos_rol else {}
+        self._rol = MappingProxyType({
+            modulo: MappingProxyType(dict(permisos))
+            for modulo, permisos in rol.items()
+            if isinstance(permisos, dict)
+        })
+
+        modulos = {}
+        for modulo, acciones in MODULOS.items():
+            permisos = dict.fromkeys(acciones, superusuario)
+            if not superusuario and modulo in self._rol:
+                permisos.update(self._rol[modulo])
+            modulos[modulo] = MappingProxyType(permisos)
+        self._modulos = MappingProxyType(modulos)
+
+    def __getitem__(self, modulo):
+        return self._modulos[modulo]
+
+    def __iter__(self):
+        return iter(self._modulos)
+
+    def __len__(self):
+        return len(self._modulos)
+
+    def puede(self, modulo, accion):
+        """Indica si el rol permite la acción (True si no está definida)"""
+        return self._rol.get(modulo, {}).get(accion, True)
+
+    def de_modulo(self, modulo):
+        """Permisos del módulo para una vista: los del rol o, si no hay, todos"""
+        return self._rol.get(modulo) or PERMISOS_VISTA_DEFECTO
+
+
+SIN_SESION = PermisosCompilados()
+SIN_PERFIL = PermisosCompilados()
+SIN_PERFIL_SUPERUSUARIO = PermisosCompilados(superusuario=True)
+
+# (rol_id, versión, superusuario) -> PermisosCompilados, compartido por el proceso
+_compilados = {}
+_lock = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, 'PERMISOS_CACHE_TTL', 60)
+
+
+def _clave_usuario(user_id):
+    return f'permisos:usuario:{user_id}'
+
+
+def _clave_version(rol_id):
+    return f'permisos:rol:{rol_id}:version'
+
+
+def compilar(rol_id, version, permisos, superusuario=False):
+    """Retorna los permisos compilados de un rol, compilándolos una sola vez"""
+    clave = (rol_id, version, superusuario)
+    compilados = _compilados.get(clave)
+    if compilados is None:
+        compilados = PermisosCompilados(permisos, superusuario)
+        with _lock:
+            # Descartar versiones anteriores del mismo rol
+            for anterior in [k for k in _compilados if k[0] == rol_id and k[1] != version]:
+                del _compilados[anterior]
+            _compilados[clave] = compilados
+    return compilados
+
+
+def _permisos_desde_bd(user):
+    fila = (
+        Usuario.objects.filter(user_id=user.pk)
+        .values_list('rol_id', 'rol__version', 'rol__permisos')
+        .first()
+    )
+    if fila is None:
+        cache.set(_clave_usuario(user.pk), 0, _ttl())
+        return None
+    rol_id, version, permisos = fila
+    cache.set_many({_clave_usuario(user.pk): rol_id, _clave_version(rol_id): version}, _ttl())
+    return compilar(rol_id, version, permisos, user.is_superuser)
+
+
+def obtener_permisos(user):
+    """
+    Permisos compilados del usuario, memorizados en el propio objeto `user`.
+
+    En el caso habitual (rol y versión en caché, rol ya compilado) no se hace
+    ninguna consulta a la base de datos.
+    """
+    if not user.is_authenticated:
+        return SIN_SESION
+
+    permisos = getattr(user, '_permisos_compilados', None)
+    if permisos is not None:
+        return permisos
+
+    # Perfil y rol ya cargados por el backend de autenticación (select_related)
+    cargados = user._state.fields_cache
+    if 'usuario_profile' in cargados:
+        perfil = cargados['usuario_profile']
+        if perfil is None:
+            permisos = SIN_PERFIL_SUPERUSUARIO if user.is_superuser else SIN_PERFIL
+        else:
+            rol = perfil.rol
+            permisos = compilar(rol.pk, rol.version, rol.permisos, user.is_superuser)
+        user._permisos_compilados = permisos
+        return permisos
+
+    # rol_id cacheado: None = desconocido, 0 = usuario sin perfil
+    rol_id = cache.get(_clave_usuario(user.pk))
+    permisos = None
+    if rol_id:
+        version = cache.get(_clave_version(rol_id))
+        permisos = _compilados.get((rol_id, version, user.is_superuser))
+    if permisos is None and rol_id != 0:
+        permisos = _permisos_desde_bd(user)
+
+    if permisos is None:
+        permisos = SIN_PERFIL_SUPERUSUARIO if user.is_superuser else SIN_PERFIL
+
+    user._permisos_compilados = permisos
+    return permisos
+
+
+# --- Invalidación (conectada en signals.py) ---------------------------------
+
+def rol_guardado(sender, instance, **kwargs):
+    """Publica la nueva versión del rol para que todos los procesos la usen"""
+    cache.set(_clave_version(instance.pk), instance.version, _ttl())
+
+
+def perfil_modificado(sender, instance, **kwargs):
+    """El usuario pudo cambiar de rol: olvidar el rol cacheado"""
+    cache.delete(_clave_usuario(instance.user_id))
@@ -0,0 +1,115 @@
+"""
+Políticas de retención de datos
+
+Cada política define qué filas de una tabla se pueden purgar a partir de
+una fecha de corte (ahora - días de retención). La limpieza recorre la
+tabla en rangos acotados de clave primaria y borra cada rango en una
+transacción corta, de modo que nunca mantiene bloqueos por mucho tiempo.
+"""
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from inventario.models import AlertaStock
+from .contadores import eliminar_masivo
+from .models import PasswordResetToken, Sesion, TrabajoExportacion
+
+
+@dataclass(frozen=True)
+class Politica:
+    nombre: str
+    modelo: type
+    filtro: Callable  # corte (datetime) -> Q con las filas purgables
+    dias: int         # retención por defecto (RETENCION_DIAS la sobrescribe)
+
+
+POLITICAS = [
+    Politica('sesiones', Sesion,
+             lambda corte: Q(expira_en__lt=corte), 30),
+    Politica('tokens_reseteo', PasswordResetToken,
+             lambda corte: Q(expira_en__lt=corte) | Q(usado=True, created_at__lt=corte), 7),
+    Politica('django_session', Session,
+             lambda corte: Q(expire_date__lt=corte), 0),
+    Politica('alertas_cerradas', AlertaStock,
+             lambda corte: Q(estado__in=['RESUELTA', 'IGNORADA'], fecha_resolucion__lt=corte), 180),
+    Politica('exportaciones', TrabajoExportacion,
+             lambda corte: Q(estado__in=['EXPIRADO', 'FALLIDO'], created_at__lt=corte), 30),
+]
+
+
+def dias_retencion(politica):
+    return getattr(settings, 'RETENCION_DIAS', {}).get(politica.nombre, politica.dias)
+
+
+@dataclass
+class ResultadoPurga:
+    politica: str
+    eliminadas: int = 0
+    lotes: int = 0
+    segundos: float = 0.0
+
+    @property
+    def filas_por_segundo(self):
+        return self.eliminadas / self.segundos if self.segundos else 0.0
+
+
+def _rangos_pk(modelo, tamano):
+    """Rangos [desde, hasta) que cubren la clave primaria entera del modelo"""
+    limites = modelo._base_manager.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+    if limites['minimo'] is None:
+        return
+    desde = limites['minimo']
+    while desde <= limites['maximo']:
+        yield desde, desde + tamano
+        desde += tamano
+
+
+def _lotes_por_clave(queryset, tamano):
+    """Para claves no enteras (django_session): lotes de claves purgables"""
+    while True:
+        claves = list(queryset.values_list('pk', flat=True)[:tamano])
+        if not claves:
+            return
+        yield queryset.filter(pk__in=claves)
+
+
+def purgar(politica, tamano_lote=1000, pausa=0.0, dry_run=False):
+    """
+    Purga las filas vencidas de una política y retorna un ResultadoPurga.
+
+    Con `pausa` se espera entre lotes para dejar pasar la carga normal de la
+    base de datos cuando se ejecuta en horario de operación.
+    """
+    corte = timezone.now() - timedelta(days=dias_retencion(politica))
+    purgables = politica.modelo._base_manager.filter(politica.filtro(corte))
+    resultado = ResultadoPurga(politica.nombre)
+
+    if dry_run:
+        resultado.eliminadas = purgables.count()
+        return resultado
+
+    if politica.modelo._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        lotes = (
+            purgables.filter(pk__gte=desde, pk__lt=hasta)
+            for desde, hasta in _rangos_pk(politica.modelo, tamano_lote)
+        )
+    else:
+        lotes = _lotes_por_clave(purgables, tamano_lote)
+
+    inicio = time.monotonic()
+    for lote in lotes:
+        with transaction.atomic():
+            eliminadas = eliminar_masivo(lote)
+        resultado.eliminadas += eliminadas
+        resultado.lotes += 1
+        if pausa and eliminadas:
+            time.sleep(pausa)
+    resultado.segundos = time.monotonic() - inicio
+    return resultado
@@ -0,0 +1,37 @@
+"""
+Señales del proyecto que mantienen cachés y datos derivados al día
+"""
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+
+from . import actividad, backends, contadores, permisos
+from .models import Rol, Usuario
+
+
+# Contadores desnormalizados (también invalidan los KPIs del dashboard)
+for label, _campos in contadores.REGISTRO.values():
+    modelo = apps.get_model(label)
+    uid = f'contadores_{label}'
+    pre_save.connect(contadores.preparar_guardado, sender=modelo, dispatch_uid=uid)
+    post_save.connect(contadores.actualizar_por_guardado, sender=modelo, dispatch_uid=uid)
+    pre_delete.connect(contadores.preparar_eliminacion, sender=modelo, dispatch_uid=uid)
+    post_delete.connect(contadores.actualizar_por_eliminacion, sender=modelo, dispatch_uid=uid)
+
+
+# Permisos compilados por rol
+post_save.connect(permisos.rol_guardado, sender=Rol, dispatch_uid='permisos_rol')
+post_save.connect(permisos.perfil_modificado, sender=Usuario, dispatch_uid='permisos_usuario')
+post_delete.connect(permisos.perfil_modificado, sender=Usuario, dispatch_uid='permisos_usuario')
+
+# Usuario cacheado por el backend de autenticación
+post_save.connect(backends.user_modificado, sender=User, dispatch_uid='auth_user')
+post_delete.connect(backends.user_modificado, sender=User, dispatch_uid='auth_user')
+post_save.connect(backends.perfil_modificado, sender=Usuario, dispatch_uid='auth_perfil')
+post_delete.connect(backends.perfil_modificado, sender=Usuario, dispatch_uid='auth_perfil')
+post_save.connect(backends.rol_modificado, sender=Rol, dispatch_uid='auth_rol')
+
+# Sesiones y último acceso
+user_logged_in.connect(actividad.iniciar_sesion, dispatch_uid='actividad_login')
+user_logged_out.connect(actividad.cerrar_sesion, dispatch_uid='actividad_logout')
@@ -1,3 +1,558 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from maestros.models import Proveedor
+from . import actividad, contadores, correo, kpis, permisos, retencion, trabajos
+from .actividad import registro_actividad
+from .backends import PerfilRolBackend
+from .models import CorreoSaliente, Rol, Sesion, TrabajoExportacion, Usuario
+
+
+class PerfilRolBackendTests(TestCase):
+    """El usuario autenticado llega con su perfil y rol en una sola consulta"""
+
+    def setUp(self):
+        cache.clear()
+        self.rol = Rol.objects.create(nombre='VENDEDOR', permisos={'proveedores': {'ver': True}})
+        self.user = User.objects.create_user('vendedor', 'vendedor@lilis.cl', 'clave-segura-123')
+        Usuario.objects.create(user=self.user, rol=self.rol)
+        cache.clear()
+
+    def test_get_user_carga_perfil_y_rol_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            user = PerfilRolBackend().get_user(self.user.pk)
+            self.assertEqual(user.usuario_profile.rol.nombre, 'VENDEDOR')
+
+    def test_get_user_usa_cache_en_requests_siguientes(self):
+        PerfilRolBackend().get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            user = PerfilRolBackend().get_user(self.user.pk)
+            self.assertEqual(user.usuario_profile.rol.nombre, 'VENDEDOR')
+
+    def test_cambio_de_rol_invalida_el_usuario_cacheado(self):
+        PerfilRolBackend().get_user(self.user.pk)
+        self.rol.descripcion = 'Ventas en sala'
+        self.rol.save()
+        with self.assertNumQueries(1):
+            user = PerfilRolBackend().get_user(self.user.pk)
+        self.assertEqual(user.usuario_profile.rol.descripcion, 'Ventas en sala')
+
+    def test_request_autenticado_no_consulta_perfil_ni_rol(self):
+        self.client.force_login(self.user)
+        request = RequestFactory().get('/dashboard/')
+        request.session = self.client.session
+        # Una consulta para la sesión y otra para User + Usuario + Rol
+        with self.assertNumQueries(2):
+            user = get_user(request)
+            self.assertEqual(user.usuario_profile.rol.nombre, 'VENDEDOR')
+
+
+class TransporteDePrueba(correo.Transporte):
+    """Guarda los correos enviados; `al_enviar` simula lo que pasa durante el envío"""
+
+    def __init__(self, al_enviar=None):
+        self.enviados = []
+        self.al_enviar = al_enviar
+
+    def enviar(self, saliente):
+        if self.al_enviar:
+            self.al_enviar(saliente)
+        self.enviados.append(saliente.pk)
+
+
+@override_settings(CORREO_MAX_INTENTOS=2)
+class BandejaSalidaTests(TestCase):
+    """El worker envía cada correo encolado una sola vez y reintenta los que fallan"""
+
+    def _encolar(self, destinatario='cliente@lilis.cl'):
+        return correo.encolar_correo(destinatario, 'Recuperación', 'emails/password_reset.html', {
+            'company_name': 'Lilis', 'user_name': 'cliente', 'reset_link': 'https://lilis.cl/reset/',
+        })
+
+    def test_encola_y_envia(self):
+        encolado = self._encolar()
+        self.assertIn('https://lilis.cl/reset/', encolado.html)
+        transporte = TransporteDePrueba()
+
+        self.assertEqual(correo.procesar_cola(transporte), (1, 0))
+        self.assertEqual(transporte.enviados, [encolado.pk])
+        encolado.refresh_from_db()
+        self.assertEqual((encolado.estado, encolado.intentos), ('ENVIADO', 1))
+        self.assertEqual(correo.procesar_cola(transporte), (0, 0))
+
+    def test_reintenta_con_espera_y_luego_falla(self):
+        encolado = self._encolar()
+
+        def caido(saliente):
+            raise ConnectionError('proveedor caído')
+
+        self.assertEqual(correo.procesar_cola(TransporteDePrueba(caido)), (0, 1))
+        encolado.refresh_from_db()
+        self.assertEqual((encolado.estado, encolado.intentos, encolado.ultimo_error),
+                         ('PENDIENTE', 1, 'proveedor caído'))
+        self.assertGreater(encolado.proximo_intento, timezone.now())
+        self.assertEqual(correo.procesar_cola(TransporteDePrueba(caido)), (0, 0))   # aún en espera
+
+        CorreoSaliente.objects.update(proximo_intento=timezone.now())
+        correo.procesar_cola(TransporteDePrueba(caido))
+        self.assertEqual(CorreoSaliente.objects.get().estado, 'FALLIDO')
+
+    def test_reserva_vencida_se_vuelve_a_tomar(self):
+        encolado = self._encolar()
+        CorreoSaliente.objects.update(estado='ENVIANDO', proximo_intento=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(correo.procesar_cola(TransporteDePrueba()), (1, 0))
+        self.assertEqual(CorreoSaliente.objects.get(pk=encolado.pk).estado, 'ENVIADO')
+
+    def test_reserva_del_lote_cubre_los_envios(self):
+        self._encolar()
+        reservados = correo._reservar_lote(50)
+        self.assertGreaterEqual(
+            reservados[0].proximo_intento - timezone.now(),
+            correo.RESERVA_ENVIO + timedelta(seconds=correo.TIMEOUT_ENVIO * 49),
+        )
+
+    def test_no_envia_lo_que_otro_worker_tomo(self):
+        primero, segundo = self._encolar('uno@lilis.cl'), self._encolar('dos@lilis.cl')
+        otra_marca = timezone.now() + timedelta(hours=1)
+
+        def otro_worker_toma_el_segundo(saliente):
+            # La reserva del segundo venció mientras se enviaba el primero y otro worker la tomó
+            CorreoSaliente.objects.filter(pk=segundo.pk).update(proximo_intento=otra_marca)
+
+        transporte = TransporteDePrueba(otro_worker_toma_el_segundo)
+        self.assertEqual(correo.procesar_cola(transporte), (1, 0))
+        self.assertEqual(transporte.enviados, [primero.pk])
+        segundo.refresh_from_db()
+        self.assertEqual((segundo.estado, segundo.proximo_intento), ('ENVIANDO', otra_marca))
+
+    def test_resultado_solo_si_sigue_siendo_propio(self):
+        encolado = self._encolar()
+        otra_marca = timezone.now() + timedelta(hours=1)
+
+        def otro_worker_lo_toma(saliente):
+            CorreoSaliente.objects.filter(pk=encolado.pk).update(proximo_intento=otra_marca)
+            raise ConnectionError('timeout')
+
+        correo.procesar_cola(TransporteDePrueba(otro_worker_lo_toma))
+        encolado.refresh_from_db()
+        # El fallo de este worker no pisa la reserva del otro
+        self.assertEqual((encolado.estado, encolado.intentos, encolado.proximo_intento), ('ENVIANDO', 0, otra_marca))
+
+
+class PermisosCompiladosTests(TestCase):
+    """Los permisos se compilan una vez por versión del rol y se invalidan al guardarlo"""
+
+    def setUp(self):
+        cache.clear()
+        self.rol = Rol.objects.create(nombre='BODEGUERO', permisos={'usuarios': {'ver': False}})
+        self.user = User.objects.create_user('bodega')
+        Usuario.objects.create(user=self.user, rol=self.rol)
+
+    def _permisos(self):
+        # Un objeto User nuevo por request, como lo entrega el middleware
+        return permisos.obtener_permisos(User.objects.get(pk=self.user.pk))
+
+    def test_compila_una_vez_por_version(self):
+        primero = self._permisos()
+        self.assertFalse(primero.puede('usuarios', 'ver'))
+        self.assertTrue(primero.puede('proveedores', 'ver'))   # lo no definido está permitido
+        self.assertEqual(dict(primero['usuarios'])['ver'], False)
+        self.assertEqual(dict(primero['compras']), dict.fromkeys(permisos.MODULOS['compras'], False))
+
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertIs(permisos.obtener_permisos(user), primero)
+
+    def test_guardar_el_rol_invalida_los_compilados(self):
+        anterior = self._permisos()
+        self.rol.permisos = {'usuarios': {'ver': True}}
+        self.rol.save()
+        self.assertEqual(self.rol.version, 2)
+
+        nuevos = self._permisos()
+        self.assertIsNot(nuevos, anterior)
+        self.assertTrue(nuevos.puede('usuarios', 'ver'))
+        self.assertNotIn((self.rol.pk, 1, False), permisos._compilados)
+
+    def test_guardados_simultaneos_no_repiten_version(self):
+        uno, otro = Rol.objects.get(pk=self.rol.pk), Rol.objects.get(pk=self.rol.pk)
+        uno.descripcion = 'Bodega central'
+        uno.save()
+        otro.permisos = {'usuarios': {'ver': True}}
+        otro.save()   # leyó la versión 1 antes del primer guardado
+
+        self.assertEqual((uno.version, otro.version), (2, 3))
+        self.rol.refresh_from_db()
+        self.assertEqual((self.rol.version, self.rol.permisos), (3, {'usuarios': {'ver': True}}))
+        self.assertEqual(cache.get(permisos._clave_version(self.rol.pk)), 3)
+
+
+class ContadoresTests(TestCase):
+    """Los contadores siguen a las señales, a las operaciones masivas y a las eliminaciones"""
+
+    def _proveedor(self, rut, **campos):
+        return Proveedor.objects.create(rut_nif=rut, razon_social=f'Proveedor {rut}', email='p@lilis.cl',
+                                        condiciones_pago='CONTADO', **campos)
+
+    def _leer(self, *claves):
+        return list(contadores.leer_contadores(claves).values())
+
+    def _coinciden(self):
+        esperados = {k: v for k, v in contadores.calcular_contadores().items() if k.startswith('proveedores.')}
+        actuales = contadores.leer_contadores(list(esperados))
+        self.assertEqual(actuales, esperados)
+
+    def test_guardar_y_eliminar(self):
+        uno = self._proveedor('1-9')
+        self._proveedor('2-7', estado='BLOQUEADO')
+        self.assertEqual(self._leer('proveedores.total', 'proveedores.estado.ACTIVO',
+                                    'proveedores.estado.BLOQUEADO'), [2, 1, 1])
+
+        uno = Proveedor.objects.get(pk=uno.pk)
+        uno.estado = 'BLOQUEADO'
+        uno.save()
+        self.assertEqual(self._leer('proveedores.estado.ACTIVO', 'proveedores.estado.BLOQUEADO'), [0, 2])
+
+        Proveedor.objects.only('pk').get(pk=uno.pk).delete()   # campos contados diferidos
+        self.assertEqual(self._leer('proveedores.total', 'proveedores.estado.BLOQUEADO'), [1, 1])
+        self._coinciden()
+
+    def test_cargar_instancias_no_consulta_los_contadores(self):
+        for i in range(3):
+            self._proveedor(f'{i}-K')
+        with self.assertNumQueries(1):
+            list(Proveedor.objects.all())
+
+    def test_guardado_usa_la_fila_actual(self):
+        proveedor = self._proveedor('1-9')
+        copia = Proveedor.objects.get(pk=proveedor.pk)
+        Proveedor.objects.filter(pk=proveedor.pk).update(condiciones_pago='30_DIAS')   # sin señales
+        contadores.aplicar_deltas({'proveedores.condiciones_pago.CONTADO': -1,
+                                   'proveedores.condiciones_pago.30_DIAS': 1})
+        copia.condiciones_pago = '60_DIAS'
+        copia.save()
+        self._coinciden()
+
+    def test_operaciones_masivas(self):
+        for i in range(4):
+            self._proveedor(f'{i}-K')
+        actualizados = contadores.actualizar_masivo(Proveedor.objects.filter(rut_nif__in=['0-K', '1-K']),
+                                                    estado='BLOQUEADO', condiciones_pago='OTRO')
+        self.assertEqual(actualizados, 2)
+        self._coinciden()
+
+        self.assertEqual(contadores.eliminar_masivo(Proveedor.objects.filter(estado='BLOQUEADO')), 2)
+        self.assertEqual(self._leer('proveedores.total', 'proveedores.estado.BLOQUEADO',
+                                    'proveedores.condiciones_pago.OTRO'), [2, 0, 0])
+        self._coinciden()
+
+
+class KpisDashboardTests(TestCase):
+    """Los KPIs se sirven desde la caché y un solo proceso los recalcula al vencer"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            contadores.aplicar_deltas({'alertas.estado.ACTIVA': 3, 'ordenes.estado.ENVIADA': 2,
+                                       'ordenes.estado.BORRADOR': 1, 'ordenes.estado.RECIBIDA': 5})
+
+    def test_lee_los_contadores_y_los_guarda_en_cache(self):
+        with self.assertNumQueries(1):
+            primero = kpis.obtener_kpis_dashboard()
+        self.assertEqual((primero['alertas_count'], primero['ordenes_count'], primero['notification_count']),
+                         (3, 3, 3))
+        with self.assertNumQueries(0):
+            self.assertEqual(kpis.obtener_kpis_dashboard(), primero)
+        self.assertIsNone(cache.get(kpis.LOCK_KEY))
+
+    def test_cambio_en_contadores_invalida(self):
+        kpis.obtener_kpis_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            contadores.aplicar_deltas({'alertas.estado.ACTIVA': 1})
+        self.assertEqual(cache.get(kpis.CACHE_KEY)['vence'], 0)   # vencida, no borrada
+        self.assertEqual(kpis.obtener_kpis_dashboard()['alertas_count'], 4)
+
+    def test_con_el_candado_tomado_sirve_el_valor_anterior(self):
+        kpis.obtener_kpis_dashboard()
+        contadores.aplicar_deltas({'alertas.estado.ACTIVA': 1})
+        kpis.invalidar_kpis_dashboard()
+        cache.add(kpis.LOCK_KEY, 1)   # otro proceso está recalculando
+        with self.assertNumQueries(0):
+            self.assertEqual(kpis.obtener_kpis_dashboard()['alertas_count'], 3)
+
+        cache.delete(kpis.LOCK_KEY)
+        self.assertEqual(kpis.obtener_kpis_dashboard()['alertas_count'], 4)
+
+    def test_arranque_en_frio_espera_al_que_recalcula(self):
+        cache.add(kpis.LOCK_KEY, 1)
+
+        def otro_proceso(segundos):
+            cache.set(kpis.CACHE_KEY, {'kpis': {'alertas_count': 99}, 'vence': 0})
+
+        with mock.patch('autenticacion.kpis.time.sleep', side_effect=otro_proceso) as espera, \
+                self.assertNumQueries(0):
+            self.assertEqual(kpis.obtener_kpis_dashboard(), {'alertas_count': 99})
+        espera.assert_called_once()
+
+
+class RegistroActividadTests(TestCase):
+    """Los accesos se acumulan en memoria y se escriben con un UPDATE por tabla"""
+
+    def setUp(self):
+        rol = Rol.objects.create(nombre='VENDEDOR', permisos={})
+        self.perfiles = [Usuario.objects.create(user=User.objects.create_user(f'u{i}'), rol=rol) for i in range(3)]
+        antes = timezone.now() - timedelta(days=1)
+        for perfil in self.perfiles:
+            Sesion.objects.create(usuario=perfil, token_sesion=f's{perfil.pk}',
+                                  ultimo_actividad=antes, expira_en=antes + timedelta(days=7))
+        self.registro = actividad.RegistroActividad()
+
+    def test_un_update_por_tabla_con_el_ultimo_acceso(self):
+        inicio = timezone.now()
+        momentos = [inicio + timedelta(seconds=i) for i in range(4)]
+        uno, dos, _ = self.perfiles
+        with override_settings(ACTIVIDAD_FLUSH_INTERVALO=3600), self.assertNumQueries(0):
+            self.registro.registrar(uno.user_id, f's{uno.pk}', momentos[0])
+            self.registro.registrar(dos.user_id, f's{dos.pk}', momentos[1])
+            self.registro.registrar(uno.user_id, f's{uno.pk}', momentos[3])
+            self.registro.registrar(dos.user_id, None, momentos[2])
+
+        with self.assertNumQueries(2):
+            self.registro.flush()
+        self.assertEqual(dict(Usuario.objects.values_list('pk', 'ultimo_acceso')),
+                         {uno.pk: momentos[3], dos.pk: momentos[2], self.perfiles[2].pk: None})
+        self.assertEqual(Sesion.objects.get(token_sesion=f's{dos.pk}').ultimo_actividad, momentos[1])
+
+        with self.assertNumQueries(0):
+            self.registro.flush()   # nada pendiente
+
+    def test_lotes_y_flush_por_intervalo(self):
+        ahora = timezone.now()
+        with mock.patch.object(actividad, 'TAMANO_LOTE', 2), override_settings(ACTIVIDAD_FLUSH_INTERVALO=3600):
+            for perfil in self.perfiles:
+                self.registro.registrar(perfil.user_id, None, ahora)
+            with self.assertNumQueries(2):   # 3 usuarios en lotes de 2, sin sesiones
+                self.registro.flush()
+        self.assertFalse(Usuario.objects.filter(ultimo_acceso__isnull=True).exists())
+
+        with override_settings(ACTIVIDAD_FLUSH_INTERVALO=0), self.assertNumQueries(1):
+            self.registro.registrar(self.perfiles[0].user_id, None, ahora + timedelta(minutes=1))
+
+    def test_un_error_no_llega_al_request(self):
+        self.registro.registrar(self.perfiles[0].user_id, None, timezone.now())
+        with mock.patch.object(actividad, '_actualizar_por_lotes', side_effect=RuntimeError('sin conexión')), \
+                self.assertLogs('autenticacion.actividad', 'ERROR'):
+            self.registro.flush()
+
+
+class RetencionTests(TestCase):
+    """La purga borra solo lo vencido, por rangos de clave primaria acotados"""
+
+    def setUp(self):
+        perfil = Usuario.objects.create(user=User.objects.create_user('u'),
+                                        rol=Rol.objects.create(nombre='VENDEDOR', permisos={}))
+        ahora = timezone.now()
+        self.vigentes = []
+        for i, dias in enumerate([-40, 5, -31, -90, -1]):
+            sesion = Sesion.objects.create(usuario=perfil, token_sesion=f's{i}', ultimo_actividad=ahora,
+                                           expira_en=ahora + timedelta(days=dias))
+            if dias > -30:
+                self.vigentes.append(sesion.pk)
+        self.politica = next(p for p in retencion.POLITICAS if p.nombre == 'sesiones')
+
+    def test_purga_por_rangos_de_pk(self):
+        self.assertEqual(retencion.purgar(self.politica, dry_run=True).eliminadas, 3)
+        self.assertEqual(Sesion.objects.count(), 5)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = retencion.purgar(self.politica, tamano_lote=2)
+        self.assertEqual((resultado.eliminadas, resultado.lotes), (3, 3))
+        borrados = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(borrados), 3)   # un DELETE acotado por rango
+        self.assertTrue(all('"id" >= ' in sql and '"id" < ' in sql for sql in borrados))
+        self.assertEqual(sorted(Sesion.objects.values_list('pk', flat=True)), self.vigentes)
+
+        with override_settings(RETENCION_DIAS={'sesiones': 0}):
+            self.assertEqual(retencion.purgar(self.politica).eliminadas, 1)
+
+    def test_claves_no_enteras_y_comando(self):
+        ahora = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f'clave{i}', session_data='',
+                                   expire_date=ahora + timedelta(hours=1 if i == 0 else -1))
+
+        salida = StringIO()
+        call_command('purgar_retencion', politica=['django_session'], lote=3, pausa=0, stdout=salida)
+        self.assertIn('django_session: 4 filas eliminadas en 2 lotes', salida.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['clave0'])
+
+
+class UsuariosListTests(TestCase):
+    """El listado de usuarios pagina por cursor sobre el orden elegido"""
+
+    def setUp(self):
+        rol = Rol.objects.create(nombre='ADMIN', permisos={'usuarios': {'ver': True}})
+        for i in range(12):
+            Usuario.objects.create(user=User.objects.create_user(f'user{i:02d}'), rol=rol)
+        self.client.force_login(User.objects.get(username='user00'))
+        self.addCleanup(registro_actividad.flush)
+
+    def _nombres(self, pagina):
+        return [perfil.user.username for perfil in pagina]
+
+    def test_pagina_por_username(self):
+        params = {'sort': 'username', 'order': 'asc', 'per_page': '7'}   # 7 no es un tamaño permitido
+        primera = self.client.get('/usuarios/', params).context['page_obj']
+        self.assertEqual(self._nombres(primera), [f'user{i:02d}' for i in range(10)])
+        self.assertEqual(primera.total, 12)
+
+        segunda = self.client.get('/usuarios/', {**params, 'cursor': primera.cursor_siguiente}).context['page_obj']
+        self.assertEqual(self._nombres(segunda), ['user10', 'user11'])
+        self.assertFalse(segunda.has_next)
+
+        anterior = self.client.get('/usuarios/', {**params, 'cursor': segunda.cursor_anterior}).context['page_obj']
+        self.assertEqual(self._nombres(anterior), self._nombres(primera))
+
+        # El cursor de un orden no sirve para otro: se muestra la primera página
+        otro_orden = self.client.get('/usuarios/', {'sort': 'email', 'cursor': primera.cursor_siguiente})
+        self.assertFalse(otro_orden.context['page_obj'].has_previous)
+
+
+class ExportacionEnSegundoPlanoTests(TestCase):
+    """Una exportación se encola, la genera el worker, se descarga y expira"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        parche = override_settings(MEDIA_ROOT=self.media, EXPORTACION_ASINCRONA=True)
+        parche.enable()
+        self.addCleanup(parche.disable)
+
+        rol = Rol.objects.create(nombre='ADMIN', permisos={'usuarios': {'ver': True, 'exportar': True}})
+        self.user = User.objects.create_user('admin', first_name='Ana')
+        Usuario.objects.create(user=self.user, rol=rol)
+        Usuario.objects.create(user=User.objects.create_user('bodega', first_name='Beto'), rol=rol)
+        self.client.force_login(self.user)
+        self.addCleanup(registro_actividad.flush)
+
+    def _encolar(self, **params):
+        respuesta = self.client.get('/usuarios/exportar-excel/', params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_ciclo_de_vida(self):
+        datos = self._encolar(sort='username', order='asc', page='3')
+        self.assertEqual((datos['estado'], datos['descarga_url']), ('PENDIENTE', None))
+        # La misma solicitud en curso reutiliza el trabajo (la paginación no cuenta)
+        self.assertEqual(self._encolar(sort='username', order='asc')['trabajo_id'], datos['trabajo_id'])
+        self.assertNotEqual(self._encolar(sort='email')['trabajo_id'], datos['trabajo_id'])
+        self.assertEqual(self.client.get(f'/exportaciones/{datos["trabajo_id"]}/descargar/').status_code, 404)
+
+        salida = StringIO()
+        call_command('procesar_exportaciones', stdout=salida)
+        self.assertIn('2 exportaciones generadas, 0 con error', salida.getvalue())
+
+        estado = self.client.get(datos['estado_url']).json()
+        self.assertEqual((estado['estado'], estado['filas_procesadas'], estado['filas_totales']),
+                         ('COMPLETADO', 2, 2))
+        descarga = self.client.get(estado['descarga_url'])
+        self.assertEqual(descarga.status_code, 200)
+        self.assertIn('usuarios_', descarga['Content-Disposition'])
+        ws = load_workbook(BytesIO(b''.join(descarga.streaming_content))).active
+        self.assertEqual([fila[0] for fila in ws.iter_rows(min_row=2, values_only=True)], ['admin', 'bodega'])
+
+        # Terminado, una nueva solicitud idéntica genera otro archivo
+        self.assertNotEqual(self._encolar(sort='username', order='asc')['trabajo_id'], datos['trabajo_id'])
+
+        trabajo = TrabajoExportacion.objects.get(pk=datos['trabajo_id'])
+        trabajo.expira_en = timezone.now() - timedelta(seconds=1)
+        trabajo.save(update_fields=['expira_en'])
+        self.assertTrue(trabajo.archivo.storage.exists(trabajo.archivo.name))
+        self.assertEqual(trabajos.expirar_archivos(), 1)
+        self.assertFalse(trabajo.archivo.storage.exists(trabajo.archivo.name))
+        self.assertEqual(self.client.get(estado['descarga_url']).status_code, 404)
+
+    def test_fallo_y_reserva_vencida(self):
+        fallido = trabajos.encolar_exportacion('usuarios', {}, self.user)
+        with mock.patch('autenticacion.trabajos.obtener_hoja', side_effect=RuntimeError('sin disco')):
+            self.assertEqual(trabajos.procesar_cola(), (0, 1))
+        fallido.refresh_from_db()
+        self.assertEqual((fallido.estado, fallido.error), ('FALLIDO', 'sin disco'))
+
+        # Un worker que cayó a mitad de trabajo: otro lo retoma al vencer la reserva
+        abandonado = trabajos.encolar_exportacion('usuarios', {'estado': 'ACTIVO'}, self.user)
+        TrabajoExportacion.objects.filter(pk=abandonado.pk).update(
+            estado='PROCESANDO', reservado_hasta=timezone.now() + timedelta(minutes=5), filas_procesadas=1)
+        self.assertEqual(trabajos.procesar_cola(), (0, 0))
+        TrabajoExportacion.objects.filter(pk=abandonado.pk).update(reservado_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(trabajos.procesar_cola(), (1, 0))
+        abandonado.refresh_from_db()
+        self.assertEqual((abandonado.estado, abandonado.filas_procesadas), ('COMPLETADO', 2))
+
+    def test_worker_retomado_no_pisa_el_resultado(self):
+        trabajos.encolar_exportacion('usuarios', {}, self.user)
+        primero = trabajos._reservar_trabajo()
+        otra_marca = timezone.now() + timedelta(minutes=30)
+        escribir_xlsx = trabajos.escribir_xlsx
+
+        def escribir_y_perder_la_reserva(*args, **kwargs):
+            filas = escribir_xlsx(*args, **kwargs)
+            # Mientras tanto la reserva venció y otro worker retomó el trabajo
+            TrabajoExportacion.objects.filter(pk=primero.pk).update(reservado_hasta=otra_marca)
+            return filas
+
+        with mock.patch.object(trabajos, 'escribir_xlsx', side_effect=escribir_y_perder_la_reserva):
+            self.assertIsNone(trabajos.procesar_trabajo(primero))
+        retomado = TrabajoExportacion.objects.get(pk=primero.pk)
+        self.assertEqual((retomado.estado, retomado.reservado_hasta), ('PROCESANDO', otra_marca))
+        self.assertFalse(retomado.archivo)
+        # El archivo que alcanzó a guardar no queda huérfano en el storage
+        self.assertEqual([archivos for _, _, archivos in os.walk(self.media) if archivos], [])
+
+        # Un fallo tardío tampoco pisa al otro worker
+        with mock.patch.object(trabajos, 'obtener_hoja', side_effect=RuntimeError('sin disco')):
+            self.assertIsNone(trabajos.procesar_trabajo(primero))
+        self.assertEqual(TrabajoExportacion.objects.get(pk=primero.pk).estado, 'PROCESANDO')
+
+    def test_lock_ajeno(self):
+        lock = f'exportacion:{trabajos._firma("usuarios", {})}:lock'
+        cache.add(lock, 1)
+        self.addCleanup(cache.delete, lock)
+        with mock.patch.object(trabajos.time, 'sleep'):
+            with self.assertRaises(trabajos.ExportacionOcupada):
+                trabajos.encolar_exportacion('usuarios', {}, self.user)
+            self.assertEqual(self.client.get('/usuarios/exportar-excel/').status_code, 503)
+            self.assertFalse(TrabajoExportacion.objects.exists())
+
+            # Con un trabajo idéntico en curso se reutiliza sin tomar el lock
+            en_curso = TrabajoExportacion.objects.create(tipo='usuarios', firma=trabajos._firma('usuarios', {}))
+            self.assertEqual(trabajos.encolar_exportacion('usuarios', {}, self.user), en_curso)
+        self.assertEqual(cache.get(lock), 1)   # el lock ajeno sigue tomado
+
+    def test_sin_worker_y_sin_permiso(self):
+        with override_settings(EXPORTACION_ASINCRONA=False):
+            self.assertEqual(self._encolar()['estado'], 'COMPLETADO')
+
+        trabajo = TrabajoExportacion.objects.get()
+        rol = Rol.objects.get(nombre='ADMIN')
+        rol.permisos = {'usuarios': {'ver': True, 'exportar': False}}
+        rol.save()
+        self.assertEqual(self.client.get('/usuarios/exportar-excel/').status_code, 403)
+        self.assertEqual(self.client.get(f'/exportaciones/{trabajo.pk}/').status_code, 403)
+        self.assertEqual(self.client.get(f'/exportaciones/{trabajo.pk}/descargar/').status_code, 403)
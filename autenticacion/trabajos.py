@@ -0,0 +1,221 @@
+"""
+Exportaciones a Excel en segundo plano
+
+Los endpoints de exportación solo encolan un TrabajoExportacion con los
+filtros actuales y responden su id. El worker `manage.py
+procesar_exportaciones` genera el archivo en el storage por defecto,
+informando las filas procesadas, y la interfaz consulta el estado hasta
+poder descargarlo. Dos solicitudes idénticas mientras la primera sigue en
+curso comparten el mismo trabajo, y los archivos terminados se borran al
+cumplirse EXPORTACION_TTL.
+
+Un trabajo en proceso pertenece al worker que lo reservó: `reservado_hasta`
+hace de marca de propiedad, se renueva con cada avance y todas las
+escrituras del worker exigen PROCESANDO con esa misma marca. Si la reserva
+venció y otro worker lo retomó, el primero abandona el trabajo sin pisar el
+resultado del otro y borra el archivo que alcanzó a guardar.
+"""
+import hashlib
+import json
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from LiliProject.exportacion import escribir_xlsx, obtener_hoja
+from .models import TrabajoExportacion
+
+
+# Tiempo que un worker se reserva un trabajo; se renueva con cada avance
+RESERVA_TRABAJO = timedelta(minutes=10)
+
+EN_CURSO = ['PENDIENTE', 'PROCESANDO']
+
+
+def _firma(tipo, parametros):
+    return hashlib.sha256(json.dumps([tipo, parametros], sort_keys=True).encode()).hexdigest()
+
+
+class ExportacionOcupada(Exception):
+    """Otra solicitud idéntica está encolando la exportación; conviene reintentar"""
+
+
+def encolar_exportacion(tipo, parametros, usuario):
+    """
+    Encola la exportación o, si ya hay una idéntica en curso, la reutiliza.
+    Retorna el TrabajoExportacion.
+
+    Lanza ExportacionOcupada si otra solicitud idéntica retiene el lock y
+    todavía no dejó un trabajo en curso para reutilizar.
+    """
+    firma = _firma(tipo, parametros)
+    en_curso = TrabajoExportacion.objects.filter(firma=firma, estado__in=EN_CURSO)
+
+    # Lock corto para que dos solicitudes simultáneas no creen dos trabajos
+    lock = f'exportacion:{firma}:lock'
+    for _ in range(20):
+        if cache.add(lock, 1, 10):
+            break
+        time.sleep(0.05)
+    else:
+        # Sin el lock no se crea nada (ni se borra el lock ajeno)
+        trabajo = en_curso.first()
+        if trabajo is None:
+            raise ExportacionOcupada('La exportación se está encolando, intente nuevamente')
+        return trabajo
+
+    try:
+        trabajo = en_curso.first()
+        if trabajo is None:
+            trabajo = TrabajoExportacion.objects.create(
+                tipo=tipo, parametros=parametros, firma=firma, solicitado_por=usuario,
+            )
+    finally:
+        cache.delete(lock)
+
+    if not getattr(settings, 'EXPORTACION_ASINCRONA', True):
+        # Sin worker (desarrollo): se procesa dentro del mismo request
+        reserva = timezone.now() + RESERVA_TRABAJO
+        tomado = TrabajoExportacion.objects.filter(pk=trabajo.pk, estado='PENDIENTE').update(
+            estado='PROCESANDO', reservado_hasta=reserva,
+        )
+        if tomado:
+            trabajo.estado, trabajo.reservado_hasta = 'PROCESANDO', reserva
+            procesar_trabajo(trabajo)
+        trabajo.refresh_from_db()
+    return trabajo
+
+
+# --- Worker -----------------------------------------------------------------
+
+def _reservar_trabajo():
+    """Toma el trabajo pendiente más antiguo (o uno abandonado por un worker caído)"""
+    ahora = timezone.now()
+    with transaction.atomic():
+        trabajo = (
+            TrabajoExportacion.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(estado='PENDIENTE') | Q(estado='PROCESANDO', reservado_hasta__lt=ahora))
+            .order_by('created_at')
+            .first()
+        )
+        if trabajo is not None:
+            trabajo.estado = 'PROCESANDO'
+            trabajo.reservado_hasta = ahora + RESERVA_TRABAJO
+            trabajo.filas_procesadas = 0
+            trabajo.save(update_fields=['estado', 'reservado_hasta', 'filas_procesadas'])
+    return trabajo
+
+
+class _TrabajoRetomado(Exception):
+    """Otro worker retomó el trabajo (venció la reserva de este)"""
+
+
+def _propio(trabajo):
+    """El trabajo, solo si sigue reservado por este worker (PROCESANDO con su marca)"""
+    return TrabajoExportacion.objects.filter(
+        pk=trabajo.pk, estado='PROCESANDO', reservado_hasta=trabajo.reservado_hasta,
+    )
+
+
+def _renovar(trabajo, **campos):
+    """Guarda `campos` y extiende la reserva; _TrabajoRetomado si otro worker ya lo tomó"""
+    hasta = timezone.now() + RESERVA_TRABAJO
+    if not _propio(trabajo).update(reservado_hasta=hasta, **campos):
+        raise _TrabajoRetomado
+    trabajo.reservado_hasta = hasta
+
+
+def procesar_trabajo(trabajo):
+    """
+    Genera el archivo del trabajo (reservado por este worker) y lo guarda en
+    el storage por defecto. Retorna True si lo completó, False si falló y
+    None si otro worker lo retomó entretanto.
+    """
+    try:
+        hoja = obtener_hoja(trabajo.tipo, trabajo.parametros)
+        _renovar(trabajo, filas_totales=hoja.queryset.count())
+
+        def progreso(filas):
+            _renovar(trabajo, filas_procesadas=filas)
+
+        with tempfile.TemporaryFile() as archivo:
+            filas = escribir_xlsx(archivo, hoja, progreso=progreso)
+            archivo.seek(0)
+            # Nombre aleatorio en el storage; la descarga usa nombre_archivo
+            trabajo.archivo.save(f'{uuid.uuid4().hex}.xlsx', File(archivo), save=False)
+    except _TrabajoRetomado:
+        return None
+    except Exception as error:
+        fallido = _propio(trabajo).update(estado='FALLIDO', error=str(error)[:2000], terminado_en=timezone.now())
+        return False if fallido else None
+
+    terminado = timezone.now()
+    completado = _propio(trabajo).update(
+        estado='COMPLETADO',
+        archivo=trabajo.archivo.name,
+        nombre_archivo=f'{trabajo.tipo}_{timezone.localtime(terminado):%Y%m%d_%H%M%S}.xlsx',
+        filas_procesadas=filas,
+        terminado_en=terminado,
+        expira_en=terminado + timedelta(seconds=getattr(settings, 'EXPORTACION_TTL', 3600)),
+    )
+    if not completado:
+        # El resultado es del worker que lo retomó: este archivo no lo referencia nadie
+        trabajo.archivo.delete(save=False)
+        return None
+    return True
+
+
+def procesar_cola(maximo=None):
+    """
+    Procesa trabajos pendientes (hasta `maximo`). Retorna (completados,
+    fallidos); los que otro worker retomó no cuentan en ninguno.
+    """
+    completados = fallidos = procesados = 0
+    while maximo is None or procesados < maximo:
+        trabajo = _reservar_trabajo()
+        if trabajo is None:
+            break
+        procesados += 1
+        resultado = procesar_trabajo(trabajo)
+        if resultado:
+            completados += 1
+        elif resultado is False:
+            fallidos += 1
+    return completados, fallidos
+
+
+def expirar_archivos():
+    """Borra los archivos de las exportaciones vencidas. Retorna cuántas expiraron"""
+    vencidos = TrabajoExportacion.objects.filter(estado='COMPLETADO', expira_en__lt=timezone.now())
+    expirados = 0
+    for trabajo in vencidos.iterator():
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        expirados += TrabajoExportacion.objects.filter(pk=trabajo.pk, estado='COMPLETADO').update(
+            estado='EXPIRADO', archivo=None,
+        )
+    return expirados
+
+
+def estado_trabajo(trabajo):
+    """Datos del trabajo para la interfaz (JSON)"""
+    return {
+        'trabajo_id': trabajo.pk,
+        'estado': trabajo.estado,
+        'filas_procesadas': trabajo.filas_procesadas,
+        'filas_totales': trabajo.filas_totales,
+        'estado_url': reverse('exportacion_estado', args=[trabajo.pk]),
+        'descarga_url': (
+            reverse('exportacion_descargar', args=[trabajo.pk]) if trabajo.estado == 'COMPLETADO' else None
+        ),
+        'error': trabajo.error,
+    }
@@ -3,16 +3,16 @@ from django.contrib.auth import authenticate, login as auth_login, logout as aut
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
-from maestros.models import Producto
-from inventario.models import AlertaStock, Bodega
-from compras.models import OrdenCompra
-from .models import Usuario, Rol
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from datetime import datetime
+from django.http import FileResponse, JsonResponse
+from LiliProject.exportacion import CONTENT_TYPE_XLSX, parametros_de
+from LiliProject.paginacion import PaginadorCursor, tamano_pagina, total_listado
+from .models import Usuario, Rol, TrabajoExportacion
+from .kpis import obtener_kpis_dashboard
+from .contadores import leer_contadores, clave
+from .permisos import obtener_permisos
+from .correo import encolar_correo
+from .trabajos import ExportacionOcupada, encolar_exportacion, estado_trabajo
 
 
 def login_view(request):
@@ -45,14 +45,10 @@ def login_view(request):
 def dashboard_view(request):
     """Vista del dashboard principal"""
     
-    # Obtener estadísticas
+    # Obtener estadísticas (una sola consulta, cacheadas con TTL corto)
     context = {
         'active_menu': 'dashboard',  # Para resaltar en el menú
-        'productos_count': Producto.objects.filter(estado='ACTIVO').count(),
-        'alertas_count': AlertaStock.objects.filter(estado='ACTIVA').count(),
-        'ordenes_count': OrdenCompra.objects.filter(estado__in=['BORRADOR', 'ENVIADA', 'CONFIRMADA']).count(),
-        'bodegas_count': Bodega.objects.filter(activo=True).count(),
-        'notification_count': AlertaStock.objects.filter(estado='ACTIVA').count(),
+        **obtener_kpis_dashboard(),
     }
     
     return render(request, 'dashboard.html', context)
@@ -71,13 +67,9 @@ def usuarios_list(request):
     """Vista de listado de usuarios con filtros y paginación"""
     
     # Verificar permisos de acceso al módulo
-    if hasattr(request.user, 'usuario_profile'):
-        usuario = request.user.usuario_profile
-        if usuario.rol and usuario.rol.permisos and isinstance(usuario.rol.permisos, dict):
-            permisos_usuarios = usuario.rol.permisos.get('usuarios', {})
-            if not permisos_usuarios.get('ver', True):
-                messages.error(request, 'No tienes permisos para acceder al módulo de usuarios')
-                return redirect('dashboard')
+    if not obtener_permisos(request.user).puede('usuarios', 'ver'):
+        messages.error(request, 'No tienes permisos para acceder al módulo de usuarios')
+        return redirect('dashboard')
     
     # Obtener parámetros de búsqueda y filtros
     search = request.GET.get('search', '')
@@ -115,53 +107,41 @@ def usuarios_list(request):
         'created_at': 'created_at',
     }
     
-    # Validar y aplicar ordenamiento
-    if sort_by in sort_fields:
-        order_field = sort_fields[sort_by]
-        if sort_order == 'asc':
-            usuarios = usuarios.order_by(order_field)
-        else:
-            usuarios = usuarios.order_by(f'-{order_field}')
-    else:
-        # Ordenamiento por defecto
-        usuarios = usuarios.order_by('-created_at')
-    
-    # Estadísticas
-    total_usuarios = Usuario.objects.count()
-    usuarios_activos = Usuario.objects.filter(estado='ACTIVO').count()
-    usuarios_bloqueados = Usuario.objects.filter(estado='BLOQUEADO').count()
-    usuarios_inactivos = Usuario.objects.filter(estado='INACTIVO').count()
-    
-    # Paginación
-    try:
-        per_page = int(per_page)
-        if per_page not in [10, 20, 30]:
-            per_page = 10
-    except ValueError:
-        per_page = 10
-    
-    paginator = Paginator(usuarios, per_page)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # Validar ordenamiento (por defecto, más recientes primero)
+    if sort_by not in sort_fields:
+        sort_by, sort_order = 'created_at', 'desc'
+    order_field = sort_fields[sort_by]
+    if sort_order != 'asc':
+        order_field = f'-{order_field}'
+    
+    # Estadísticas y contador del filtro de estado (una sola consulta a la
+    # tabla de contadores, compartida con el paginador)
+    claves_stats = [
+        clave('usuarios'),
+        clave('usuarios', 'estado', 'ACTIVO'),
+        clave('usuarios', 'estado', 'BLOQUEADO'),
+        clave('usuarios', 'estado', 'INACTIVO'),
+    ]
+    if estado_filter:
+        claves_stats.append(clave('usuarios', 'estado', estado_filter))
+    stats = leer_contadores(claves_stats)
+    total_usuarios = stats[clave('usuarios')]
+    usuarios_activos = stats[clave('usuarios', 'estado', 'ACTIVO')]
+    usuarios_bloqueados = stats[clave('usuarios', 'estado', 'BLOQUEADO')]
+    usuarios_inactivos = stats[clave('usuarios', 'estado', 'INACTIVO')]
+    
+    # Paginación por cursor (total aproximado desde los contadores)
+    per_page = tamano_pagina(per_page)
+    total = total_listado(usuarios, 'usuarios', stats, {'estado': estado_filter},
+                          search=search, rol=rol_filter)
+    paginator = PaginadorCursor(usuarios, order_field, per_page, total=total)
+    page_obj = paginator.page(request.GET.get('cursor'))
     
     # Obtener todos los roles para el filtro
     roles = Rol.objects.all()
     
     # Obtener permisos del usuario actual
-    permisos = {
-        'ver': True,
-        'crear': True,
-        'editar': True,
-        'eliminar': True,
-        'exportar': True
-    }
-    
-    if hasattr(request.user, 'usuario_profile'):
-        usuario = request.user.usuario_profile
-        if usuario.rol and usuario.rol.permisos and isinstance(usuario.rol.permisos, dict):
-            rol_permisos = usuario.rol.permisos.get('usuarios', {})
-            if rol_permisos:
-                permisos = rol_permisos
+    permisos = obtener_permisos(request.user).de_modulo('usuarios')
     
     context = {
         'active_menu': 'usuarios',
@@ -189,15 +169,11 @@ def usuario_create(request):
     """Vista para crear un nuevo usuario (AJAX)"""
     
     # Verificar permisos
-    if hasattr(request.user, 'usuario_profile'):
-        usuario = request.user.usuario_profile
-        if usuario.rol and usuario.rol.permisos and isinstance(usuario.rol.permisos, dict):
-            permisos = usuario.rol.permisos.get('usuarios', {})
-            if not permisos.get('crear', True):
-                return JsonResponse({
-                    'success': False,
-                    'message': 'No tienes permisos para crear usuarios'
-                }, status=403)
+    if not obtener_permisos(request.user).puede('usuarios', 'crear'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para crear usuarios'
+        }, status=403)
     
     if request.method == 'POST':
         try:
@@ -284,15 +260,11 @@ def usuario_edit(request, usuario_id):
     
     # Verificar permisos para edición
     if request.method == 'POST':
-        if hasattr(request.user, 'usuario_profile'):
-            user_profile = request.user.usuario_profile
-            if user_profile.rol and user_profile.rol.permisos and isinstance(user_profile.rol.permisos, dict):
-                permisos = user_profile.rol.permisos.get('usuarios', {})
-                if not permisos.get('editar', True):
-                    return JsonResponse({
-                        'success': False,
-                        'message': 'No tienes permisos para editar usuarios'
-                    }, status=403)
+        if not obtener_permisos(request.user).puede('usuarios', 'editar'):
+            return JsonResponse({
+                'success': False,
+                'message': 'No tienes permisos para editar usuarios'
+            }, status=403)
     
     if request.method == 'POST':
         try:
@@ -361,15 +333,11 @@ def usuario_delete(request, usuario_id):
     """Vista para desactivar un usuario (AJAX)"""
     
     # Verificar permisos
-    if hasattr(request.user, 'usuario_profile'):
-        user_profile = request.user.usuario_profile
-        if user_profile.rol and user_profile.rol.permisos and isinstance(user_profile.rol.permisos, dict):
-            permisos = user_profile.rol.permisos.get('usuarios', {})
-            if not permisos.get('eliminar', True):
-                return JsonResponse({
-                    'success': False,
-                    'message': 'No tienes permisos para desactivar usuarios'
-                }, status=403)
+    if not obtener_permisos(request.user).puede('usuarios', 'eliminar'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para desactivar usuarios'
+        }, status=403)
     
     if request.method == 'POST':
         try:
@@ -427,99 +395,42 @@ def password_reset_request(request):
                 f'/password-reset-confirm/{uid}/{token}/'
             )
             
-            # Enviar email con Resend
+            # Encolar el email: lo envía el worker `manage.py enviar_correos`,
+            # así la respuesta no espera al proveedor de correo
             try:
-                import resend
                 from django.conf import settings
                 
-                resend.api_key = settings.RESEND_API_KEY
-                
                 # Nombre completo del usuario o username
                 user_name = user.get_full_name() or user.username
                 
-                # HTML del email
-                html_content = f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <meta charset="UTF-8">
-                    <style>
-                        body {{ font-family: 'Segoe UI', Arial, sans-serif; line-height: 1.6; color: #333; }}
-                        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                        .header {{ background: linear-gradient(135deg, #D20A11 0%, #8B0000 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                        .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                        .button {{ display: inline-block; padding: 15px 30px; background: #D20A11; color: white; text-decoration: none; border-radius: 5px; font-weight: bold; margin: 20px 0; }}
-                        .footer {{ text-align: center; margin-top: 30px; font-size: 12px; color: #666; }}
-                        .warning {{ background: #fff3cd; border-left: 4px solid #ffc107; padding: 15px; margin: 20px 0; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="header">
-                            <h1>🍬 {settings.COMPANY_NAME}</h1>
-                            <p style="margin: 0;">Recuperación de Contraseña</p>
-                        </div>
-                        <div class="content">
-                            <h2>Hola, {user_name}!</h2>
-                            <p>Hemos recibido una solicitud para restablecer la contraseña de tu cuenta.</p>
-                            <p>Haz clic en el siguiente botón para crear una nueva contraseña:</p>
-                            
-                            <div style="text-align: center;">
-                                <a href="{reset_link}" class="button">Restablecer Contraseña</a>
-                            </div>
-                            
-                            <p>O copia y pega este enlace en tu navegador:</p>
-                            <p style="background: white; padding: 10px; border-radius: 5px; word-break: break-all; font-size: 12px;">
-                                {reset_link}
-                            </p>
-                            
-                            <div class="warning">
-                                <strong>⚠️ Importante:</strong>
-                                <ul style="margin: 10px 0;">
-                                    <li>Este enlace es válido por <strong>24 horas</strong></li>
-                                    <li>Si no solicitaste este cambio, ignora este correo</li>
-                                    <li>Tu contraseña actual seguirá siendo válida</li>
-                                </ul>
-                            </div>
-                            
-                            <p style="margin-top: 30px; font-size: 14px; color: #666;">
-                                Si tienes problemas con el botón, copia y pega el enlace directamente en tu navegador.
-                            </p>
-                        </div>
-                        <div class="footer">
-                            <p>Este correo fue enviado desde {settings.COMPANY_NAME}</p>
-                            <p>© 2025 {settings.COMPANY_NAME}. Todos los derechos reservados.</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                """
-                
                 # En modo de prueba, enviar a email verificado
                 # En producción con dominio verificado, enviar al email del usuario
                 destination_email = settings.RESEND_TEST_EMAIL if hasattr(settings, 'RESEND_TEST_EMAIL') else email
                 
-                # Enviar email
-                r = resend.Emails.send({
-                    "from": settings.RESEND_FROM_EMAIL,
-                    "to": destination_email,
-                    "subject": f"🔐 Recuperación de Contraseña - {settings.COMPANY_NAME}",
-                    "html": html_content
-                })
+                encolar_correo(
+                    destination_email,
+                    f"🔐 Recuperación de Contraseña - {settings.COMPANY_NAME}",
+                    'emails/password_reset.html',
+                    {
+                        'company_name': settings.COMPANY_NAME,
+                        'user_name': user_name,
+                        'reset_link': reset_link,
+                    },
+                )
                 
                 email_sent = True
                 
                 # Mensaje informativo en desarrollo
                 if destination_email != email:
-                    print(f"[DESARROLLO] Email de recuperación para {email} enviado a {destination_email}")
+                    print(f"[DESARROLLO] Email de recuperación para {email} encolado para {destination_email}")
                 
             except Exception as email_error:
-                # Si falla el envío de email, registrar el error pero mostrar el link en pantalla
+                # Si falla el encolado, registrar el error pero mostrar el link en pantalla
                 import traceback
                 error_detail = traceback.format_exc()
-                print(f"Error al enviar email: {email_error}")
+                print(f"Error al encolar email: {email_error}")
                 print(f"Detalle completo: {error_detail}")
-                # En ambiente de prueba, mostrar el link si falla el envío
+                # En ambiente de prueba, mostrar el link si falla el encolado
                 email_sent = False
             
         except User.DoesNotExist:
@@ -533,11 +444,11 @@ def password_reset_request(request):
         # Siempre mostrar un mensaje genérico por seguridad
         if reset_link:
             if email_sent:
-                # Email enviado exitosamente
+                # Email encolado exitosamente
                 from django.conf import settings
                 if hasattr(settings, 'RESEND_TEST_EMAIL') and email != settings.RESEND_TEST_EMAIL:
-                    # Modo de desarrollo - informar que se envió al email de prueba
-                    messages.success(request, f'✅ Correo enviado exitosamente a {settings.RESEND_TEST_EMAIL} (modo prueba)')
+                    # Modo de desarrollo - informar que se envía al email de prueba
+                    messages.success(request, f'✅ Correo en camino a {settings.RESEND_TEST_EMAIL} (modo prueba)')
                     messages.info(request, f'ℹ️ En producción se enviaría a: {email}')
                 else:
                     messages.success(request, f'Se ha enviado un correo a {email} con las instrucciones para restablecer tu contraseña.')
@@ -618,110 +529,52 @@ def password_reset_confirm(request, uidb64, token):
 
 @login_required(login_url='login')
 def exportar_usuarios_excel(request):
-    """Exportar listado de usuarios a Excel"""
-    
-    # Obtener usuarios con los mismos filtros que la vista principal
-    usuarios = Usuario.objects.select_related('user', 'rol').all()
-    
-    # Aplicar filtros de búsqueda si existen
-    search = request.GET.get('search', '').strip()
-    if search:
-        usuarios = usuarios.filter(
-            Q(user__username__icontains=search) |
-            Q(user__first_name__icontains=search) |
-            Q(user__last_name__icontains=search) |
-            Q(user__email__icontains=search) |
-            Q(telefono__icontains=search)
-        )
-    
-    # Filtros adicionales
-    rol_filter = request.GET.get('rol')
-    if rol_filter:
-        usuarios = usuarios.filter(rol_id=rol_filter)
-    
-    estado_filter = request.GET.get('estado')
-    if estado_filter:
-        usuarios = usuarios.filter(estado=estado_filter)
-    
-    # Aplicar ordenamiento si existe
-    sort_by = request.GET.get('sort', 'created_at')
-    sort_order = request.GET.get('order', 'desc')
-    
-    sort_fields = {
-        'username': 'user__username',
-        'nombre': 'user__first_name',
-        'email': 'user__email',
-        'rol': 'rol__nombre',
-        'estado': 'estado',
-        'created_at': 'created_at',
-    }
+    """Encola la exportación del listado de usuarios a Excel (con los filtros actuales)"""
     
-    if sort_by in sort_fields:
-        order_field = sort_fields[sort_by]
-        if sort_order == 'desc':
-            order_field = f'-{order_field}'
-        usuarios = usuarios.order_by(order_field)
-    
-    # Crear workbook de Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Usuarios"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Encabezados
-    headers = ['Usuario', 'Nombre Completo', 'Email', 'Teléfono', 'Rol', 'Área/Unidad', 'Estado', 'Fecha Creación']
-    ws.append(headers)
-    
-    # Aplicar estilos a encabezados
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
-    
-    # Ajustar ancho de columnas
-    column_widths = [15, 30, 35, 15, 20, 25, 12, 20]
-    for i, width in enumerate(column_widths, 1):
-        ws.column_dimensions[ws.cell(1, i).column_letter].width = width
-    
-    # Agregar datos
-    for usuario in usuarios:
-        row = [
-            usuario.user.username,
-            usuario.user.get_full_name() or '-',
-            usuario.user.email or '-',
-            usuario.telefono or '-',
-            usuario.rol.nombre if usuario.rol else '-',
-            usuario.area_unidad or '-',
-            'Activo' if usuario.estado == 'ACTIVO' else 'Inactivo',
-            usuario.created_at.strftime('%d/%m/%Y %H:%M') if usuario.created_at else '-'
-        ]
-        ws.append(row)
-        
-        # Aplicar bordes y alineación a las celdas de datos
-        for cell in ws[ws.max_row]:
-            cell.border = border
-            cell.alignment = Alignment(vertical='center')
-    
-    # Configurar la respuesta HTTP
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('usuarios', 'exportar'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para exportar usuarios'
+        }, status=403)
     
-    # Nombre del archivo con fecha y hora
-    filename = f'usuarios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename={filename}'
+    try:
+        trabajo = encolar_exportacion('usuarios', parametros_de('usuarios', request.GET), request.user)
+    except ExportacionOcupada as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=503)
+    return JsonResponse({'success': True, **estado_trabajo(trabajo)})
+
+
+@login_required(login_url='login')
+def exportacion_estado(request, trabajo_id):
+    """Estado y avance de una exportación (la interfaz lo consulta periódicamente)"""
+    trabajo = get_object_or_404(TrabajoExportacion, id=trabajo_id)
     
-    # Guardar el workbook en la respuesta
-    wb.save(response)
+    if not obtener_permisos(request.user).puede(trabajo.tipo, 'exportar'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para esta exportación'
+        }, status=403)
     
-    return response
+    return JsonResponse({'success': True, **estado_trabajo(trabajo)})
+
+
+@login_required(login_url='login')
+def exportacion_descargar(request, trabajo_id):
+    """Descarga el archivo de una exportación terminada"""
+    trabajo = get_object_or_404(TrabajoExportacion, id=trabajo_id)
+    
+    if not obtener_permisos(request.user).puede(trabajo.tipo, 'exportar'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para esta exportación'
+        }, status=403)
+    
+    if trabajo.estado != 'COMPLETADO' or not trabajo.archivo:
+        return JsonResponse({
+            'success': False,
+            'message': 'La exportación no está disponible (en curso o expirada)'
+        }, status=404)
+    
+    return FileResponse(trabajo.archivo.open('rb'), as_attachment=True,
+                        filename=trabajo.nombre_archivo, content_type=CONTENT_TYPE_XLSX)
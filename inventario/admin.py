@@ -1,6 +1,11 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils import timezone
-from .models import Bodega, Lote, MovimientoInventario, StockActual, AlertaStock
+from autenticacion.contadores import actualizar_masivo
+from .models import (
+    Bodega, Lote, MovimientoInventario, StockActual, AlertaStock, MarcaProceso, CargaMovimientos, Reserva,
+)
+from .reservas import liberar_reserva
+from .stock import ErrorStock, confirmar_movimiento, recibir_transferencia
 
 
 @admin.register(Bodega)
@@ -71,11 +76,36 @@ class MovimientoInventarioAdmin(admin.ModelAdmin):
             'fields': ('motivo_ajuste', 'observaciones')
         }),
         ('Estado y Usuarios', {
-            'fields': ('estado', 'usuario', 'fecha_confirmacion', 'usuario_confirmacion')
+            'fields': ('estado', 'usuario', 'fecha_confirmacion', 'usuario_confirmacion',
+                       'cantidad_stock', 'fecha_recepcion')
         }),
     )
     
-    readonly_fields = ['created_at', 'updated_at']
+    # El estado solo cambia con las acciones, que además actualizan el stock
+    readonly_fields = ['estado', 'fecha_confirmacion', 'usuario_confirmacion', 'cantidad_stock',
+                       'fecha_recepcion', 'created_at', 'updated_at']
+    
+    def _procesar(self, request, queryset, funcion, accion):
+        procesados = 0
+        for movimiento in queryset.order_by('fecha_movimiento', 'pk'):
+            try:
+                funcion(movimiento)
+                procesados += 1
+            except ErrorStock as error:
+                self.message_user(request, f'Movimiento {movimiento.pk}: {error}', messages.ERROR)
+        if procesados:
+            self.message_user(request, f'{procesados} movimientos {accion} correctamente.')
+    
+    def confirmar_movimientos(self, request, queryset):
+        usuario = getattr(request.user, 'usuario_profile', None)
+        self._procesar(request, queryset, lambda m: confirmar_movimiento(m, usuario), 'confirmados')
+    confirmar_movimientos.short_description = "Confirmar movimientos seleccionados (actualiza stock)"
+    
+    def recibir_transferencias(self, request, queryset):
+        self._procesar(request, queryset, recibir_transferencia, 'recibidos')
+    recibir_transferencias.short_description = "Recibir transferencias seleccionadas en bodega destino"
+    
+    actions = ['confirmar_movimientos', 'recibir_transferencias']
 
 
 @admin.register(StockActual)
@@ -125,8 +155,50 @@ class AlertaStockAdmin(admin.ModelAdmin):
     
     # Acción personalizada para resolver alertas
     def resolver_alertas(self, request, queryset):
-        updated = queryset.update(estado='RESUELTA', fecha_resolucion=timezone.now())
+        updated = actualizar_masivo(queryset, estado='RESUELTA', fecha_resolucion=timezone.now())
         self.message_user(request, f'{updated} alertas resueltas correctamente.')
     resolver_alertas.short_description = "Resolver alertas seleccionadas"
     
     actions = ['resolver_alertas']
+
+
+@admin.register(Reserva)
+class ReservaAdmin(admin.ModelAdmin):
+    list_display = ['producto', 'bodega', 'lote', 'cantidad', 'estado', 'expira_en', 'documento_referencia']
+    list_filter = ['estado', 'bodega']
+    search_fields = ['producto__sku', 'documento_referencia']
+    ordering = ['-created_at']
+    list_select_related = ['producto', 'bodega', 'lote']
+    
+    # Las cantidades ya están apartadas en el stock: solo se cambian con las acciones
+    readonly_fields = ['producto', 'bodega', 'lote', 'cantidad', 'estado', 'expira_en', 'usuario',
+                       'movimiento', 'created_at', 'updated_at']
+    
+    def liberar_reservas(self, request, queryset):
+        liberadas = 0
+        for reserva in queryset.filter(estado='ACTIVA'):
+            try:
+                liberar_reserva(reserva)
+                liberadas += 1
+            except ErrorStock as error:
+                self.message_user(request, f'Reserva {reserva.pk}: {error}', messages.ERROR)
+        self.message_user(request, f'{liberadas} reservas liberadas correctamente.')
+    liberar_reservas.short_description = "Liberar reservas seleccionadas (devuelve el stock)"
+    
+    actions = ['liberar_reservas']
+
+
+@admin.register(MarcaProceso)
+class MarcaProcesoAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'hasta', 'filas', 'updated_at']
+    readonly_fields = ['updated_at']
+    ordering = ['nombre']
+
+
+@admin.register(CargaMovimientos)
+class CargaMovimientosAdmin(admin.ModelAdmin):
+    list_display = ['clave', 'usuario', 'total_movimientos', 'filas_stock', 'segundos', 'created_at']
+    search_fields = ['clave']
+    ordering = ['-created_at']
+    list_select_related = ['usuario__user']
+    readonly_fields = ['clave', 'usuario', 'total_movimientos', 'filas_stock', 'segundos', 'created_at']
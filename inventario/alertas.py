@@ -0,0 +1,251 @@
+"""
+Alertas de stock por (producto, bodega): SIN_STOCK, BAJO_STOCK y SOBRE_STOCK
+
+`evaluar_alertas_stock` revisa todo StockActual de productos y bodegas
+activos en unas pocas sentencias, sin recorrer productos:
+
+1. Resuelve las alertas pendientes cuya condición ya no se cumple (un UPDATE
+   con NOT EXISTS sobre la evaluación).
+2. Inserta con un INSERT ... SELECT las alertas nuevas de los pares que
+   cumplen una condición y no tienen ya una alerta pendiente (ACTIVA o
+   IGNORADA) del mismo tipo.
+3. Ajusta los contadores del dashboard (`ajustar_contadores`) con las filas
+   creadas y resueltas, ya que ninguna de las dos sentencias dispara señales.
+
+La condición y la prioridad se calculan en la misma consulta:
+
+- umbral = el mayor entre punto de reorden (si hay) y stock mínimo
+- SIN_STOCK: disponible <= 0 con umbral > 0 (prioridad CRITICA)
+- BAJO_STOCK: disponible bajo el umbral; ALTA hasta el 25% del umbral,
+  MEDIA hasta el 50%, BAJA sobre eso
+- SOBRE_STOCK: disponible sobre el stock máximo; ALTA desde el doble del
+  máximo, MEDIA desde 1,5 veces, BAJA bajo eso
+
+Entre revisiones completas, cada cambio de StockActual (contabilización,
+cargas, conciliación, admin) encola su par con `encolar_pares` y
+`reevaluar_alertas` (`manage.py reevaluar_alertas --loop`) evalúa solo los
+pares encolados, con las mismas sentencias restringidas a ellos.
+"""
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Case, CharField, DateTimeField, DecimalField, Exists, F, OuterRef, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from autenticacion.contadores import aplicar_deltas, clave
+from .models import AlertaStock, MarcaProceso, ParPendienteAlerta, StockActual
+
+
+TIPOS = ['SIN_STOCK', 'BAJO_STOCK', 'SOBRE_STOCK']
+
+# Estados que cuentan como alerta ya informada mientras dure la condición
+PENDIENTES = ['ACTIVA', 'IGNORADA']
+
+MARCA_ALERTAS = 'alertas_stock'
+
+# Pares de la cola por transacción de reevaluación
+TAMANO_LOTE = 500
+
+
+@dataclass
+class ResultadoAlertas:
+    creadas: int = 0
+    resueltas: int = 0
+    pares: int = 0          # pares reevaluados desde la cola
+    segundos: float = 0.0
+
+
+def _evaluacion():
+    """StockActual con el tipo de alerta que corresponde, su límite y su prioridad"""
+    cantidad = DecimalField(max_digits=18, decimal_places=6)
+    umbral = Greatest(Coalesce('producto__punto_reorden', 'producto__stock_minimo'), 'producto__stock_minimo')
+    maximo = F('producto__stock_maximo')
+    return (
+        StockActual.objects
+        .filter(producto__estado='ACTIVO', bodega__activo=True)
+        .annotate(umbral=umbral)
+        .annotate(
+            tipo_alerta=Case(
+                When(cantidad_disponible__lte=0, umbral__gt=0, then=Value('SIN_STOCK')),
+                When(cantidad_disponible__lt=F('umbral'), then=Value('BAJO_STOCK')),
+                When(cantidad_disponible__gt=maximo, then=Value('SOBRE_STOCK')),
+                default=None, output_field=CharField(),
+            ),
+        )
+        .filter(tipo_alerta__isnull=False)
+    ), {
+        'cantidad_limite': Case(
+            When(tipo_alerta='SOBRE_STOCK', then=maximo), default=F('umbral'), output_field=cantidad,
+        ),
+        'prioridad': Case(
+            When(tipo_alerta='SIN_STOCK', then=Value('CRITICA')),
+            When(tipo_alerta='BAJO_STOCK', cantidad_disponible__lte=F('umbral') * Decimal('0.25'),
+                 then=Value('ALTA')),
+            When(tipo_alerta='BAJO_STOCK', cantidad_disponible__lte=F('umbral') * Decimal('0.5'),
+                 then=Value('MEDIA')),
+            When(tipo_alerta='SOBRE_STOCK', cantidad_disponible__gte=maximo * 2, then=Value('ALTA')),
+            When(tipo_alerta='SOBRE_STOCK', cantidad_disponible__gte=maximo * Decimal('1.5'),
+                 then=Value('MEDIA')),
+            default=Value('BAJA'), output_field=CharField(),
+        ),
+    }
+
+
+def _insertar(consulta, campos):
+    """
+    INSERT INTO alertas_stock (campos) SELECT ...: las alertas nuevas se
+    copian dentro de la base de datos, sin armar un objeto por fila
+    """
+    sql, params = consulta.query.sql_with_params()
+    nombre = connection.ops.quote_name
+    columnas = ', '.join(nombre(AlertaStock._meta.get_field(campo).column) for campo in campos)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {nombre(AlertaStock._meta.db_table)} ({columnas}) {sql}', params)
+        return cursor.rowcount
+
+
+def ajustar_contadores(creadas=0, resueltas=None):
+    """
+    Ajusta los contadores de alertas (autenticacion.contadores) por cambios
+    hechos sin señales: `creadas` alertas ACTIVA nuevas y `resueltas`
+    ({estado anterior: filas}) pasadas a RESUELTA
+    """
+    deltas = Counter({clave('alertas'): creadas, clave('alertas', 'estado', 'ACTIVA'): creadas})
+    for estado, filas in (resueltas or {}).items():
+        deltas[clave('alertas', 'estado', estado)] -= filas
+        deltas[clave('alertas', 'estado', 'RESUELTA')] += filas
+    aplicar_deltas(deltas)
+
+
+def _bloquear():
+    """Una evaluación a la vez (completa o por pares): dos simultáneas duplicarían alertas"""
+    MarcaProceso.objects.get_or_create(nombre=MARCA_ALERTAS)
+    return MarcaProceso.objects.select_for_update().get(nombre=MARCA_ALERTAS)
+
+
+def _evaluar(resultado, ahora, pares=None):
+    """Resuelve y crea las alertas de los pares indicados (o de todos)"""
+    evaluacion, calculos = _evaluacion()
+    alertas = AlertaStock.objects.filter(estado__in=PENDIENTES, tipo_alerta__in=TIPOS)
+    if pares is not None:
+        # Por el índice (producto, bodega) de cada tabla: el costo depende de los pares.
+        # Un IN por bodega y no un OR por par, que en SQLite excede la profundidad máxima
+        por_bodega = defaultdict(list)
+        for producto_id, bodega_id in pares:
+            por_bodega[bodega_id].append(producto_id)
+        filtro = reduce(or_, (Q(bodega_id=bodega_id, producto_id__in=productos)
+                              for bodega_id, productos in por_bodega.items()))
+        evaluacion, alertas = evaluacion.filter(filtro), alertas.filter(filtro)
+
+    vigente = evaluacion.filter(
+        producto_id=OuterRef('producto_id'), bodega_id=OuterRef('bodega_id'),
+        tipo_alerta=OuterRef('tipo_alerta'),
+    )
+    # Un UPDATE por estado pendiente para saber cuántas salen de cada contador
+    resueltas = {
+        estado: alertas.filter(estado=estado).exclude(Exists(vigente)).update(
+            estado='RESUELTA', fecha_resolucion=ahora,
+            motivo_resolucion='Resuelta automáticamente: el stock salió de la condición',
+        )
+        for estado in PENDIENTES
+    }
+    resultado.resueltas += sum(resueltas.values())
+
+    pendiente = AlertaStock.objects.filter(
+        estado__in=PENDIENTES, producto_id=OuterRef('producto_id'), bodega_id=OuterRef('bodega_id'),
+        tipo_alerta=OuterRef('tipo_alerta'),
+    )
+    nuevas = (
+        evaluacion.exclude(Exists(pendiente))
+        .annotate(
+            **calculos,
+            estado_alerta=Value('ACTIVA', output_field=CharField()),
+            generada=Value(ahora, output_field=DateTimeField()),
+        )
+        .order_by()
+        .values_list('producto_id', 'bodega_id', 'tipo_alerta', 'cantidad_disponible',
+                     'cantidad_limite', 'prioridad', 'estado_alerta', 'generada')
+    )
+    creadas = _insertar(nuevas, [
+        'producto', 'bodega', 'tipo_alerta', 'cantidad_actual',
+        'cantidad_limite', 'prioridad', 'estado', 'fecha_generacion',
+    ])
+    resultado.creadas += creadas
+    # El INSERT ... SELECT y el UPDATE no disparan las señales de los contadores
+    ajustar_contadores(creadas, resueltas)
+
+
+def evaluar_alertas_stock():
+    """Genera y resuelve las alertas de stock de todos los pares. Retorna un ResultadoAlertas"""
+    inicio = time.monotonic()
+    resultado = ResultadoAlertas()
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        marca = _bloquear()
+        _evaluar(resultado, ahora)
+        marca.hasta = ahora
+        marca.filas = resultado.creadas
+        marca.save(update_fields=['hasta', 'filas', 'updated_at'])
+
+    resultado.segundos = time.monotonic() - inicio
+    return resultado
+
+
+def encolar_pares(pares):
+    """
+    Encola (producto_id, bodega_id) con stock modificado para reevaluar sus
+    alertas. Un par ya encolado no se repite: solo se actualiza su
+    `cambiado_en`, así una ráfaga de movimientos produce una reevaluación.
+    """
+    pares = sorted(set(pares))
+    if not pares:
+        return
+    ahora = timezone.now()
+    ParPendienteAlerta.objects.bulk_create(
+        [ParPendienteAlerta(producto_id=producto_id, bodega_id=bodega_id, cambiado_en=ahora)
+         for producto_id, bodega_id in pares],
+        batch_size=TAMANO_LOTE,
+        update_conflicts=True, unique_fields=['producto', 'bodega'], update_fields=['cambiado_en'],
+    )
+
+
+def reevaluar_alertas(limite=TAMANO_LOTE):
+    """
+    Reevalúa las alertas de los pares encolados, de a `limite` pares por
+    transacción. Un par que vuelve a cambiar durante su evaluación queda en
+    la cola para la siguiente vuelta. Retorna un ResultadoAlertas.
+    """
+    inicio = time.monotonic()
+    resultado = ResultadoAlertas()
+    while True:
+        encolados = list(
+            ParPendienteAlerta.objects.order_by('pk')
+            .values_list('pk', 'producto_id', 'bodega_id', 'cambiado_en')[:limite]
+        )
+        if not encolados:
+            break
+        with transaction.atomic():
+            _bloquear()
+            _evaluar(resultado, timezone.now(), pares=[(producto_id, bodega_id) for _, producto_id, bodega_id, _ in encolados])
+            # Solo salen los pares sin cambios desde que se leyeron
+            leidos = {pk: cambiado_en for pk, _, _, cambiado_en in encolados}
+            actuales = (
+                ParPendienteAlerta.objects.select_for_update()
+                .filter(pk__in=leidos).values_list('pk', 'cambiado_en')
+            )
+            ParPendienteAlerta.objects.filter(
+                pk__in=[pk for pk, cambiado_en in actuales if leidos[pk] == cambiado_en]
+            ).delete()
+        resultado.pares += len(encolados)
+        if len(encolados) < limite:
+            break
+
+    resultado.segundos = time.monotonic() - inicio
+    return resultado
@@ -0,0 +1,237 @@
+"""
+Exportación analítica (Parquet) de movimientos y stock
+
+Los movimientos se escriben con las claves de producto, bodegas y proveedor
+ya desnormalizadas, un archivo por mes de `fecha_movimiento`
+(`movimientos/mes=AAAA-MM/<corrida>.parquet`), para que finanzas los lea
+con cualquier herramienta columnar sin pasar por el admin.
+
+Las filas se leen de la base de datos en lotes por clave (nunca la tabla
+entera en memoria) y se vuelcan al archivo en grupos de filas de
+FILAS_POR_GRUPO. Cada corrida exporta solo los movimientos creados o
+modificados desde la anterior (marca 'analitica_movimientos'); un
+movimiento modificado vuelve a aparecer en una corrida posterior, por lo
+que al consolidar se conserva la fila con mayor `updated_at` de cada `id`.
+
+El stock se exporta completo en cada corrida como una foto
+(`stock/mes=AAAA-MM/<corrida>.parquet`).
+
+pyarrow es opcional: solo se importa al exportar.
+"""
+import os
+from datetime import timedelta
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import MarcaProceso, MovimientoInventario, StockActual
+
+
+# Filas por grupo de filas (row group) del archivo Parquet
+FILAS_POR_GRUPO = 50000
+
+# Filas que se leen de la base de datos por consulta
+TAMANO_LOTE = 5000
+
+MARCA_MOVIMIENTOS = 'analitica_movimientos'
+
+# (columna, campo del ORM, tipo). La primera columna siempre es el id.
+COLUMNAS_MOVIMIENTOS = [
+    ('id', 'id', 'entero'),
+    ('tipo_movimiento', 'tipo_movimiento', 'texto'),
+    ('estado', 'estado', 'texto'),
+    ('fecha_movimiento', 'fecha_movimiento', 'fecha_hora'),
+    ('producto_id', 'producto_id', 'entero'),
+    ('producto_sku', 'producto__sku', 'texto'),
+    ('producto_nombre', 'producto__nombre', 'texto'),
+    ('bodega_origen_id', 'bodega_origen_id', 'entero'),
+    ('bodega_origen_codigo', 'bodega_origen__codigo', 'texto'),
+    ('bodega_destino_id', 'bodega_destino_id', 'entero'),
+    ('bodega_destino_codigo', 'bodega_destino__codigo', 'texto'),
+    ('proveedor_id', 'proveedor_id', 'entero'),
+    ('proveedor_rut_nif', 'proveedor__rut_nif', 'texto'),
+    ('proveedor_razon_social', 'proveedor__razon_social', 'texto'),
+    ('cantidad', 'cantidad', 'decimal'),
+    ('unidad_medida', 'unidad_medida__codigo', 'texto'),
+    ('costo_unitario', 'costo_unitario', 'decimal'),
+    ('costo_total', 'costo_total', 'decimal'),
+    ('lote_codigo', 'lote__codigo_lote', 'texto'),
+    ('documento_padre_tipo', 'documento_padre_tipo', 'texto'),
+    ('documento_padre_id', 'documento_padre_id', 'entero'),
+    ('documento_referencia', 'documento_referencia', 'texto'),
+    ('usuario_id', 'usuario_id', 'entero'),
+    ('fecha_confirmacion', 'fecha_confirmacion', 'fecha_hora'),
+    ('created_at', 'created_at', 'fecha_hora'),
+    ('updated_at', 'updated_at', 'fecha_hora'),
+]
+
+COLUMNAS_STOCK = [
+    ('id', 'id', 'entero'),
+    ('producto_id', 'producto_id', 'entero'),
+    ('producto_sku', 'producto__sku', 'texto'),
+    ('producto_nombre', 'producto__nombre', 'texto'),
+    ('bodega_id', 'bodega_id', 'entero'),
+    ('bodega_codigo', 'bodega__codigo', 'texto'),
+    ('cantidad_disponible', 'cantidad_disponible', 'decimal'),
+    ('cantidad_reservada', 'cantidad_reservada', 'decimal'),
+    ('cantidad_transito', 'cantidad_transito', 'decimal'),
+    ('ultimo_ingreso', 'ultimo_ingreso', 'fecha_hora'),
+    ('ultima_salida', 'ultima_salida', 'fecha_hora'),
+    ('updated_at', 'updated_at', 'fecha_hora'),
+]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImproperlyConfigured('La exportación analítica requiere pyarrow (pip install pyarrow)')
+    return pyarrow, pyarrow.parquet
+
+
+def _esquema(pa, columnas):
+    tipos = {
+        'entero': pa.int64(),
+        'texto': pa.string(),
+        'decimal': pa.decimal128(18, 6),
+        'fecha_hora': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(nombre, tipos[tipo]) for nombre, _, tipo in columnas])
+
+
+def recorrer(queryset, columnas, orden='id'):
+    """
+    Tuplas del queryset (en el orden de `columnas`) ordenadas por (orden, id).
+
+    Se consulta por lotes avanzando sobre la clave, así la memoria no depende
+    del tamaño de la tabla en ningún motor (el driver de MySQL carga el
+    resultado completo de una consulta aunque se use iterator()).
+    """
+    campos = [campo for _, campo, _ in columnas]
+    posicion = campos.index(orden)
+    queryset = queryset.order_by(orden, 'id').values_list(*campos)
+
+    ultimo = None
+    while True:
+        pagina = queryset
+        if ultimo is not None:
+            valor, pk = ultimo[posicion], ultimo[0]
+            if orden == 'id':
+                pagina = queryset.filter(id__gt=pk)
+            else:
+                pagina = queryset.filter(Q(**{f'{orden}__gt': valor}) | Q(**{orden: valor, 'id__gt': pk}))
+        lote = list(pagina[:TAMANO_LOTE])
+        yield from lote
+        if len(lote) < TAMANO_LOTE:
+            return
+        ultimo = lote[-1]
+
+
+def escribir_parquet(archivo, columnas, filas):
+    """
+    Escribe las filas en `archivo` (ruta o archivo abierto) en grupos de
+    FILAS_POR_GRUPO y retorna cuántas se escribieron.
+    """
+    pa, pq = _pyarrow()
+    esquema = _esquema(pa, columnas)
+    escritas = 0
+    filas = iter(filas)
+    with pq.ParquetWriter(archivo, esquema, compression='zstd') as writer:
+        while True:
+            grupo = list(islice(filas, FILAS_POR_GRUPO))
+            if not grupo:
+                break
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*grupo), esquema)],
+                schema=esquema,
+            ))
+            escritas += len(grupo)
+    return escritas
+
+
+def exportar_movimientos(destino, hasta, desde=None, nombre=None):
+    """
+    Exporta los movimientos con `desde <= updated_at < hasta`, un archivo por
+    mes. Retorna (filas, rutas de los archivos escritos).
+
+    Cada archivo se escribe con extensión .tmp y se renombra recién cuando
+    todos terminaron, así una corrida fallida no deja archivos a medias.
+    """
+    nombre = nombre or f'{timezone.localtime(hasta):%Y%m%dT%H%M%S}'
+    queryset = MovimientoInventario.objects.filter(updated_at__lt=hasta)
+    if desde is not None:
+        queryset = queryset.filter(updated_at__gte=desde)
+
+    posicion_fecha = [campo for _, campo, _ in COLUMNAS_MOVIMIENTOS].index('fecha_movimiento')
+
+    def mes(fila):
+        return f'{timezone.localtime(fila[posicion_fecha]):%Y-%m}'
+
+    filas, rutas = 0, []
+    try:
+        # Ordenado por fecha, cada mes es un tramo contiguo de filas
+        movimientos = recorrer(queryset, COLUMNAS_MOVIMIENTOS, orden='fecha_movimiento')
+        for particion, grupo in groupby(movimientos, key=mes):
+            carpeta = os.path.join(destino, 'movimientos', f'mes={particion}')
+            os.makedirs(carpeta, exist_ok=True)
+            rutas.append(os.path.join(carpeta, f'{nombre}.parquet'))
+            filas += escribir_parquet(rutas[-1] + '.tmp', COLUMNAS_MOVIMIENTOS, grupo)
+    except BaseException:
+        for ruta in rutas:
+            if os.path.exists(ruta + '.tmp'):
+                os.remove(ruta + '.tmp')
+        raise
+
+    for ruta in rutas:
+        os.replace(ruta + '.tmp', ruta)
+    return filas, rutas
+
+
+def exportar_stock(destino, nombre=None):
+    """Foto completa del stock actual. Retorna (filas, ruta del archivo)"""
+    ahora = timezone.localtime()
+    carpeta = os.path.join(destino, 'stock', f'mes={ahora:%Y-%m}')
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, f'{nombre or f"{ahora:%Y%m%dT%H%M%S}"}.parquet')
+    try:
+        filas = escribir_parquet(ruta + '.tmp', COLUMNAS_STOCK, recorrer(StockActual.objects.all(), COLUMNAS_STOCK))
+    except BaseException:
+        if os.path.exists(ruta + '.tmp'):
+            os.remove(ruta + '.tmp')
+        raise
+    os.replace(ruta + '.tmp', ruta)
+    return filas, ruta
+
+
+def exportar_analitica(destino=None, completo=False, stock=True):
+    """
+    Corrida incremental: movimientos nuevos o modificados desde la última
+    marca y, si `stock`, la foto del stock. Con `completo` se ignora la marca
+    (conviene un destino vacío para no duplicar archivos anteriores).
+
+    Retorna un dict con filas y archivos de cada conjunto.
+    """
+    _pyarrow()  # fallar antes de tocar nada si no está instalado
+    destino = destino or settings.ANALITICA_DIR
+    hasta = timezone.now() - timedelta(seconds=getattr(settings, 'ANALITICA_MARGEN', 60))
+    nombre = f'{timezone.localtime():%Y%m%dT%H%M%S}'
+
+    marca, _ = MarcaProceso.objects.get_or_create(nombre=MARCA_MOVIMIENTOS)
+    desde = None if completo else marca.hasta
+    if desde is not None and desde >= hasta:
+        filas, rutas = 0, []
+    else:
+        filas, rutas = exportar_movimientos(destino, hasta, desde, nombre)
+        marca.hasta = hasta
+        marca.filas = (0 if completo else marca.filas) + filas
+        marca.save(update_fields=['hasta', 'filas', 'updated_at'])
+
+    resultado = {'movimientos': {'filas': filas, 'archivos': rutas, 'desde': desde, 'hasta': hasta}}
+    if stock:
+        filas_stock, ruta = exportar_stock(destino, nombre)
+        resultado['stock'] = {'filas': filas_stock, 'archivos': [ruta]}
+    return resultado
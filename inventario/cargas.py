@@ -0,0 +1,222 @@
+"""
+Contabilización masiva de movimientos (cargas nocturnas del POS, recepciones)
+
+Una carga llega con miles de movimientos y una clave que la identifica en el
+sistema de origen. `contabilizar_carga`:
+
+1. Valida la carga completa antes de escribir nada (todas las referencias se
+   resuelven con una consulta por tabla) y reporta los errores por fila. Las
+   SALIDAs de productos con lote se rechazan: se registran con la salida
+   FEFO, que descuenta también los lotes.
+2. Agrupa en memoria el efecto de todos los movimientos por (producto,
+   bodega) y por lote.
+3. En una transacción registra la carga, inserta los movimientos ya
+   confirmados con bulk_create y aplica un único UPDATE por fila de stock
+   afectada, en orden de (producto, bodega) para no bloquearse con otras
+   cargas o confirmaciones.
+
+La clave es única: reenviar una carga ya contabilizada no la aplica de
+nuevo y retorna el resultado original.
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from maestros.models import Producto, Proveedor, UnidadMedida
+from .alertas import encolar_pares
+from .models import Bodega, CargaMovimientos, Lote, MovimientoInventario
+from .stock import (
+    ErrorStock, aplicar_en_stock, aplicar_en_lote, convertir_a_stock, efecto_en_stock, exigir_fefo,
+)
+
+
+# Movimientos insertados por sentencia
+TAMANO_INSERCION = 1000
+
+# Campos que acepta cada movimiento de una carga
+CAMPOS = [
+    'tipo_movimiento', 'fecha_movimiento', 'producto_id', 'cantidad', 'unidad_medida_id',
+    'bodega_origen_id', 'bodega_destino_id', 'proveedor_id', 'lote_id', 'serie',
+    'costo_unitario', 'costo_total', 'documento_padre_tipo', 'documento_padre_id',
+    'documento_referencia', 'motivo_ajuste', 'observaciones',
+]
+
+TIPOS = {tipo for tipo, _ in MovimientoInventario.TIPO_MOVIMIENTO_CHOICES}
+
+
+class CargaInvalida(ErrorStock):
+    """La carga tiene filas con errores; `errores` es [(índice, mensaje), ...]"""
+
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__(f'{len(errores)} movimientos con errores')
+
+
+@dataclass
+class ResultadoCarga:
+    carga: CargaMovimientos
+    repetida: bool = False
+
+    @property
+    def movimientos_por_segundo(self):
+        if not self.carga.segundos:
+            return 0.0
+        return self.carga.total_movimientos / self.carga.segundos
+
+
+def _decimal(valor):
+    try:
+        return Decimal(str(valor)) if valor not in (None, '') else None
+    except InvalidOperation:
+        raise ValueError(f'Número inválido: {valor!r}')
+
+
+def _fecha(valor, ahora):
+    if valor in (None, ''):
+        return ahora
+    fecha = valor if isinstance(valor, datetime) else parse_datetime(str(valor))
+    if fecha is None:
+        raise ValueError(f'Fecha inválida: {valor!r}')
+    return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+
+
+def _existentes(modelo, filas, campo):
+    ids = {fila[campo] for fila in filas if fila.get(campo)}
+    return set(modelo.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+
+def validar_carga(filas, usuario):
+    """
+    Arma los MovimientoInventario confirmados de la carga y su efecto en el
+    stock. Lanza CargaInvalida con todos los errores encontrados.
+    """
+    ahora = timezone.now()
+    productos = Producto.objects.select_related('uom_stock').in_bulk(
+        {fila.get('producto_id') for fila in filas if fila.get('producto_id')}
+    )
+    unidades = UnidadMedida.objects.in_bulk()
+    bodegas = _existentes(Bodega, filas, 'bodega_origen_id') | _existentes(Bodega, filas, 'bodega_destino_id')
+    proveedores = _existentes(Proveedor, filas, 'proveedor_id')
+    lotes = {
+        pk: (producto_id, bodega_id)
+        for pk, producto_id, bodega_id in Lote.objects
+        .filter(pk__in={fila['lote_id'] for fila in filas if fila.get('lote_id')})
+        .values_list('pk', 'producto_id', 'bodega_id')
+    }
+
+    movimientos, errores = [], []
+    stock = defaultdict(lambda: defaultdict(Decimal))   # (producto, bodega) -> campo -> delta
+    fechas = {}                                          # (producto, bodega) -> fecha más reciente
+    por_lote = defaultdict(Decimal)
+
+    for indice, fila in enumerate(filas):
+        try:
+            desconocidos = set(fila) - set(CAMPOS)
+            if desconocidos:
+                raise ValueError(f'Campos desconocidos: {", ".join(sorted(desconocidos))}')
+            if fila.get('tipo_movimiento') not in TIPOS:
+                raise ValueError(f'Tipo de movimiento inválido: {fila.get("tipo_movimiento")!r}')
+            producto = productos.get(fila.get('producto_id'))
+            if producto is None:
+                raise ValueError(f'Producto inexistente: {fila.get("producto_id")!r}')
+            unidad = unidades.get(fila.get('unidad_medida_id') or producto.uom_stock_id)
+            if unidad is None:
+                raise ValueError(f'Unidad de medida inexistente: {fila.get("unidad_medida_id")!r}')
+            for campo in ('bodega_origen_id', 'bodega_destino_id'):
+                if fila.get(campo) and fila[campo] not in bodegas:
+                    raise ValueError(f'Bodega inexistente: {fila[campo]!r}')
+            if fila.get('proveedor_id') and fila['proveedor_id'] not in proveedores:
+                raise ValueError(f'Proveedor inexistente: {fila["proveedor_id"]!r}')
+            exigir_fefo(fila['tipo_movimiento'], producto)
+            if fila.get('lote_id') and lotes.get(fila['lote_id'], (None,))[0] != producto.pk:
+                raise ValueError(f'El lote {fila["lote_id"]!r} no es del producto {producto.sku}')
+
+            cantidad = _decimal(fila.get('cantidad'))
+            if cantidad is None or cantidad == 0 or (cantidad < 0 and fila['tipo_movimiento'] != 'AJUSTE'):
+                raise ValueError('La cantidad debe ser positiva (solo un ajuste puede ser negativo)')
+
+            movimiento = MovimientoInventario(
+                **{campo: fila[campo] for campo in CAMPOS if fila.get(campo) not in (None, '')},
+            )
+            movimiento.fecha_movimiento = _fecha(fila.get('fecha_movimiento'), ahora)
+            movimiento.cantidad = cantidad
+            movimiento.unidad_medida_id = unidad.pk
+            movimiento.costo_unitario = _decimal(fila.get('costo_unitario'))
+            movimiento.costo_total = _decimal(fila.get('costo_total'))
+
+            cantidad_stock = convertir_a_stock(cantidad, unidad, producto)
+            efecto = efecto_en_stock(movimiento, cantidad_stock)
+        except (ValueError, TypeError, ErrorStock) as error:
+            errores.append((indice, str(error)))
+            continue
+
+        movimiento.usuario = usuario
+        movimiento.estado = 'CONFIRMADO'
+        movimiento.cantidad_stock = cantidad_stock
+        movimiento.fecha_confirmacion = ahora
+        movimiento.usuario_confirmacion = usuario
+        movimientos.append(movimiento)
+
+        for bodega_id, cambios in efecto.items():
+            clave = (producto.pk, bodega_id)
+            for campo, delta in cambios.items():
+                stock[clave][campo] += delta
+            fechas[clave] = max(fechas.get(clave, movimiento.fecha_movimiento), movimiento.fecha_movimiento)
+        if movimiento.lote_id:
+            # Como en confirmar_movimiento: el lote sigue el stock de su bodega
+            _, bodega_lote = lotes[movimiento.lote_id]
+            por_lote[movimiento.lote_id] += efecto.get(bodega_lote, {}).get('cantidad_disponible', 0)
+
+    if errores:
+        raise CargaInvalida(errores)
+    return movimientos, stock, fechas, por_lote
+
+
+def contabilizar_carga(clave, filas, usuario):
+    """
+    Contabiliza una carga de movimientos (lista de dicts con CAMPOS) en una
+    transacción. Retorna un ResultadoCarga; si la clave ya se contabilizó,
+    el de esa vez con `repetida=True`.
+
+    Lanza CargaInvalida si alguna fila tiene errores y StockInsuficiente si
+    el efecto neto de la carga deja negativo algún stock (no se aplica nada).
+    """
+    anterior = CargaMovimientos.objects.filter(clave=clave).first()
+    if anterior is not None:
+        return ResultadoCarga(anterior, repetida=True)
+
+    inicio = time.monotonic()
+    movimientos, stock, fechas, por_lote = validar_carga(filas, usuario)
+
+    try:
+        with transaction.atomic():
+            # La clave única hace de candado: una segunda carga con la misma
+            # clave espera aquí y falla al confirmarse la primera
+            carga = CargaMovimientos.objects.create(clave=clave, usuario=usuario)
+            for movimiento in movimientos:
+                movimiento.carga = carga
+            MovimientoInventario.objects.bulk_create(movimientos, batch_size=TAMANO_INSERCION)
+
+            for producto_id, bodega_id in sorted(stock):
+                aplicar_en_stock(producto_id, bodega_id, stock[(producto_id, bodega_id)], fechas[(producto_id, bodega_id)])
+            for lote_id in sorted(por_lote):
+                aplicar_en_lote(lote_id, por_lote[lote_id])
+            encolar_pares(stock)
+
+            carga.total_movimientos = len(movimientos)
+            carga.filas_stock = len(stock)
+            carga.segundos = time.monotonic() - inicio
+            carga.save(update_fields=['total_movimientos', 'filas_stock', 'segundos'])
+    except IntegrityError:
+        anterior = CargaMovimientos.objects.filter(clave=clave).first()
+        if anterior is None:
+            raise
+        return ResultadoCarga(anterior, repetida=True)
+
+    return ResultadoCarga(carga)
@@ -0,0 +1,205 @@
+"""
+Conciliación de stock: historial de movimientos vs. StockActual vs. lotes
+
+El saldo esperado de cada (producto, bodega) se recalcula desde los
+movimientos CONFIRMADOS (`saldos.variaciones` sobre todo el historial) con
+las mismas reglas de `inventario.stock`:
+
+- disponible = entradas (ingresos, devoluciones y transferencias recibidas
+  en la bodega destino) - salidas (salidas, transferencias y devoluciones
+  desde la bodega origen) + ajustes de la bodega origen
+- tránsito = transferencias confirmadas aún no recibidas en la destino
+
+y se compara con StockActual y, para productos que se despachan por lote
+(`stock.requiere_lote`: control por lote o perecibles), con la suma de
+`Lote.cantidad_disponible`.
+
+Cada bodega se concilia en un proceso aparte y, dentro de ella, por tramos
+de producto_id: cada tramo son unas pocas consultas agregadas (SUM con
+GROUP BY sobre los índices (bodega, producto)), así la memoria depende del
+tamaño del tramo y no del historial. Cada tramo corre en una transacción
+que primero bloquea sus filas de StockActual: un posting en curso termina
+antes de leer el historial y uno nuevo espera a que el tramo termine, así
+ambos lados se comparan en el mismo punto. Con `corregir` se ajusta StockActual
+al historial; las diferencias de lotes solo se informan, porque no hay
+forma de saber qué lote corregir.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Case, F, Max, Min, Q, Sum, When
+
+from maestros.models import Producto
+from .alertas import encolar_pares
+from .disponibilidad import invalidar
+from .models import Bodega, Lote, StockActual
+from .saldos import variaciones
+
+
+CERO = Decimal('0')
+
+# Productos por tramo
+TAMANO_TRAMO = 5000
+
+# Filas por UPDATE al corregir
+TAMANO_CORRECCION = 500
+
+
+@dataclass
+class Diferencia:
+    producto_id: int
+    bodega_id: int
+    campo: str          # 'disponible', 'transito' o 'lotes'
+    esperado: Decimal
+    actual: Decimal
+
+    @property
+    def diferencia(self):
+        return self.actual - self.esperado
+
+
+@dataclass
+class ResultadoBodega:
+    bodega_id: int
+    revisadas: int = 0
+    corregidas: int = 0
+    diferencias: list = field(default_factory=list)
+
+
+def saldos_esperados(bodega_id, desde, hasta):
+    """{producto_id: (disponible, tránsito)} según el historial, para producto_id en [desde, hasta)"""
+    saldos = variaciones(bodega_id=bodega_id, producto_id__gte=desde, producto_id__lt=hasta)
+    return {producto_id: tuple(saldo[:2]) for (producto_id, _), saldo in saldos.items()}
+
+
+def _tramos(desde, hasta, tamano):
+    while desde <= hasta:
+        yield desde, desde + tamano
+        desde += tamano
+
+
+def _conciliar_tramo(bodega_id, desde, hasta, corregir, resultado):
+    with transaction.atomic():
+        corregidos = _comparar_tramo(bodega_id, desde, hasta, corregir, resultado)
+    if corregidos:
+        encolar_pares(corregidos)
+        invalidar(producto_id for producto_id, _ in corregidos)
+
+
+def _comparar_tramo(bodega_id, desde, hasta, corregir, resultado):
+    """Compara (y corrige) un tramo dentro de la transacción en curso. Retorna los pares corregidos"""
+    # StockActual se lee bloqueado antes que el historial (ver el docstring del módulo)
+    actuales = {
+        producto_id: (pk, disponible, transito)
+        for pk, producto_id, disponible, transito in StockActual.objects.select_for_update()
+        .filter(bodega_id=bodega_id, producto_id__gte=desde, producto_id__lt=hasta)
+        .order_by('pk')
+        .values_list('pk', 'producto_id', 'cantidad_disponible', 'cantidad_transito')
+    }
+    esperados = saldos_esperados(bodega_id, desde, hasta)
+    # Misma regla que stock.requiere_lote
+    por_lote = set(
+        Producto.objects.filter(Q(control_por_lote=True) | Q(perishable=True), pk__gte=desde, pk__lt=hasta)
+        .values_list('pk', flat=True)
+    )
+    lotes = dict(
+        Lote.objects.filter(bodega_id=bodega_id, producto_id__in=por_lote)
+        .values('producto_id').order_by().annotate(total=Sum('cantidad_disponible'))
+        .values_list('producto_id', 'total')
+    ) if por_lote else {}
+
+    correcciones, faltantes, corregidos = [], [], []
+    for producto_id in sorted(set(esperados) | set(actuales)):
+        disponible, transito = esperados.get(producto_id, (CERO, CERO))
+        pk, disponible_actual, transito_actual = actuales.get(producto_id, (None, CERO, CERO))
+        resultado.revisadas += 1
+
+        diferencias = [
+            Diferencia(producto_id, bodega_id, campo, esperado, actual)
+            for campo, esperado, actual in (
+                ('disponible', disponible, disponible_actual),
+                ('transito', transito, transito_actual),
+            )
+            if esperado != actual
+        ]
+        if producto_id in por_lote and lotes.get(producto_id, CERO) != disponible_actual:
+            diferencias.append(
+                Diferencia(producto_id, bodega_id, 'lotes', disponible_actual, lotes.get(producto_id, CERO))
+            )
+        resultado.diferencias.extend(diferencias)
+
+        if corregir and any(d.campo != 'lotes' for d in diferencias):
+            corregidos.append((producto_id, bodega_id))
+            if pk is None:
+                faltantes.append(StockActual(producto_id=producto_id, bodega_id=bodega_id,
+                                             cantidad_disponible=disponible, cantidad_transito=transito))
+            else:
+                correcciones.append((pk, disponible - disponible_actual, transito - transito_actual))
+
+    if correcciones or faltantes:
+        resultado.corregidas += _corregir(correcciones, faltantes)
+    return corregidos
+
+
+def _corregir(correcciones, faltantes):
+    """
+    Ajusta StockActual sumando la diferencia (no fijando el valor) sobre las
+    filas que el tramo mantiene bloqueadas. Un UPDATE por cada
+    TAMANO_CORRECCION filas.
+    """
+    with transaction.atomic():
+        for i in range(0, len(correcciones), TAMANO_CORRECCION):
+            grupo = correcciones[i:i + TAMANO_CORRECCION]
+            valores = {}
+            for campo, posicion in (('cantidad_disponible', 1), ('cantidad_transito', 2)):
+                casos = [When(pk=fila[0], then=F(campo) + fila[posicion]) for fila in grupo if fila[posicion]]
+                if casos:
+                    valores[campo] = Case(*casos, default=F(campo))
+            StockActual.objects.filter(pk__in=[fila[0] for fila in grupo]).update(**valores)
+        StockActual.objects.bulk_create(faltantes, batch_size=TAMANO_CORRECCION, ignore_conflicts=True)
+    return len(correcciones) + len(faltantes)
+
+
+def conciliar_bodega(bodega_id, corregir=False, tamano=TAMANO_TRAMO):
+    """Concilia una bodega por tramos de producto_id. Retorna un ResultadoBodega"""
+    resultado = ResultadoBodega(bodega_id)
+    limites = Producto.objects.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+    if limites['minimo'] is None:
+        return resultado
+    for desde, hasta in _tramos(limites['minimo'], limites['maximo'], tamano):
+        _conciliar_tramo(bodega_id, desde, hasta, corregir, resultado)
+    return resultado
+
+
+def _iniciar_proceso():
+    # Con 'spawn' (macOS, Windows) el proceso hijo arranca sin Django
+    import django
+    django.setup()
+
+
+def _conciliar_en_proceso(bodega_id, corregir, tamano):
+    try:
+        return conciliar_bodega(bodega_id, corregir, tamano)
+    finally:
+        connections.close_all()
+
+
+def conciliar(bodegas=None, procesos=1, corregir=False, tamano=TAMANO_TRAMO):
+    """
+    Concilia las bodegas indicadas (o todas) y retorna sus ResultadoBodega a
+    medida que terminan. Con `procesos` > 1 cada bodega corre en un proceso.
+    """
+    bodegas = list(bodegas or Bodega.objects.order_by('pk').values_list('pk', flat=True))
+    if procesos <= 1 or len(bodegas) <= 1:
+        for bodega_id in bodegas:
+            yield conciliar_bodega(bodega_id, corregir, tamano)
+        return
+
+    # Los procesos hijos no deben heredar las conexiones abiertas del padre
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(procesos, len(bodegas)), initializer=_iniciar_proceso) as pool:
+        futuros = [pool.submit(_conciliar_en_proceso, bodega_id, corregir, tamano) for bodega_id in bodegas]
+        for futuro in futuros:
+            yield futuro.result()
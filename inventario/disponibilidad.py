@@ -0,0 +1,185 @@
+"""
+Caché de disponibilidad de stock por (producto, bodega) y por producto
+
+La disponibilidad (disponible, reservado, en tránsito) se lee mucho más de
+lo que cambia: fichas de producto, escáneres e integraciones. Se cachea
+por lectura (read-through) con claves que llevan la versión del producto:
+
+    disponibilidad:<producto>:<versión>:<bodega>
+    disponibilidad:<producto>:<versión>:total     (suma de todas las bodegas)
+
+Todo cambio de StockActual (contabilización, reservas, conciliación,
+admin) llama a `invalidar`, que sube la versión del producto al confirmarse
+la transacción: las entradas anteriores dejan de leerse y vencen solas
+(DISPONIBILIDAD_CACHE_TTL). Como la versión sube después del COMMIT, una
+lectura que llenó la caché con el valor anterior lo dejó bajo la versión
+vieja y nunca se sirve. Las versiones se inician con la hora en
+nanosegundos, así una versión desalojada de la caché no repite un número
+anterior.
+
+`disponibilidad` y `disponibilidad_total` atienden muchos SKU en una
+llamada: un get_many de versiones, uno de entradas y una consulta para los
+que faltan. Los aciertos y fallos se cuentan en la caché (`metricas`). Con
+varios procesos se necesita una caché compartida (Redis/Memcached); con la
+de memoria local cada proceso invalida solo la suya.
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import partial, reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from .models import StockActual
+
+
+PREFIJO = 'disponibilidad'
+
+ACIERTOS = f'{PREFIJO}:metricas:aciertos'
+FALLOS = f'{PREFIJO}:metricas:fallos'
+INVALIDACIONES = f'{PREFIJO}:metricas:invalidaciones'
+
+CERO = Decimal('0')
+
+
+@dataclass(frozen=True)
+class Disponibilidad:
+    disponible: Decimal = CERO
+    reservada: Decimal = CERO
+    transito: Decimal = CERO
+
+    @property
+    def libre(self):
+        """Lo que se puede reservar o vender"""
+        return self.disponible - self.reservada
+
+
+def _clave_version(producto_id):
+    return f'{PREFIJO}:version:{producto_id}'
+
+
+def _sumar(clave, cantidad=1):
+    if not cantidad:
+        return
+    try:
+        cache.incr(clave, cantidad)
+    except ValueError:
+        if not cache.add(clave, cantidad, timeout=None):
+            cache.incr(clave, cantidad)
+
+
+def _versiones(productos):
+    """{producto_id: versión vigente}, iniciando las que no están en la caché"""
+    claves = {producto_id: _clave_version(producto_id) for producto_id in productos}
+    encontradas = cache.get_many(claves.values())
+    versiones = {}
+    for producto_id, clave in claves.items():
+        if clave not in encontradas:
+            # Si otro proceso la inició al mismo tiempo, queda la suya
+            cache.add(clave, time.time_ns(), timeout=None)
+            encontradas[clave] = cache.get(clave)
+        versiones[producto_id] = encontradas[clave]
+    return versiones
+
+
+def _subir_versiones(productos):
+    for producto_id in productos:
+        try:
+            cache.incr(_clave_version(producto_id))
+        except ValueError:
+            cache.set(_clave_version(producto_id), time.time_ns(), timeout=None)
+    _sumar(INVALIDACIONES, len(productos))
+
+
+def invalidar(productos):
+    """Descarta la disponibilidad cacheada de los productos al confirmarse la transacción en curso"""
+    productos = set(productos)
+    if productos:
+        transaction.on_commit(partial(_subir_versiones, productos))
+
+
+def _leer(claves, calcular):
+    """
+    {llave: Disponibilidad} para `claves` ({llave: clave de caché}); las que
+    faltan se obtienen con `calcular(llaves)` y se guardan
+    """
+    encontradas = cache.get_many(claves.values())
+    resultado = {llave: encontradas[clave] for llave, clave in claves.items() if clave in encontradas}
+    faltan = [llave for llave in claves if llave not in resultado]
+    _sumar(ACIERTOS, len(resultado))
+    _sumar(FALLOS, len(faltan))
+    if faltan:
+        calculadas = calcular(faltan)
+        nuevas = {llave: calculadas.get(llave, Disponibilidad()) for llave in faltan}
+        cache.set_many({claves[llave]: valor for llave, valor in nuevas.items()},
+                       timeout=settings.DISPONIBILIDAD_CACHE_TTL)
+        resultado.update(nuevas)
+    return resultado
+
+
+def _de_stock(pares):
+    por_bodega = defaultdict(list)
+    for producto_id, bodega_id in pares:
+        por_bodega[bodega_id].append(producto_id)
+    filas = StockActual.objects.filter(reduce(or_, (
+        Q(bodega_id=bodega_id, producto_id__in=productos) for bodega_id, productos in por_bodega.items()
+    )))
+    return {
+        (producto_id, bodega_id): Disponibilidad(disponible, reservada, transito)
+        for producto_id, bodega_id, disponible, reservada, transito in filas.values_list(
+            'producto_id', 'bodega_id', 'cantidad_disponible', 'cantidad_reservada', 'cantidad_transito',
+        )
+    }
+
+
+def _totales(productos):
+    filas = (
+        StockActual.objects.filter(producto_id__in=productos)
+        .values('producto_id').order_by()
+        .annotate(disponible=Sum('cantidad_disponible'), reservada=Sum('cantidad_reservada'),
+                  transito=Sum('cantidad_transito'))
+        .values_list('producto_id', 'disponible', 'reservada', 'transito')
+    )
+    return {producto_id: Disponibilidad(*cantidades) for producto_id, *cantidades in filas}
+
+
+def disponibilidad(pares):
+    """{(producto_id, bodega_id): Disponibilidad} para los pares (cero si no hay stock)"""
+    pares = set(pares)
+    if not pares:
+        return {}
+    versiones = _versiones({producto_id for producto_id, _ in pares})
+    return _leer(
+        {(p, b): f'{PREFIJO}:{p}:{versiones[p]}:{b}' for p, b in pares},
+        _de_stock,
+    )
+
+
+def disponibilidad_total(productos):
+    """{producto_id: Disponibilidad} sumando todas las bodegas"""
+    productos = set(productos)
+    if not productos:
+        return {}
+    versiones = _versiones(productos)
+    return _leer({p: f'{PREFIJO}:{p}:{versiones[p]}:total' for p in productos}, _totales)
+
+
+def metricas():
+    """Aciertos, fallos e invalidaciones desde el último reinicio, con la tasa de aciertos"""
+    valores = cache.get_many([ACIERTOS, FALLOS, INVALIDACIONES])
+    aciertos, fallos = valores.get(ACIERTOS, 0), valores.get(FALLOS, 0)
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'invalidaciones': valores.get(INVALIDACIONES, 0),
+        'tasa_aciertos': round(aciertos / (aciertos + fallos), 4) if aciertos + fallos else None,
+    }
+
+
+def reiniciar_metricas():
+    cache.delete_many([ACIERTOS, FALLOS, INVALIDACIONES])
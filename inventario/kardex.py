@@ -0,0 +1,181 @@
+"""
+Kardex: movimientos de un producto en una bodega con saldo acumulado
+
+Cada fila es un movimiento confirmado que afecta a la bodega, con su efecto
+(cantidad en unidad de stock y valor a costo registrado) y el saldo después
+de él. El saldo es la existencia de la bodega, disponible + tránsito: una
+transferencia entra al kardex de la destino al despacharse y su recepción
+no cambia el saldo, así el orden por `fecha_movimiento` basta.
+
+Los saldos los calcula la base de datos con SUM() OVER (ORDER BY
+fecha_movimiento, id) sobre las filas de la página. La página se pide con
+cursor (keyset sobre los índices (bodega, producto, fecha_movimiento)) y el
+cursor lleva firmado el saldo con que termina la página anterior, así
+ninguna página recorre lo ya mostrado. La primera página parte del cierre
+diario (SaldoDiario) anterior a `desde` más los movimientos entre ambos.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Case, DecimalField, Q, Sum, Value, Window, When
+from django.db.models.expressions import RowRange
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import MovimientoInventario, SaldoDiario
+from .saldos import CANTIDAD, CERO, COSTO, COSTO_AJUSTE, inicio_del_dia
+
+
+TAMANO_PAGINA = 100
+MAXIMO_PAGINA = 1000
+
+SAL_CURSOR = 'inventario.kardex'
+
+DECIMAL = DecimalField(max_digits=18, decimal_places=6)
+
+
+@dataclass
+class PaginaKardex:
+    movimientos: list
+    saldo_inicial: Decimal
+    valor_inicial: Decimal
+    siguiente: str = None   # cursor de la página siguiente (None si es la última)
+
+
+def _efecto(bodega_id):
+    """Expresiones (cantidad, valor) con el signo del movimiento para la bodega"""
+    misma = Q(bodega_origen_id=bodega_id, bodega_destino_id=bodega_id)
+    entra = Q(bodega_destino_id=bodega_id, tipo_movimiento__in=['INGRESO', 'DEVOLUCION', 'TRANSFERENCIA'])
+    ajuste = Q(bodega_origen_id=bodega_id, tipo_movimiento='AJUSTE')
+    sale = Q(bodega_origen_id=bodega_id, tipo_movimiento__in=['SALIDA', 'TRANSFERENCIA', 'DEVOLUCION'])
+
+    cantidad = Case(
+        When(misma, then=Value(CERO)), When(entra, then=CANTIDAD), When(ajuste, then=CANTIDAD),
+        When(sale, then=-CANTIDAD), default=Value(CERO), output_field=DECIMAL,
+    )
+    valor = Case(
+        When(misma, then=Value(CERO)), When(entra, then=COSTO), When(ajuste, then=COSTO_AJUSTE),
+        When(sale, then=-COSTO), default=Value(CERO), output_field=DECIMAL,
+    )
+    return cantidad, valor
+
+
+def _movimientos(producto_id, bodega_id):
+    return MovimientoInventario.objects.filter(
+        Q(bodega_destino_id=bodega_id) | Q(bodega_origen_id=bodega_id),
+        estado='CONFIRMADO', producto_id=producto_id,
+    )
+
+
+def saldo_a(producto_id, bodega_id, momento):
+    """(saldo, valor) del kardex justo antes de `momento`"""
+    cierre = (
+        SaldoDiario.objects
+        .filter(producto_id=producto_id, bodega_id=bodega_id, fecha__lt=timezone.localdate(momento))
+        .order_by('-fecha')
+        .values_list('fecha', 'cantidad_disponible', 'cantidad_transito', 'valor')
+        .first()
+    )
+    movimientos = _movimientos(producto_id, bodega_id).filter(fecha_movimiento__lt=momento)
+    saldo = valor = CERO
+    if cierre is not None:
+        fecha, disponible, transito, valor = cierre
+        saldo = disponible + transito
+        movimientos = movimientos.filter(fecha_movimiento__gte=inicio_del_dia(fecha + timedelta(days=1)))
+
+    cantidad, costo = _efecto(bodega_id)
+    resto = movimientos.aggregate(
+        saldo=Coalesce(Sum(cantidad), Value(CERO), output_field=DECIMAL),
+        valor=Coalesce(Sum(costo), Value(CERO), output_field=DECIMAL),
+    )
+    return saldo + resto['saldo'], valor + resto['valor']
+
+
+def _alcance(producto_id, bodega_id, hasta):
+    """Kardex al que pertenece un cursor: su saldo no vale para otro"""
+    return [str(producto_id), None if bodega_id is None else str(bodega_id),
+            hasta.isoformat() if hasta is not None else None]
+
+
+def _leer_cursor(cursor, alcance):
+    try:
+        fecha, pk, saldo, valor, *origen = signing.loads(cursor, salt=SAL_CURSOR)
+        if origen != [alcance]:
+            raise ValueError('El cursor es de otro kardex')
+        return parse_datetime(fecha), int(pk), Decimal(saldo), Decimal(valor)
+    except (signing.BadSignature, ValueError, TypeError, ArithmeticError):
+        raise ValueError('Cursor inválido')
+
+
+def kardex(producto_id, bodega_id, desde=None, hasta=None, cursor=None, limite=TAMANO_PAGINA):
+    """
+    Página del kardex en [desde, hasta] a partir de `cursor` (el `siguiente`
+    de la página anterior). Lanza ValueError si el cursor no es válido.
+    """
+    limite = max(1, min(int(limite), MAXIMO_PAGINA))
+    movimientos = _movimientos(producto_id, bodega_id)
+    if hasta is not None:
+        movimientos = movimientos.filter(fecha_movimiento__lte=hasta)
+
+    if cursor:
+        fecha, pk, saldo, valor = _leer_cursor(cursor, _alcance(producto_id, bodega_id, hasta))
+        movimientos = movimientos.filter(
+            Q(fecha_movimiento__gt=fecha) | Q(fecha_movimiento=fecha, pk__gt=pk)
+        )
+    elif desde is not None:
+        saldo, valor = saldo_a(producto_id, bodega_id, desde)
+        movimientos = movimientos.filter(fecha_movimiento__gte=desde)
+    else:
+        saldo = valor = CERO
+
+    ids = list(movimientos.order_by('fecha_movimiento', 'pk').values_list('pk', flat=True)[:limite + 1])
+    hay_mas = len(ids) > limite
+    ids = ids[:limite]
+
+    # Acumulados solo sobre las filas de la página: el resto viene en el saldo inicial
+    cantidad, costo = _efecto(bodega_id)
+    orden = ['fecha_movimiento', 'pk']
+    acumulado = RowRange(start=None, end=0)
+    filas = list(
+        MovimientoInventario.objects.filter(pk__in=ids)
+        .annotate(
+            efecto=cantidad,
+            efecto_valor=costo,
+            acumulado=Window(Sum(cantidad), order_by=orden, frame=acumulado),
+            acumulado_valor=Window(Sum(costo), order_by=orden, frame=acumulado),
+        )
+        .order_by(*orden)
+        .values(
+            'pk', 'fecha_movimiento', 'tipo_movimiento', 'bodega_origen_id', 'bodega_destino_id',
+            'documento_referencia', 'lote_id', 'efecto', 'efecto_valor', 'acumulado', 'acumulado_valor',
+        )
+    )
+
+    resultado = []
+    for fila in filas:
+        resultado.append({
+            'id': fila['pk'],
+            'fecha_movimiento': fila['fecha_movimiento'],
+            'tipo_movimiento': fila['tipo_movimiento'],
+            'bodega_origen': fila['bodega_origen_id'],
+            'bodega_destino': fila['bodega_destino_id'],
+            'documento_referencia': fila['documento_referencia'],
+            'lote': fila['lote_id'],
+            'cantidad': fila['efecto'],
+            'valor': fila['efecto_valor'],
+            'saldo': saldo + fila['acumulado'],
+            'saldo_valor': valor + fila['acumulado_valor'],
+        })
+
+    siguiente = None
+    if hay_mas and resultado:
+        ultima = resultado[-1]
+        siguiente = signing.dumps(
+            [ultima['fecha_movimiento'].isoformat(), ultima['id'], str(ultima['saldo']), str(ultima['saldo_valor']),
+             _alcance(producto_id, bodega_id, hasta)],
+            salt=SAL_CURSOR,
+        )
+    return PaginaKardex(resultado, saldo, valor, siguiente)
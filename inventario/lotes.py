@@ -0,0 +1,153 @@
+"""
+Salidas de productos con lote: asignación FEFO (primero en vencer, primero en salir)
+
+Para un producto con `control_por_lote` o `perishable`, `registrar_salida`
+reparte la cantidad entre los lotes ACTIVO de la bodega en orden de
+`fecha_vencimiento` (los lotes sin fecha al final, por antigüedad) y
+registra un movimiento SALIDA confirmado por lote. Los lotes BLOQUEADO,
+VENCIDO o AGOTADO no se consideran, tampoco los que vencen hoy o antes
+aunque `procesar_vencimientos` aún no los marque, y de cada lote se usa lo
+disponible menos lo reservado.
+
+La asignación se planifica leyendo los lotes por el índice (producto,
+bodega, estado, fecha_vencimiento) sin bloquearlos, de a TAMANO_LECTURA y
+solo hasta cubrir la cantidad. Después se bloquean (SELECT ... FOR UPDATE)
+únicamente los lotes elegidos y se vuelve a verificar su saldo: si otra
+salida los consumió entretanto, se planifica de nuevo. Con los lotes
+bloqueados, el descuento es un solo UPDATE y los movimientos un bulk_create,
+así el número de sentencias no depende de cuántos lotes se usen.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .alertas import encolar_pares
+from .models import Lote, MovimientoInventario
+from .stock import MovimientoInvalido, StockInsuficiente, aplicar_en_stock, convertir_a_stock, requiere_lote
+
+
+CERO = Decimal('0')
+
+# Lotes leídos por consulta al planificar
+TAMANO_LECTURA = 100
+
+# Planificaciones antes de desistir si otras salidas consumen los lotes elegidos
+INTENTOS = 3
+
+LIBRE = F('cantidad_disponible') - F('cantidad_reservada')
+
+
+@dataclass
+class Asignacion:
+    lote_id: int
+    cantidad: Decimal
+    fecha_vencimiento: object = None
+    costo_unitario: Decimal = None
+
+
+def _candidatos(producto_id, bodega_id, hoy):
+    """Lotes utilizables en orden FEFO: (pk, libre, fecha_vencimiento, costo_unitario)"""
+    lotes = (
+        Lote.objects
+        .filter(producto_id=producto_id, bodega_id=bodega_id, estado='ACTIVO')
+        .annotate(libre=LIBRE)
+        .filter(libre__gt=0)
+    )
+    campos = ('pk', 'libre', 'fecha_vencimiento', 'costo_unitario')
+    yield from (
+        lotes.filter(fecha_vencimiento__gt=hoy).order_by('fecha_vencimiento', 'pk')
+        .values_list(*campos).iterator(chunk_size=TAMANO_LECTURA)
+    )
+    yield from (
+        lotes.filter(fecha_vencimiento__isnull=True).order_by('pk')
+        .values_list(*campos).iterator(chunk_size=TAMANO_LECTURA)
+    )
+
+
+def asignar_lotes(producto_id, bodega_id, cantidad, hoy=None):
+    """
+    Reparto FEFO de `cantidad` (en unidad de stock) entre los lotes de la
+    bodega, sin bloquearlos. Retorna [Asignacion, ...] en orden de salida;
+    lanza StockInsuficiente si los lotes no alcanzan.
+    """
+    hoy = hoy or timezone.localdate()
+    asignaciones, restante = [], cantidad
+    for lote_id, libre, vencimiento, costo in _candidatos(producto_id, bodega_id, hoy):
+        usada = min(libre, restante)
+        asignaciones.append(Asignacion(lote_id, usada, vencimiento, costo))
+        restante -= usada
+        if restante <= 0:
+            return asignaciones
+    raise StockInsuficiente(
+        f'Los lotes del producto {producto_id} en la bodega {bodega_id} no alcanzan: faltan {restante}'
+    )
+
+
+def _bloquear(asignaciones):
+    """Bloquea los lotes asignados; True si todos siguen cubriendo su cantidad"""
+    libres = dict(
+        Lote.objects.select_for_update()
+        .filter(pk__in=[asignacion.lote_id for asignacion in asignaciones], estado='ACTIVO')
+        .annotate(libre=LIBRE)
+        .order_by('pk')
+        .values_list('pk', 'libre')
+    )
+    return all(libres.get(asignacion.lote_id, CERO) >= asignacion.cantidad for asignacion in asignaciones)
+
+
+def registrar_salida(producto, bodega_id, cantidad, usuario, unidad=None, fecha=None, **datos):
+    """
+    Registra la salida de `cantidad` (en `unidad`, por defecto la de stock)
+    con asignación FEFO: un movimiento SALIDA confirmado por lote, en unidad
+    de stock y al costo del lote. `datos` son campos adicionales de los
+    movimientos (documento_referencia, documento_padre_*, observaciones...).
+    Retorna los movimientos en orden de salida.
+
+    Lanza MovimientoInvalido si el producto no se controla por lote y
+    StockInsuficiente si no alcanza el stock o los lotes (no se aplica nada).
+    """
+    if not requiere_lote(producto):
+        raise MovimientoInvalido(f'El producto {producto.sku} no se controla por lote')
+    cantidad = convertir_a_stock(cantidad, unidad or producto.uom_stock, producto)
+    if cantidad <= 0:
+        raise MovimientoInvalido('La cantidad debe ser positiva')
+    ahora = timezone.now()
+    fecha = fecha or ahora
+    costo = datos.pop('costo_unitario', None)
+
+    with transaction.atomic():
+        # Mismo orden que confirmar_movimiento: stock de la bodega y luego lotes
+        aplicar_en_stock(producto.pk, bodega_id, {'cantidad_disponible': -cantidad}, fecha)
+        for _ in range(INTENTOS):
+            asignaciones = asignar_lotes(producto.pk, bodega_id, cantidad, timezone.localdate(fecha))
+            if _bloquear(asignaciones):
+                break
+        else:
+            raise StockInsuficiente(f'Los lotes del producto {producto.sku} cambiaron durante la asignación')
+
+        usados = Lote.objects.filter(pk__in=[asignacion.lote_id for asignacion in asignaciones])
+        usados.update(
+            cantidad_disponible=Case(*[
+                When(pk=asignacion.lote_id, then=F('cantidad_disponible') - asignacion.cantidad)
+                for asignacion in asignaciones
+            ], default=F('cantidad_disponible')),
+            updated_at=ahora,
+        )
+        usados.filter(cantidad_disponible__lte=0).update(estado='AGOTADO')
+
+        movimientos = MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                tipo_movimiento='SALIDA', fecha_movimiento=fecha, producto=producto, bodega_origen_id=bodega_id,
+                cantidad=asignacion.cantidad, unidad_medida_id=producto.uom_stock_id,
+                cantidad_stock=asignacion.cantidad, lote_id=asignacion.lote_id,
+                costo_unitario=asignacion.costo_unitario if asignacion.costo_unitario is not None else costo,
+                usuario=usuario, estado='CONFIRMADO', fecha_confirmacion=ahora, usuario_confirmacion=usuario,
+                **datos,
+            )
+            for asignacion in asignaciones
+        ])
+        encolar_pares([(producto.pk, bodega_id)])
+    return movimientos
@@ -0,0 +1,139 @@
+"""
+Mide las reservas de stock con muchos clientes simultáneos sobre un mismo SKU
+
+Cada cliente (un hilo con su propia conexión) reserva unidades del mismo
+producto y bodega y libera una de cada `--liberar` reservas, como un pedido
+anulado. Al final verifica que no hubo sobreventa: lo reservado es la suma
+de las reservas activas y nunca supera el disponible.
+
+Los datos sintéticos se confirman (los clientes no verían una transacción
+abierta) y se borran al terminar.
+
+Uso:
+    python manage.py benchmark_reservas
+    python manage.py benchmark_reservas --clientes 64 --operaciones 500 --stock 10000
+"""
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from inventario.models import Bodega, Reserva, StockActual
+from inventario.reservas import liberar_reserva, reservar
+from inventario.stock import StockInsuficiente
+from maestros.models import Categoria, Producto, UnidadMedida
+
+
+CODIGO = 'BENCH-RES'
+
+
+class Command(BaseCommand):
+    help = 'Mide el throughput de reservas de stock con clientes concurrentes sobre un SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=32,
+                            help='Clientes simultáneos (default: 32)')
+        parser.add_argument('--operaciones', type=int, default=200,
+                            help='Reservas que intenta cada cliente (default: 200)')
+        parser.add_argument('--stock', type=int, default=2000,
+                            help='Unidades disponibles del SKU (default: 2000)')
+        parser.add_argument('--liberar', type=int, default=4,
+                            help='Liberar una de cada N reservas (default: 4; 0 = nunca)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Motor: {connection.vendor} | clientes: {options["clientes"]} | '
+                          f'stock: {options["stock"]}')
+        producto, bodega = self._poblar(options['stock'])
+        try:
+            resultados = self._medir(producto, bodega, options)
+            self._informar(producto, bodega, resultados)
+        finally:
+            self._limpiar(producto, bodega)
+
+    def _poblar(self, stock):
+        unidad, _ = UnidadMedida.objects.get_or_create(codigo='BENCH', defaults={'nombre': 'Benchmark'})
+        categoria, _ = Categoria.objects.get_or_create(nombre=CODIGO)
+        producto = Producto.objects.create(
+            sku=CODIGO, nombre='Reservas concurrentes', categoria=categoria,
+            uom_compra=unidad, uom_venta=unidad, uom_stock=unidad,
+        )
+        bodega = Bodega.objects.create(codigo=CODIGO, nombre='Benchmark de reservas')
+        StockActual.objects.create(producto=producto, bodega=bodega, cantidad_disponible=Decimal(stock))
+        return producto, bodega
+
+    def _medir(self, producto, bodega, options):
+        resultados = {'reservas': 0, 'rechazadas': 0, 'liberadas': 0, 'errores': [], 'latencias': []}
+        candado = threading.Lock()
+        inicio = threading.Barrier(options['clientes'] + 1)
+
+        def cliente():
+            propios = {'reservas': 0, 'rechazadas': 0, 'liberadas': 0, 'errores': [], 'latencias': []}
+            try:
+                inicio.wait()
+                for i in range(options['operaciones']):
+                    antes = time.perf_counter()
+                    try:
+                        reserva = reservar(producto, bodega.pk, Decimal('1'))
+                        propios['reservas'] += 1
+                        if options['liberar'] and i % options['liberar'] == 0:
+                            liberar_reserva(reserva)
+                            propios['liberadas'] += 1
+                    except StockInsuficiente:
+                        propios['rechazadas'] += 1
+                    except Exception as error:
+                        propios['errores'].append(error)
+                    propios['latencias'].append((time.perf_counter() - antes) * 1000)
+            finally:
+                connection.close()
+                with candado:
+                    for clave, valor in propios.items():
+                        resultados[clave] += valor
+
+        hilos = [threading.Thread(target=cliente) for _ in range(options['clientes'])]
+        for hilo in hilos:
+            hilo.start()
+        inicio.wait()
+        comienzo = time.perf_counter()
+        for hilo in hilos:
+            hilo.join()
+        resultados['segundos'] = time.perf_counter() - comienzo
+        return resultados
+
+    def _informar(self, producto, bodega, resultados):
+        intentos = resultados['reservas'] + resultados['rechazadas'] + len(resultados['errores'])
+        latencias = sorted(resultados['latencias']) or [0]
+        self.stdout.write(
+            f'{intentos} intentos en {resultados["segundos"]:.2f} s: '
+            f'{intentos / resultados["segundos"]:.0f} op/s | {resultados["reservas"]} reservas, '
+            f'{resultados["liberadas"]} liberadas, {resultados["rechazadas"]} rechazadas por stock'
+        )
+        self.stdout.write(
+            f'Latencia: mediana {statistics.median(latencias):.1f} ms, '
+            f'p99 {latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))]:.1f} ms'
+        )
+        for error in resultados['errores'][:5]:
+            self.stdout.write(self.style.WARNING(f'Error: {error!r}'))
+
+        fila = StockActual.objects.get(producto=producto, bodega=bodega)
+        activas = Reserva.objects.filter(producto=producto, bodega=bodega, estado='ACTIVA').aggregate(
+            total=Sum('cantidad'),
+        )['total'] or Decimal('0')
+        if fila.cantidad_reservada == activas and fila.cantidad_reservada <= fila.cantidad_disponible:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Sin sobreventa: reservado {fila.cantidad_reservada} de {fila.cantidad_disponible}'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'❌ Inconsistencia: reservado {fila.cantidad_reservada}, reservas activas {activas}, '
+                f'disponible {fila.cantidad_disponible}'
+            ))
+
+    def _limpiar(self, producto, bodega):
+        # Las reservas y la cola de alertas del producto se borran en cascada
+        StockActual.objects.filter(producto=producto).delete()
+        producto.delete()
+        bodega.delete()
@@ -0,0 +1,34 @@
+"""
+Cierre diario de saldos de stock (tarea nocturna)
+
+Uso:
+    python manage.py cerrar_saldos                       # días pendientes y afectados por cambios
+    python manage.py cerrar_saldos --desde 2025-01-01    # recalcular desde una fecha
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from inventario.saldos import cerrar_saldos
+
+
+class Command(BaseCommand):
+    help = 'Guarda el saldo de cierre de cada día por producto y bodega'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde',
+                            help='Recalcular los cierres desde esta fecha (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = parse_date(options['desde'])
+            if desde is None:
+                raise CommandError(f"Fecha inválida: {options['desde']}")
+
+        desde, hasta, creadas = cerrar_saldos(desde)
+        if desde > hasta:
+            self.stdout.write('Sin días por cerrar')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ cierres del {desde:%Y-%m-%d} al {hasta:%Y-%m-%d}: {creadas} saldos'
+        ))
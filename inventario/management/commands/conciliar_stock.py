@@ -0,0 +1,66 @@
+"""
+Concilia StockActual y los lotes contra el historial de movimientos confirmados
+
+Uso:
+    python manage.py conciliar_stock --procesos 4
+    python manage.py conciliar_stock --bodega 3 --reporte diferencias.csv
+    python manage.py conciliar_stock --procesos 4 --corregir
+"""
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.conciliacion import TAMANO_TRAMO, conciliar
+from inventario.models import Bodega
+from maestros.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los saldos desde los movimientos y reporta (o corrige) las diferencias con StockActual y lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bodega', action='append', type=int,
+                            help='ID de bodega a conciliar (repetible). Por defecto, todas')
+        parser.add_argument('--procesos', type=int, default=1,
+                            help='Bodegas que se concilian en paralelo (default: 1)')
+        parser.add_argument('--tramo', type=int, default=TAMANO_TRAMO,
+                            help=f'Productos por tramo de consulta (default: {TAMANO_TRAMO})')
+        parser.add_argument('--reporte',
+                            help='Archivo CSV donde escribir todas las diferencias')
+        parser.add_argument('--corregir', action='store_true',
+                            help='Ajustar StockActual al historial (las diferencias de lotes solo se reportan)')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        codigos = dict(Bodega.objects.values_list('pk', 'codigo'))
+        diferencias, revisadas, corregidas = [], 0, 0
+
+        for resultado in conciliar(options['bodega'], options['procesos'], options['corregir'], options['tramo']):
+            revisadas += resultado.revisadas
+            corregidas += resultado.corregidas
+            diferencias.extend(resultado.diferencias)
+            icono = '⚠️ ' if resultado.diferencias else '✅'
+            self.stdout.write(
+                f'{icono} {codigos.get(resultado.bodega_id, resultado.bodega_id)}: '
+                f'{resultado.revisadas} saldos, {len(resultado.diferencias)} diferencias'
+                + (f', {resultado.corregidas} corregidos' if options['corregir'] else '')
+            )
+
+        if options['reporte']:
+            skus = dict(
+                Producto.objects.filter(pk__in={d.producto_id for d in diferencias}).values_list('pk', 'sku')
+            )
+            with open(options['reporte'], 'w', newline='', encoding='utf-8') as archivo:
+                writer = csv.writer(archivo)
+                writer.writerow(['producto_id', 'sku', 'bodega_id', 'bodega', 'campo', 'esperado', 'actual', 'diferencia'])
+                for d in diferencias:
+                    writer.writerow([d.producto_id, skus.get(d.producto_id), d.bodega_id, codigos.get(d.bodega_id),
+                                     d.campo, d.esperado, d.actual, d.diferencia])
+
+        estilo = self.style.WARNING if diferencias else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f'{revisadas} saldos revisados, {len(diferencias)} diferencias'
+            + (f', {corregidas} filas corregidas' if options['corregir'] else '')
+            + f' en {time.monotonic() - inicio:.1f}s'
+        ))
@@ -0,0 +1,20 @@
+"""
+Generación de alertas de stock (SIN_STOCK, BAJO_STOCK, SOBRE_STOCK)
+
+Uso:
+    python manage.py evaluar_alertas_stock
+"""
+from django.core.management.base import BaseCommand
+
+from inventario.alertas import evaluar_alertas_stock
+
+
+class Command(BaseCommand):
+    help = 'Crea las alertas de stock nuevas y resuelve las que ya no aplican'
+
+    def handle(self, *args, **options):
+        resultado = evaluar_alertas_stock()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {resultado.creadas} alertas nuevas, {resultado.resueltas} resueltas '
+            f'({resultado.segundos:.1f} s)'
+        ))
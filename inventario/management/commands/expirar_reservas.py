@@ -0,0 +1,35 @@
+"""
+Worker que libera las reservas de stock vencidas
+
+Uso:
+    python manage.py expirar_reservas           # libera las vencidas y termina
+    python manage.py expirar_reservas --loop    # queda revisando
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.reservas import expirar_reservas
+
+
+class Command(BaseCommand):
+    help = 'Libera en bloque las reservas de stock cuyo plazo venció'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='No terminar: seguir revisando las reservas vencidas')
+        parser.add_argument('--intervalo', type=float, default=30.0,
+                            help='Segundos entre revisiones (default: 30)')
+
+    def handle(self, *args, **options):
+        while True:
+            resultado = expirar_reservas()
+            if resultado.expiradas:
+                self.stdout.write(
+                    f'⏱️ {resultado.expiradas} reservas expiradas en {resultado.pares} filas de stock '
+                    f'({resultado.segundos:.2f} s)'
+                )
+
+            if not options['loop']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,39 @@
+"""
+Exportación analítica (Parquet) de movimientos de inventario y stock
+
+Uso:
+    python manage.py exportar_analitica                      # incremental, a ANALITICA_DIR
+    python manage.py exportar_analitica --destino /datos/lili
+    python manage.py exportar_analitica --completo --destino /datos/vacio
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.analitica import exportar_analitica
+
+
+class Command(BaseCommand):
+    help = 'Exporta a Parquet los movimientos nuevos o modificados y una foto del stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--destino',
+                            help='Carpeta de destino (default: ANALITICA_DIR)')
+        parser.add_argument('--completo', action='store_true',
+                            help='Ignorar la marca y exportar todos los movimientos (usar un destino vacío)')
+        parser.add_argument('--sin-stock', action='store_true',
+                            help='No exportar la foto del stock')
+
+    def handle(self, *args, **options):
+        try:
+            resultado = exportar_analitica(options['destino'], completo=options['completo'],
+                                           stock=not options['sin_stock'])
+        except ImproperlyConfigured as error:
+            raise CommandError(str(error))
+
+        movimientos = resultado['movimientos']
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ movimientos: {movimientos['filas']} filas en {len(movimientos['archivos'])} archivos "
+            f"(hasta {movimientos['hasta']:%Y-%m-%d %H:%M:%S})"
+        ))
+        if 'stock' in resultado:
+            self.stdout.write(self.style.SUCCESS(f"✅ stock: {resultado['stock']['filas']} filas"))
@@ -0,0 +1,23 @@
+"""
+Vencimiento diario de lotes: estados VENCIDO/AGOTADO y alertas POR_VENCER/VENCIDO
+
+Uso:
+    python manage.py procesar_vencimientos
+"""
+from django.core.management.base import BaseCommand
+
+from inventario.vencimientos import procesar_vencimientos
+
+
+class Command(BaseCommand):
+    help = 'Marca los lotes vencidos y genera las alertas de vencimiento de los días pendientes'
+
+    def handle(self, *args, **options):
+        resultado = procesar_vencimientos()
+        if resultado.desde is not None and resultado.desde > resultado.hasta:
+            self.stdout.write('Sin días por procesar')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {resultado.vencidos} lotes vencidos, {resultado.agotados} agotados, '
+            f'{resultado.alertas} alertas nuevas'
+        ))
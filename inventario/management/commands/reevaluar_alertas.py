@@ -0,0 +1,35 @@
+"""
+Worker de la reevaluación incremental de alertas de stock
+
+Uso:
+    python manage.py reevaluar_alertas           # procesa la cola y termina
+    python manage.py reevaluar_alertas --loop    # queda escuchando la cola
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.alertas import reevaluar_alertas
+
+
+class Command(BaseCommand):
+    help = 'Reevalúa las alertas de stock de los pares (producto, bodega) modificados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='No terminar: seguir revisando la cola')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos de espera cuando la cola está vacía (default: 2)')
+
+    def handle(self, *args, **options):
+        while True:
+            resultado = reevaluar_alertas()
+            if resultado.pares:
+                self.stdout.write(
+                    f'🔔 {resultado.pares} pares: {resultado.creadas} alertas nuevas, '
+                    f'{resultado.resueltas} resueltas ({resultado.segundos:.2f} s)'
+                )
+
+            if not options['loop']:
+                break
+            time.sleep(options['intervalo'])
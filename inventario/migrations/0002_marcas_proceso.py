@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0005_trabajos_exportacion'),
+        ('inventario', '0001_initial'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaProceso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('hasta', models.DateTimeField(blank=True, help_text='Los registros anteriores a esta fecha ya se procesaron', null=True)),
+                ('filas', models.BigIntegerField(default=0, help_text='Filas procesadas en total')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Marca de Proceso',
+                'verbose_name_plural': 'Marcas de Proceso',
+                'db_table': 'marcas_proceso',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['updated_at'], name='movimientos_updated_62ec4c_idx'),
+        ),
+    ]
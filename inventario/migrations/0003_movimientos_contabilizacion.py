@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0002_marcas_proceso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='cantidad_stock',
+            field=models.DecimalField(blank=True, decimal_places=6, help_text='Cantidad en la unidad de stock del producto (al confirmar)', max_digits=18, null=True),
+        ),
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='fecha_recepcion',
+            field=models.DateTimeField(blank=True, help_text='Recepción en la bodega destino (transferencias)', null=True),
+        ),
+    ]
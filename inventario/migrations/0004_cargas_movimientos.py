@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0005_trabajos_exportacion'),
+        ('inventario', '0003_movimientos_contabilizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaMovimientos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(help_text='Identificador de la carga en el sistema de origen (POS, recepción)', max_length=100, unique=True)),
+                ('total_movimientos', models.PositiveIntegerField(default=0)),
+                ('filas_stock', models.PositiveIntegerField(default=0, help_text='Filas de StockActual actualizadas')),
+                ('segundos', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='autenticacion.usuario')),
+            ],
+            options={
+                'verbose_name': 'Carga de Movimientos',
+                'verbose_name_plural': 'Cargas de Movimientos',
+                'db_table': 'cargas_movimientos',
+            },
+        ),
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='carga',
+            field=models.ForeignKey(blank=True, help_text='Carga masiva en la que se registró el movimiento', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='inventario.cargamovimientos'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0005_trabajos_exportacion'),
+        ('inventario', '0004_cargas_movimientos'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['bodega', 'producto'], name='lotes_bodega__2d10de_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['bodega_destino', 'producto', 'estado'], name='movimientos_bodega__e91db0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['bodega_origen', 'producto', 'estado'], name='movimientos_bodega__ff9d1d_idx'),
+        ),
+    ]
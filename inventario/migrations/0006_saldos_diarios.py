@@ -0,0 +1,71 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0005_trabajos_exportacion'),
+        ('inventario', '0005_indices_conciliacion'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('cantidad_disponible', models.DecimalField(decimal_places=6, default=Decimal('0'), max_digits=18)),
+                ('cantidad_transito', models.DecimalField(decimal_places=6, default=Decimal('0'), max_digits=18)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Saldo Diario',
+                'verbose_name_plural': 'Saldos Diarios',
+                'db_table': 'saldos_diarios',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='movimientoinventario',
+            name='movimientos_bodega__e91db0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='movimientoinventario',
+            name='movimientos_bodega__ff9d1d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['bodega_destino', 'producto', 'fecha_movimiento'], name='movimientos_bodega__6fac25_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['bodega_origen', 'producto', 'fecha_movimiento'], name='movimientos_bodega__10db60_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['fecha_recepcion'], name='movimientos_fecha_r_4f8b53_idx'),
+        ),
+        migrations.AddField(
+            model_name='saldodiario',
+            name='bodega',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventario.bodega'),
+        ),
+        migrations.AddField(
+            model_name='saldodiario',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='maestros.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='saldodiario',
+            index=models.Index(fields=['fecha'], name='saldos_diar_fecha_aea498_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='saldodiario',
+            unique_together={('producto', 'bodega', 'fecha')},
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:51
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0006_saldos_diarios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saldodiario',
+            name='valor',
+            field=models.DecimalField(decimal_places=6, default=Decimal('0'), help_text='Costo acumulado de disponible + tránsito (kardex valorizado)', max_digits=18),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0005_trabajos_exportacion'),
+        ('inventario', '0007_saldo_diario_valor'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alertastock',
+            index=models.Index(fields=['producto', 'bodega', 'tipo_alerta', 'estado'], name='alertas_sto_product_f3c0b8_idx'),
+        ),
+    ]
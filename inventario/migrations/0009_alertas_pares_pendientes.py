@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0008_indice_alertas'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParPendienteAlerta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cambiado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventario.bodega')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='maestros.producto')),
+            ],
+            options={
+                'verbose_name': 'Par Pendiente de Alertas',
+                'verbose_name_plural': 'Pares Pendientes de Alertas',
+                'db_table': 'alertas_pares_pendientes',
+                'unique_together': {('producto', 'bodega')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0009_alertas_pares_pendientes'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['producto', 'bodega', 'estado', 'fecha_vencimiento'], name='lotes_product_cc855e_idx'),
+        ),
+    ]
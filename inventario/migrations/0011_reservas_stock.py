@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autenticacion', '0005_trabajos_exportacion'),
+        ('inventario', '0010_indice_lotes_fefo'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.DecimalField(decimal_places=6, help_text='En unidad de stock', max_digits=18)),
+                ('estado', models.CharField(choices=[('ACTIVA', 'Activa'), ('CONFIRMADA', 'Confirmada'), ('LIBERADA', 'Liberada'), ('EXPIRADA', 'Expirada')], default='ACTIVA', max_length=20)),
+                ('expira_en', models.DateTimeField()),
+                ('documento_referencia', models.CharField(blank=True, help_text='Pedido o documento que reserva', max_length=50, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventario.bodega')),
+                ('lote', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='inventario.lote')),
+                ('movimiento', models.ForeignKey(blank=True, help_text='Salida registrada al confirmar la reserva', null=True, on_delete=django.db.models.deletion.PROTECT, to='inventario.movimientoinventario')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='maestros.producto')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='autenticacion.usuario')),
+            ],
+            options={
+                'verbose_name': 'Reserva',
+                'verbose_name_plural': 'Reservas',
+                'db_table': 'reservas_stock',
+                'indexes': [models.Index(fields=['estado', 'expira_en'], name='reservas_st_estado_677587_idx'), models.Index(fields=['producto', 'bodega'], name='reservas_st_product_116d66_idx')],
+            },
+        ),
+    ]
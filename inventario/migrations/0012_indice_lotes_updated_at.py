@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0011_reservas_stock'),
+        ('maestros', '0003_producto_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['updated_at'], name='lotes_updated_f5d986_idx'),
+        ),
+    ]
@@ -65,6 +65,11 @@ class Lote(models.Model):
             models.Index(fields=['producto']),
             models.Index(fields=['fecha_vencimiento']),
             models.Index(fields=['estado']),
+            models.Index(fields=['bodega', 'producto']),
+            # Asignación FEFO de salidas (inventario.lotes)
+            models.Index(fields=['producto', 'bodega', 'estado', 'fecha_vencimiento']),
+            # Lotes cambiados desde la última corrida de vencimientos (inventario.vencimientos)
+            models.Index(fields=['updated_at']),
         ]
 
     def __str__(self):
@@ -108,6 +113,8 @@ class MovimientoInventario(models.Model):
                                      help_text='Obligatorio para INGRESO y TRANSFERENCIA')
     cantidad = models.DecimalField(max_digits=18, decimal_places=6)
     unidad_medida = models.ForeignKey(UnidadMedida, on_delete=models.PROTECT)
+    cantidad_stock = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True, 
+                                       help_text='Cantidad en la unidad de stock del producto (al confirmar)')
     costo_unitario = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
     costo_total = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
     lote = models.ForeignKey(Lote, on_delete=models.PROTECT, null=True, blank=True, 
@@ -130,6 +137,11 @@ class MovimientoInventario(models.Model):
     usuario_confirmacion = models.ForeignKey(Usuario, on_delete=models.PROTECT, null=True, blank=True, 
                                            related_name='movimientos_confirmados',
                                            help_text='Usuario que confirmó el movimiento')
+    fecha_recepcion = models.DateTimeField(null=True, blank=True, 
+                                         help_text='Recepción en la bodega destino (transferencias)')
+    carga = models.ForeignKey('CargaMovimientos', on_delete=models.PROTECT, null=True, blank=True, 
+                            related_name='movimientos',
+                            help_text='Carga masiva en la que se registró el movimiento')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -142,12 +154,64 @@ class MovimientoInventario(models.Model):
             models.Index(fields=['fecha_movimiento']),
             models.Index(fields=['producto']),
             models.Index(fields=['estado']),
+            models.Index(fields=['updated_at']),
+            # Saldos por (bodega, producto) y por tramo de fechas: conciliación,
+            # stock histórico, kardex
+            models.Index(fields=['bodega_destino', 'producto', 'fecha_movimiento']),
+            models.Index(fields=['bodega_origen', 'producto', 'fecha_movimiento']),
+            models.Index(fields=['fecha_recepcion']),
         ]
 
     def __str__(self):
         return f"{self.get_tipo_movimiento_display()} - {self.producto.sku} - {self.cantidad}"
 
 
+class CargaMovimientos(models.Model):
+    """Carga masiva de movimientos ya confirmados (idempotente por clave)"""
+    clave = models.CharField(max_length=100, unique=True, 
+                             help_text='Identificador de la carga en el sistema de origen (POS, recepción)')
+    usuario = models.ForeignKey(Usuario, on_delete=models.PROTECT)
+    total_movimientos = models.PositiveIntegerField(default=0)
+    filas_stock = models.PositiveIntegerField(default=0, help_text='Filas de StockActual actualizadas')
+    segundos = models.FloatField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'cargas_movimientos'
+        verbose_name = 'Carga de Movimientos'
+        verbose_name_plural = 'Cargas de Movimientos'
+
+    def __str__(self):
+        return f"{self.clave} ({self.total_movimientos} movimientos)"
+
+
+class SaldoDiario(models.Model):
+    """
+    Saldo de cierre de un (producto, bodega) al final de un día en que tuvo
+    movimientos. Los días sin movimientos no tienen fila: vale la anterior.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE)
+    fecha = models.DateField()
+    cantidad_disponible = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    cantidad_transito = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    valor = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), 
+                                help_text='Costo acumulado de disponible + tránsito (kardex valorizado)')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'saldos_diarios'
+        verbose_name = 'Saldo Diario'
+        verbose_name_plural = 'Saldos Diarios'
+        unique_together = ['producto', 'bodega', 'fecha']
+        indexes = [
+            models.Index(fields=['fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} - {self.bodega_id} al {self.fecha}: {self.cantidad_disponible}"
+
+
 class StockActual(models.Model):
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE)
@@ -226,7 +290,86 @@ class AlertaStock(models.Model):
             models.Index(fields=['tipo_alerta']),
             models.Index(fields=['estado']),
             models.Index(fields=['fecha_generacion']),
+            # Alerta pendiente de un (producto, bodega) por tipo: evaluación de alertas
+            models.Index(fields=['producto', 'bodega', 'tipo_alerta', 'estado']),
         ]
 
     def __str__(self):
         return f"{self.get_tipo_alerta_display()} - {self.producto.sku}"
+
+
+class ParPendienteAlerta(models.Model):
+    """
+    Cola de (producto, bodega) con stock modificado cuyas alertas hay que
+    reevaluar. Un par tiene a lo sumo una fila: los cambios repetidos solo
+    actualizan `cambiado_en`.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE)
+    cambiado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'alertas_pares_pendientes'
+        verbose_name = 'Par Pendiente de Alertas'
+        verbose_name_plural = 'Pares Pendientes de Alertas'
+        unique_together = ['producto', 'bodega']
+
+    def __str__(self):
+        return f"{self.producto_id} - {self.bodega_id}"
+
+
+class Reserva(models.Model):
+    """
+    Stock apartado para un pedido hasta `expira_en`. Mientras está ACTIVA su
+    cantidad suma en `cantidad_reservada` del StockActual (y del lote, si
+    tiene); ver inventario.reservas.
+    """
+    ESTADO_CHOICES = [
+        ('ACTIVA', 'Activa'),
+        ('CONFIRMADA', 'Confirmada'),
+        ('LIBERADA', 'Liberada'),
+        ('EXPIRADA', 'Expirada'),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE)
+    lote = models.ForeignKey(Lote, on_delete=models.PROTECT, null=True, blank=True)
+    cantidad = models.DecimalField(max_digits=18, decimal_places=6, help_text='En unidad de stock')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='ACTIVA')
+    expira_en = models.DateTimeField()
+    documento_referencia = models.CharField(max_length=50, null=True, blank=True,
+                                            help_text='Pedido o documento que reserva')
+    usuario = models.ForeignKey(Usuario, on_delete=models.PROTECT, null=True, blank=True)
+    movimiento = models.ForeignKey(MovimientoInventario, on_delete=models.PROTECT, null=True, blank=True,
+                                   help_text='Salida registrada al confirmar la reserva')
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'reservas_stock'
+        verbose_name = 'Reserva'
+        verbose_name_plural = 'Reservas'
+        indexes = [
+            models.Index(fields=['estado', 'expira_en']),
+            models.Index(fields=['producto', 'bodega']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} - {self.bodega_id}: {self.cantidad} ({self.estado})"
+
+
+class MarcaProceso(models.Model):
+    """Hasta dónde llegó un proceso incremental (p. ej. la exportación analítica)"""
+    nombre = models.CharField(max_length=50, unique=True)
+    hasta = models.DateTimeField(null=True, blank=True,
+                                 help_text="Los registros anteriores a esta fecha ya se procesaron")
+    filas = models.BigIntegerField(default=0, help_text="Filas procesadas en total")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'marcas_proceso'
+        verbose_name = 'Marca de Proceso'
+        verbose_name_plural = 'Marcas de Proceso'
+
+    def __str__(self):
+        return f"{self.nombre}: {self.hasta}"
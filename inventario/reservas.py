@@ -0,0 +1,250 @@
+"""
+Reservas de stock: apartar, confirmar y liberar sin sobrevender
+
+`reservar` aparta stock para un pedido con un único UPDATE condicional:
+
+    cantidad_reservada = cantidad_reservada + x
+    WHERE cantidad_disponible >= cantidad_reservada + x
+
+La base de datos verifica y suma sobre el valor vigente, así dos pedidos
+simultáneos por el mismo SKU no pueden apartar más de lo disponible y
+ninguno lee para decidir después (nada de leer, comparar y escribir). El
+bloqueo de la fila dura solo ese UPDATE y el INSERT de la reserva. Si la
+reserva es de un lote, el lote se aparta igual en el mismo orden (stock de
+la bodega y luego lote). Un producto que se despacha por lote
+(`stock.requiere_lote`) solo se reserva indicando el lote, así la salida
+que produce la confirmación descuenta también ese lote.
+
+Una reserva ACTIVA termina de una de tres formas, cada una con un cambio
+de estado condicional (solo si sigue ACTIVA) que decide quién la procesa:
+
+- `confirmar_reserva`: registra la SALIDA y descuenta lo apartado del
+  disponible y de lo reservado (y del lote, que queda AGOTADO si se vacía).
+- `liberar_reserva`: devuelve lo apartado (p. ej. pedido anulado).
+- `expirar_reservas` (`manage.py expirar_reservas --loop`): libera en
+  bloque las reservas cuyo `expira_en` pasó, de a TAMANO_LOTE por
+  transacción: un UPDATE de las reservas, uno de StockActual y uno de
+  lotes, sin importar cuántos pares toque.
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from .alertas import encolar_pares
+from .disponibilidad import invalidar
+from .models import Lote, MovimientoInventario, Reserva, StockActual
+from .stock import (
+    ErrorStock, MovimientoInvalido, StockInsuficiente, aplicar_en_stock, convertir_a_stock, requiere_lote,
+)
+
+
+# Reservas vencidas liberadas por transacción
+TAMANO_LOTE = 500
+
+
+class ReservaNoActiva(ErrorStock):
+    """La reserva ya fue confirmada, liberada o venció"""
+
+
+@dataclass
+class ResultadoExpiracion:
+    expiradas: int = 0
+    pares: int = 0          # filas de StockActual actualizadas
+    segundos: float = 0.0
+
+
+def _apartar(filas, cantidad, ahora, mensaje):
+    """Suma `cantidad` a lo reservado solo si alcanza el disponible no reservado"""
+    apartadas = filas.filter(cantidad_disponible__gte=F('cantidad_reservada') + cantidad).update(
+        cantidad_reservada=F('cantidad_reservada') + cantidad, updated_at=ahora,
+    )
+    if not apartadas:
+        raise StockInsuficiente(mensaje)
+
+
+def _devolver(filas, cantidad, ahora):
+    filas.update(cantidad_reservada=F('cantidad_reservada') - cantidad, updated_at=ahora)
+
+
+def _devolver_en_bloque(modelo, cantidades, ahora):
+    """Un UPDATE para todas las filas: {pk: cantidad a devolver}"""
+    if cantidades:
+        modelo.objects.filter(pk__in=cantidades).update(
+            cantidad_reservada=F('cantidad_reservada') - Case(
+                *[When(pk=pk, then=Value(cantidad)) for pk, cantidad in cantidades.items()],
+                output_field=DecimalField(max_digits=18, decimal_places=6),
+            ),
+            updated_at=ahora,
+        )
+
+
+def _filas_de_stock(por_par):
+    """{(producto_id, bodega_id): cantidad} -> {pk de StockActual: cantidad}"""
+    if not por_par:
+        return {}
+    por_bodega = defaultdict(list)
+    for producto_id, bodega_id in por_par:
+        por_bodega[bodega_id].append(producto_id)
+    filas = StockActual.objects.filter(reduce(or_, (
+        Q(bodega_id=bodega_id, producto_id__in=productos) for bodega_id, productos in por_bodega.items()
+    )))
+    return {
+        pk: por_par[(producto_id, bodega_id)]
+        for pk, producto_id, bodega_id in filas.values_list('pk', 'producto_id', 'bodega_id')
+    }
+
+
+def reservar(producto, bodega_id, cantidad, usuario=None, unidad=None, lote_id=None, minutos=None,
+             documento_referencia=None):
+    """
+    Aparta `cantidad` (en `unidad`, por defecto la de stock) del producto en
+    la bodega, y del lote si se indica, por `minutos` (por defecto
+    RESERVA_MINUTOS). Retorna la Reserva.
+
+    Lanza StockInsuficiente si el disponible no reservado no alcanza y
+    MovimientoInvalido si el producto se despacha por lote y falta `lote_id`.
+    """
+    if requiere_lote(producto) and not lote_id:
+        raise MovimientoInvalido(f'Las reservas del producto {producto.sku} deben indicar el lote')
+    cantidad = convertir_a_stock(cantidad, unidad or producto.uom_stock, producto)
+    if cantidad <= 0:
+        raise MovimientoInvalido('La cantidad a reservar debe ser positiva')
+    ahora = timezone.now()
+    expira_en = ahora + timedelta(minutes=minutos or settings.RESERVA_MINUTOS)
+
+    with transaction.atomic():
+        invalidar([producto.pk])
+        _apartar(
+            StockActual.objects.filter(producto_id=producto.pk, bodega_id=bodega_id), cantidad, ahora,
+            f'Stock insuficiente para reservar {cantidad} del producto {producto.sku} en la bodega {bodega_id}',
+        )
+        if lote_id:
+            _apartar(
+                Lote.objects.filter(pk=lote_id, producto_id=producto.pk, bodega_id=bodega_id, estado='ACTIVO'),
+                cantidad, ahora, f'Stock insuficiente para reservar {cantidad} del lote {lote_id}',
+            )
+        return Reserva.objects.create(
+            producto=producto, bodega_id=bodega_id, lote_id=lote_id, cantidad=cantidad, expira_en=expira_en,
+            documento_referencia=documento_referencia, usuario=usuario, created_at=ahora,
+        )
+
+
+def _terminar(reserva, estado, ahora):
+    """ACTIVA -> `estado`; ReservaNoActiva si otro proceso ya la terminó (o venció, al confirmar)"""
+    activas = Reserva.objects.filter(pk=reserva.pk, estado='ACTIVA')
+    if estado == 'CONFIRMADA':
+        activas = activas.filter(expira_en__gt=ahora)
+    if not activas.update(estado=estado, updated_at=ahora):
+        raise ReservaNoActiva(f'La reserva {reserva.pk} no está activa')
+
+
+def confirmar_reserva(reserva, usuario, fecha=None, **datos):
+    """
+    Convierte la reserva en una SALIDA confirmada: descuenta lo apartado del
+    disponible y de lo reservado. `datos` son campos adicionales del
+    movimiento. Retorna el movimiento.
+
+    Lanza MovimientoInvalido si el producto se despacha por lote y la reserva
+    no tiene lote (anterior a esa regla): hay que liberarla y reservar el lote.
+    """
+    reserva = Reserva.objects.select_related('producto', 'lote').get(pk=reserva.pk)
+    if requiere_lote(reserva.producto) and not reserva.lote_id:
+        raise MovimientoInvalido(
+            f'La reserva {reserva.pk} no indica lote y el producto {reserva.producto.sku} se despacha por lote'
+        )
+    ahora = timezone.now()
+    fecha = fecha or ahora
+    cantidad = reserva.cantidad
+
+    with transaction.atomic():
+        _terminar(reserva, 'CONFIRMADA', ahora)
+        aplicar_en_stock(reserva.producto_id, reserva.bodega_id,
+                         {'cantidad_disponible': -cantidad, 'cantidad_reservada': -cantidad}, fecha)
+        if reserva.lote_id:
+            consumido = Lote.objects.filter(pk=reserva.lote_id, cantidad_disponible__gte=cantidad).update(
+                cantidad_disponible=F('cantidad_disponible') - cantidad,
+                cantidad_reservada=F('cantidad_reservada') - cantidad, updated_at=ahora,
+            )
+            if not consumido:
+                raise StockInsuficiente(f'Stock insuficiente en el lote {reserva.lote_id}')
+            # Como en lotes.registrar_salida
+            Lote.objects.filter(pk=reserva.lote_id, cantidad_disponible__lte=0).update(estado='AGOTADO')
+
+        movimiento = MovimientoInventario.objects.create(
+            tipo_movimiento='SALIDA', fecha_movimiento=fecha, producto_id=reserva.producto_id,
+            bodega_origen_id=reserva.bodega_id, cantidad=cantidad, unidad_medida_id=reserva.producto.uom_stock_id,
+            cantidad_stock=cantidad, lote_id=reserva.lote_id,
+            costo_unitario=reserva.lote.costo_unitario if reserva.lote_id else None,
+            documento_referencia=reserva.documento_referencia, usuario=usuario, estado='CONFIRMADO',
+            fecha_confirmacion=ahora, usuario_confirmacion=usuario, **datos,
+        )
+        Reserva.objects.filter(pk=reserva.pk).update(movimiento=movimiento)
+        encolar_pares([(reserva.producto_id, reserva.bodega_id)])
+    return movimiento
+
+
+def liberar_reserva(reserva):
+    """Devuelve lo apartado por una reserva ACTIVA (queda LIBERADA)"""
+    reserva = Reserva.objects.only('producto_id', 'bodega_id', 'lote_id', 'cantidad').get(pk=reserva.pk)
+    ahora = timezone.now()
+    with transaction.atomic():
+        _terminar(reserva, 'LIBERADA', ahora)
+        invalidar([reserva.producto_id])
+        _devolver(StockActual.objects.filter(producto_id=reserva.producto_id, bodega_id=reserva.bodega_id),
+                  reserva.cantidad, ahora)
+        if reserva.lote_id:
+            _devolver(Lote.objects.filter(pk=reserva.lote_id), reserva.cantidad, ahora)
+
+
+def expirar_reservas(ahora=None, limite=TAMANO_LOTE):
+    """Libera en bloque las reservas ACTIVA vencidas. Retorna un ResultadoExpiracion"""
+    ahora = ahora or timezone.now()
+    resultado = ResultadoExpiracion()
+    inicio = time.monotonic()
+    while True:
+        with transaction.atomic():
+            # Las filas que otro proceso está confirmando o liberando se saltan:
+            # quedan para la siguiente vuelta si siguen ACTIVA
+            leidas = list(
+                Reserva.objects.select_for_update(skip_locked=True)
+                .filter(estado='ACTIVA', expira_en__lte=ahora)
+                .order_by('expira_en', 'pk')
+                .values_list('pk', flat=True)[:limite]
+            )
+            if not leidas:
+                break
+            # Sin SKIP LOCKED (SQLite) una reserva leída puede confirmarse o liberarse
+            # antes de este UPDATE: solo se expiran (y devuelven) las que siguen ACTIVA,
+            # reconocibles después por la marca de hora propia de esta vuelta
+            marca = timezone.now()
+            Reserva.objects.filter(pk__in=leidas, estado='ACTIVA').update(estado='EXPIRADA', updated_at=marca)
+            vencidas = list(
+                Reserva.objects.filter(pk__in=leidas, estado='EXPIRADA', updated_at=marca)
+                .values_list('producto_id', 'bodega_id', 'lote_id', 'cantidad')
+            )
+
+            por_par, por_lote = defaultdict(Decimal), defaultdict(Decimal)
+            for producto_id, bodega_id, lote_id, cantidad in vencidas:
+                por_par[(producto_id, bodega_id)] += cantidad
+                if lote_id:
+                    por_lote[lote_id] += cantidad
+            _devolver_en_bloque(StockActual, _filas_de_stock(por_par), marca)
+            invalidar(producto_id for producto_id, _ in por_par)
+            _devolver_en_bloque(Lote, por_lote, marca)
+
+        resultado.expiradas += len(vencidas)
+        resultado.pares += len(por_par)
+        if len(leidas) < limite:
+            break
+
+    resultado.segundos = time.monotonic() - inicio
+    return resultado
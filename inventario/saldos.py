@@ -0,0 +1,232 @@
+"""
+Saldos diarios de cierre y consultas de stock a una fecha
+
+`cerrar_saldos` (tarea nocturna, `manage.py cerrar_saldos`) guarda en
+SaldoDiario el saldo al final de cada día de cada (producto, bodega) que
+tuvo movimientos ese día: el saldo anterior más las variaciones del día.
+Las combinaciones sin movimientos no generan fila, así la tabla crece con
+la actividad y no con días x productos x bodegas.
+
+`stock_a_fecha` toma el último cierre anterior al día consultado y le suma
+solo los movimientos posteriores, que con la tarea al día son los del
+propio día: el costo no depende del largo del historial.
+
+Los movimientos se ubican en el tiempo igual que en `inventario.stock`:
+todo en `fecha_movimiento`, salvo la recepción de una transferencia en la
+bodega destino (paso de tránsito a disponible), que ocurre en
+`fecha_recepcion`. Si un movimiento se confirma o cambia después de cerrado
+su día, la siguiente corrida recalcula desde ese día.
+"""
+from collections import defaultdict
+from datetime import datetime, time as hora, timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import MarcaProceso, MovimientoInventario, SaldoDiario
+
+
+CERO = Decimal('0')
+
+MARCA_SALDOS = 'saldos_diarios'
+
+# Margen hacia atrás al registrar la marca, para no saltarse movimientos de
+# transacciones que aún no confirmaban cuando se revisaron los cambios
+MARGEN = timedelta(minutes=5)
+
+# Combinaciones (producto, bodega) por consulta al buscar saldos anteriores
+TAMANO_CONSULTA = 200
+
+
+# Cantidad en unidad de stock y costo registrado del movimiento; el de un
+# ajuste lleva el signo de su cantidad
+CANTIDAD = Coalesce('cantidad_stock', 'cantidad')
+COSTO = Coalesce('costo_total', F('costo_unitario') * F('cantidad'), CERO)
+COSTO_AJUSTE = Coalesce(F('costo_unitario') * F('cantidad'), 'costo_total', CERO)
+
+
+def _suma(filtro=None, expresion=CANTIDAD):
+    return Coalesce(
+        Sum(expresion, filter=filtro), CERO,
+        output_field=DecimalField(max_digits=18, decimal_places=6),
+    )
+
+
+def _ventana(campo, inicio, fin):
+    filtro = {}
+    if inicio is not None:
+        filtro[f'{campo}__gte'] = inicio
+    if fin is not None:
+        filtro[f'{campo}__lt'] = fin
+    return filtro
+
+
+def variaciones(inicio=None, fin=None, bodega_id=None, **filtros):
+    """
+    Variación de disponible y tránsito por (producto, bodega) que producen
+    los movimientos confirmados ocurridos en [inicio, fin) (sin límites,
+    todo el historial). `filtros` se aplica a los movimientos (p. ej.
+    producto_id=...). Retorna {(producto_id, bodega_id): [disponible,
+    tránsito, valor]}, con el valor a costo registrado en los movimientos.
+    """
+    confirmados = MovimientoInventario.objects.filter(estado='CONFIRMADO', **filtros)
+    destino = {'bodega_destino_id': bodega_id} if bodega_id else {'bodega_destino_id__isnull': False}
+    origen = {'bodega_origen_id': bodega_id} if bodega_id else {'bodega_origen_id__isnull': False}
+    saldos = defaultdict(lambda: [CERO, CERO, CERO])
+
+    # Entradas a la bodega destino: ingresos y devoluciones a disponible,
+    # transferencias a tránsito
+    entradas = (
+        confirmados.filter(**destino, **_ventana('fecha_movimiento', inicio, fin))
+        .values_list('producto_id', 'bodega_destino_id').order_by()
+        .annotate(
+            disponible=_suma(Q(tipo_movimiento__in=['INGRESO', 'DEVOLUCION'])),
+            transito=_suma(Q(tipo_movimiento='TRANSFERENCIA')),
+            valor=_suma(Q(tipo_movimiento__in=['INGRESO', 'DEVOLUCION', 'TRANSFERENCIA']), COSTO),
+        )
+    )
+    for producto_id, bodega, disponible, transito, valor in entradas:
+        saldo = saldos[(producto_id, bodega)]
+        saldo[0] += disponible
+        saldo[1] += transito
+        saldo[2] += valor
+
+    # Transferencias recibidas: de tránsito a disponible (el valor no cambia)
+    recibidas = (
+        confirmados.filter(tipo_movimiento='TRANSFERENCIA', fecha_recepcion__isnull=False, **destino,
+                           **_ventana('fecha_recepcion', inicio, fin))
+        .values_list('producto_id', 'bodega_destino_id').order_by()
+        .annotate(cantidad=_suma())
+    )
+    for producto_id, bodega, cantidad in recibidas:
+        saldos[(producto_id, bodega)][0] += cantidad
+        saldos[(producto_id, bodega)][1] -= cantidad
+
+    # Salidas y ajustes de la bodega origen
+    salidas = (
+        confirmados.filter(**origen, **_ventana('fecha_movimiento', inicio, fin))
+        .values_list('producto_id', 'bodega_origen_id').order_by()
+        .annotate(
+            salidas=_suma(Q(tipo_movimiento__in=['SALIDA', 'TRANSFERENCIA', 'DEVOLUCION'])),
+            ajustes=_suma(Q(tipo_movimiento='AJUSTE')),
+            valor_salidas=_suma(Q(tipo_movimiento__in=['SALIDA', 'TRANSFERENCIA', 'DEVOLUCION']), COSTO),
+            valor_ajustes=_suma(Q(tipo_movimiento='AJUSTE'), COSTO_AJUSTE),
+        )
+    )
+    for producto_id, bodega, salidas_, ajustes, valor_salidas, valor_ajustes in salidas:
+        saldos[(producto_id, bodega)][0] += ajustes - salidas_
+        saldos[(producto_id, bodega)][2] += valor_ajustes - valor_salidas
+
+    return saldos
+
+
+def inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, hora.min))
+
+
+def stock_a_fecha(producto_id, bodega_id, momento):
+    """
+    Stock (disponible, tránsito) del producto en la bodega en `momento`:
+    último cierre anterior a ese día + movimientos desde entonces.
+    """
+    cierre = (
+        SaldoDiario.objects
+        .filter(producto_id=producto_id, bodega_id=bodega_id, fecha__lt=timezone.localdate(momento))
+        .order_by('-fecha')
+        .values_list('fecha', 'cantidad_disponible', 'cantidad_transito')
+        .first()
+    )
+    desde, disponible, transito = None, CERO, CERO
+    if cierre is not None:
+        fecha, disponible, transito = cierre
+        desde = inicio_del_dia(fecha + timedelta(days=1))
+
+    # Cota superior inclusiva: lo ocurrido exactamente en `momento` cuenta
+    fin = momento + timedelta(microseconds=1)
+    variacion = variaciones(desde, fin, bodega_id=bodega_id, producto_id=producto_id)[(producto_id, bodega_id)]
+    return disponible + variacion[0], transito + variacion[1]
+
+
+def _saldos_anteriores(combinaciones, dia):
+    """Último cierre anterior a `dia` de cada combinación (las que no tienen, en cero)"""
+    saldos = {}
+    combinaciones = list(combinaciones)
+    for i in range(0, len(combinaciones), TAMANO_CONSULTA):
+        grupo = combinaciones[i:i + TAMANO_CONSULTA]
+        ultimos = (
+            SaldoDiario.objects
+            .filter(reduce(or_, (Q(producto_id=p, bodega_id=b) for p, b in grupo)), fecha__lt=dia)
+            .values_list('producto_id', 'bodega_id').order_by()
+            .annotate(ultima=Max('fecha'))
+        )
+        claves = [Q(producto_id=p, bodega_id=b, fecha=fecha) for p, b, fecha in ultimos]
+        if claves:
+            for p, b, disponible, transito, valor in SaldoDiario.objects.filter(reduce(or_, claves)).values_list(
+                'producto_id', 'bodega_id', 'cantidad_disponible', 'cantidad_transito', 'valor',
+            ):
+                saldos[(p, b)] = [disponible, transito, valor]
+    return {combinacion: saldos.get(combinacion, [CERO, CERO, CERO]) for combinacion in combinaciones}
+
+
+def cerrar_dias(desde, hasta):
+    """
+    Recalcula los cierres de los días [desde, hasta] (fechas locales),
+    reemplazando los que hubiera. Retorna las filas creadas.
+    """
+    SaldoDiario.objects.filter(fecha__gte=desde, fecha__lte=hasta).delete()
+    saldos, creadas = {}, 0
+    dia = desde
+    while dia <= hasta:
+        del_dia = variaciones(inicio_del_dia(dia), inicio_del_dia(dia + timedelta(days=1)))
+        faltantes = [combinacion for combinacion in del_dia if combinacion not in saldos]
+        saldos.update(_saldos_anteriores(faltantes, dia))
+
+        filas = []
+        for (producto_id, bodega_id), variacion in del_dia.items():
+            saldo = saldos[(producto_id, bodega_id)]
+            for i, delta in enumerate(variacion):
+                saldo[i] += delta
+            filas.append(SaldoDiario(producto_id=producto_id, bodega_id=bodega_id, fecha=dia,
+                                     cantidad_disponible=saldo[0], cantidad_transito=saldo[1], valor=saldo[2]))
+        with transaction.atomic():
+            SaldoDiario.objects.bulk_create(filas, batch_size=1000)
+        creadas += len(filas)
+        dia += timedelta(days=1)
+    return creadas
+
+
+def cerrar_saldos(desde=None):
+    """
+    Corrida nocturna: cierra los días pendientes hasta ayer y vuelve a
+    cerrar los afectados por movimientos confirmados o modificados desde la
+    corrida anterior. Con `desde` se recalcula a partir de esa fecha.
+
+    Retorna (primer día recalculado, último día, filas creadas).
+    """
+    ahora = timezone.now()
+    ayer = timezone.localdate(ahora) - timedelta(days=1)
+    marca, _ = MarcaProceso.objects.get_or_create(nombre=MARCA_SALDOS)
+
+    if desde is None and marca.hasta is not None:
+        # Días aún sin cerrar y los que tocan los movimientos cambiados
+        desde = timezone.localdate(marca.hasta)
+        cambios = MovimientoInventario.objects.filter(estado='CONFIRMADO', updated_at__gte=marca.hasta).aggregate(
+            movimiento=Min('fecha_movimiento'), recepcion=Min('fecha_recepcion'),
+        )
+        for fecha in cambios.values():
+            if fecha is not None:
+                desde = min(desde, timezone.localdate(fecha))
+    elif desde is None:
+        primero = MovimientoInventario.objects.filter(estado='CONFIRMADO').aggregate(Min('fecha_movimiento'))
+        desde = timezone.localdate(primero['fecha_movimiento__min'] or ahora)
+
+    creadas = cerrar_dias(desde, ayer) if desde <= ayer else 0
+    marca.hasta = ahora - MARGEN
+    marca.filas = SaldoDiario.objects.count()
+    marca.save(update_fields=['hasta', 'filas', 'updated_at'])
+    return desde, ayer, creadas
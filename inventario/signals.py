@@ -0,0 +1,34 @@
+"""
+Señales del inventario: cambios de stock o de umbrales que reevalúan
+alertas e invalidan la disponibilidad cacheada
+
+Los UPDATE con F() de la contabilización no emiten señales; esos caminos
+encolan sus pares e invalidan directamente (ver `alertas.encolar_pares` y
+`disponibilidad.invalidar`). Aquí se cubren los guardados por ORM (admin,
+scripts) y los cambios de umbrales del producto.
+"""
+from django.db.models.signals import post_delete, post_save
+
+from maestros.models import Producto
+from .alertas import encolar_pares
+from .disponibilidad import invalidar
+from .models import StockActual
+
+
+def stock_modificado(sender, instance, **kwargs):
+    encolar_pares([(instance.producto_id, instance.bodega_id)])
+    invalidar([instance.producto_id])
+
+
+def producto_modificado(sender, instance, created, **kwargs):
+    if created:
+        return
+    encolar_pares(
+        (instance.pk, bodega_id)
+        for bodega_id in StockActual.objects.filter(producto=instance).values_list('bodega_id', flat=True)
+    )
+
+
+post_save.connect(stock_modificado, sender=StockActual, dispatch_uid='alertas_stock')
+post_delete.connect(stock_modificado, sender=StockActual, dispatch_uid='alertas_stock')
+post_save.connect(producto_modificado, sender=Producto, dispatch_uid='alertas_producto')
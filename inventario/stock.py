@@ -0,0 +1,271 @@
+"""
+Contabilización de movimientos de inventario en StockActual
+
+`confirmar_movimiento` pasa un movimiento PENDIENTE a CONFIRMADO y aplica su
+efecto sobre el stock en una sola transacción corta:
+
+- INGRESO: suma a la bodega destino.
+- SALIDA: resta de la bodega origen. Las de productos con lote no se
+  confirman aquí: van por `lotes.registrar_salida` (asignación FEFO), así el
+  saldo de los lotes sigue al de StockActual.
+- AJUSTE: suma a la bodega origen la cantidad con su signo.
+- DEVOLUCION: resta de la bodega origen (a proveedor) y/o suma a la
+  bodega destino (de cliente).
+- TRANSFERENCIA: resta de la bodega origen y deja la cantidad en tránsito
+  en la destino hasta `recibir_transferencia`.
+
+Todo lo que requiere leer (movimiento, producto, conversión de unidades) se
+resuelve antes de abrir la transacción. Dentro solo hay UPDATE con F(): la
+base de datos suma sobre el valor vigente, así que postings simultáneos
+sobre el mismo (producto, bodega) no pierden actualizaciones, y las restas
+llevan la condición de stock suficiente en el mismo UPDATE. Las filas se
+actualizan siempre en el mismo orden (movimiento, stock por bodega, lote)
+para que dos transacciones no se bloqueen mutuamente. Los pares
+(producto, bodega) modificados quedan encolados para reevaluar sus alertas
+(`alertas.encolar_pares`) en la misma transacción, y `aplicar_en_stock`
+invalida la disponibilidad cacheada del producto (`disponibilidad.invalidar`).
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .alertas import encolar_pares
+from .disponibilidad import invalidar
+from .models import Lote, MovimientoInventario, StockActual
+
+
+PRECISION = Decimal('0.000001')
+
+
+class ErrorStock(Exception):
+    """Error de negocio al contabilizar un movimiento"""
+
+
+class StockInsuficiente(ErrorStock):
+    pass
+
+
+class MovimientoNoPendiente(ErrorStock):
+    pass
+
+
+class MovimientoInvalido(ErrorStock):
+    pass
+
+
+def requiere_lote(producto):
+    """Sus salidas se asignan por lote (FEFO)"""
+    return producto.control_por_lote or producto.perishable
+
+
+def exigir_fefo(tipo_movimiento, producto):
+    """
+    Las SALIDAs de productos con lote solo se registran con la salida FEFO
+    (`lotes.registrar_salida`), que descuenta también los lotes. Lanza
+    MovimientoInvalido para cualquier otra vía (confirmación, cargas).
+    """
+    if tipo_movimiento == 'SALIDA' and requiere_lote(producto):
+        raise MovimientoInvalido(
+            f'Las salidas del producto {producto.sku} se asignan por lote (FEFO): '
+            'regístrelas con la salida FEFO'
+        )
+
+
+def convertir_a_stock(cantidad, unidad, producto):
+    """Convierte `cantidad` expresada en `unidad` a la unidad de stock del producto"""
+    destino = producto.uom_stock
+    if unidad.pk == destino.pk:
+        return cantidad
+
+    if unidad.tipo == destino.tipo:
+        # Misma magnitud (p. ej. G -> KG): a través de la unidad base del tipo
+        return (cantidad * unidad.factor_base / destino.factor_base).quantize(PRECISION)
+
+    # Entre la unidad de compra y la de venta vale el factor del producto
+    # (1 unidad de compra = factor_conversion unidades de venta)
+    if (unidad.pk, destino.pk) == (producto.uom_compra_id, producto.uom_venta_id):
+        return (cantidad * producto.factor_conversion).quantize(PRECISION)
+    if (unidad.pk, destino.pk) == (producto.uom_venta_id, producto.uom_compra_id):
+        return (cantidad / producto.factor_conversion).quantize(PRECISION)
+
+    raise MovimientoInvalido(
+        f'No hay conversión de {unidad.codigo} a {destino.codigo} para el producto {producto.sku}'
+    )
+
+
+def efecto_en_stock(movimiento, cantidad):
+    """
+    Cambios que aplica un movimiento confirmado:
+    {bodega_id: {campo de StockActual: delta}}
+    """
+    tipo = movimiento.tipo_movimiento
+    origen, destino = movimiento.bodega_origen_id, movimiento.bodega_destino_id
+
+    if tipo == 'INGRESO':
+        if not destino:
+            raise MovimientoInvalido('Un ingreso requiere bodega destino')
+        return {destino: {'cantidad_disponible': cantidad}}
+
+    if tipo == 'SALIDA':
+        if not origen:
+            raise MovimientoInvalido('Una salida requiere bodega origen')
+        return {origen: {'cantidad_disponible': -cantidad}}
+
+    if tipo == 'AJUSTE':
+        if not origen:
+            raise MovimientoInvalido('Un ajuste requiere bodega origen')
+        return {origen: {'cantidad_disponible': cantidad}}
+
+    if tipo == 'TRANSFERENCIA':
+        if not origen or not destino or origen == destino:
+            raise MovimientoInvalido('Una transferencia requiere bodegas origen y destino distintas')
+        return {
+            origen: {'cantidad_disponible': -cantidad},
+            destino: {'cantidad_transito': cantidad},
+        }
+
+    if tipo == 'DEVOLUCION':
+        if not origen and not destino:
+            raise MovimientoInvalido('Una devolución requiere bodega origen o destino')
+        efecto = {}
+        if origen:
+            efecto[origen] = {'cantidad_disponible': -cantidad}
+        if destino:
+            efecto.setdefault(destino, {})
+            efecto[destino]['cantidad_disponible'] = efecto[destino].get('cantidad_disponible', 0) + cantidad
+        return efecto
+
+    raise MovimientoInvalido(f'Tipo de movimiento desconocido: {tipo}')
+
+
+def _hasta(campo, fecha):
+    """El mayor entre el valor actual del campo (o nada) y `fecha`"""
+    return Coalesce(Greatest(F(campo), Value(fecha)), Value(fecha))
+
+
+def aplicar_en_stock(producto_id, bodega_id, cambios, fecha):
+    """
+    Aplica los deltas a la fila (producto, bodega) en un solo UPDATE.
+    Las restas exigen stock suficiente, y las del disponible que no consuman
+    lo reservado, stock libre (disponible - reservado); si no alcanza,
+    StockInsuficiente.
+    """
+    cambios = {campo: delta for campo, delta in cambios.items() if delta}
+    if not cambios:
+        return
+
+    valores = {campo: F(campo) + delta for campo, delta in cambios.items()}
+    valores['updated_at'] = timezone.now()
+    disponible = cambios.get('cantidad_disponible', 0)
+    if disponible > 0:
+        valores['ultimo_ingreso'] = _hasta('ultimo_ingreso', fecha)
+    elif disponible < 0:
+        valores['ultima_salida'] = _hasta('ultima_salida', fecha)
+
+    filas = StockActual.objects.filter(producto_id=producto_id, bodega_id=bodega_id)
+    invalidar([producto_id])
+    restas = {f'{campo}__gte': -delta for campo, delta in cambios.items()
+              if delta < 0 and campo != 'cantidad_disponible'}
+    if disponible < 0:
+        # Lo reservado no se puede sacar: después del UPDATE el disponible debe
+        # seguir cubriendo lo reservado (salvo la parte que el mismo cambio
+        # consume de lo reservado, como al confirmar una reserva)
+        filas = filas.annotate(libre=F('cantidad_disponible') - F('cantidad_reservada'))
+        restas['libre__gte'] = -disponible + cambios.get('cantidad_reservada', 0)
+    if restas:
+        if not filas.filter(**restas).update(**valores):
+            raise StockInsuficiente(f'Stock insuficiente del producto {producto_id} en la bodega {bodega_id}')
+        return
+
+    if not filas.update(**valores):
+        try:
+            with transaction.atomic():
+                StockActual.objects.create(producto_id=producto_id, bodega_id=bodega_id)
+        except IntegrityError:
+            pass  # otra transacción creó la fila al mismo tiempo
+        filas.update(**valores)
+
+
+def aplicar_en_lote(lote_id, delta):
+    """Suma `delta` al disponible del lote; las restas exigen saldo libre (sin lo reservado)"""
+    if not delta:
+        return
+    lotes = Lote.objects.filter(pk=lote_id)
+    if delta < 0:
+        lotes = lotes.annotate(libre=F('cantidad_disponible') - F('cantidad_reservada')).filter(libre__gte=-delta)
+    if not lotes.update(cantidad_disponible=F('cantidad_disponible') + delta, updated_at=timezone.now()):
+        raise StockInsuficiente(f'Stock insuficiente en el lote {lote_id}')
+
+
+def confirmar_movimiento(movimiento, usuario):
+    """
+    Confirma un movimiento PENDIENTE y aplica su efecto en el stock.
+    Retorna el movimiento actualizado.
+
+    Lanza MovimientoNoPendiente si ya fue confirmado o anulado (también si
+    otro proceso lo confirmó al mismo tiempo), StockInsuficiente si una resta
+    deja el stock negativo y MovimientoInvalido si faltan datos o es una
+    SALIDA de un producto con lote.
+    """
+    movimiento = (
+        MovimientoInventario.objects
+        .select_related('producto__uom_stock', 'unidad_medida', 'lote')
+        .get(pk=movimiento.pk)
+    )
+    if movimiento.estado != 'PENDIENTE':
+        raise MovimientoNoPendiente(f'El movimiento {movimiento.pk} está {movimiento.estado}')
+    exigir_fefo(movimiento.tipo_movimiento, movimiento.producto)
+
+    cantidad = convertir_a_stock(movimiento.cantidad, movimiento.unidad_medida, movimiento.producto)
+    efecto = efecto_en_stock(movimiento, cantidad)
+    lote = movimiento.lote
+    delta_lote = efecto.get(lote.bodega_id, {}).get('cantidad_disponible', 0) if lote else 0
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        # El cambio de estado condicional es el que reserva el movimiento: si
+        # dos procesos lo confirman a la vez, solo uno actualiza la fila
+        confirmado = MovimientoInventario.objects.filter(pk=movimiento.pk, estado='PENDIENTE').update(
+            estado='CONFIRMADO', cantidad_stock=cantidad, fecha_confirmacion=ahora,
+            usuario_confirmacion=usuario, updated_at=ahora,
+        )
+        if not confirmado:
+            raise MovimientoNoPendiente(f'El movimiento {movimiento.pk} ya fue procesado')
+
+        for bodega_id in sorted(efecto):
+            aplicar_en_stock(movimiento.producto_id, bodega_id, efecto[bodega_id], movimiento.fecha_movimiento)
+        if lote:
+            aplicar_en_lote(lote.pk, delta_lote)
+        encolar_pares((movimiento.producto_id, bodega_id) for bodega_id in efecto)
+
+    movimiento.refresh_from_db()
+    return movimiento
+
+
+def recibir_transferencia(movimiento, fecha=None):
+    """
+    Recibe en la bodega destino una transferencia confirmada: la cantidad
+    pasa de tránsito a disponible. Retorna el movimiento actualizado.
+    """
+    ahora = timezone.now()
+    fecha = fecha or ahora
+    with transaction.atomic():
+        recibidos = MovimientoInventario.objects.filter(
+            pk=movimiento.pk, tipo_movimiento='TRANSFERENCIA', estado='CONFIRMADO', fecha_recepcion__isnull=True,
+        ).update(fecha_recepcion=fecha, updated_at=ahora)
+        if not recibidos:
+            raise MovimientoNoPendiente(f'El movimiento {movimiento.pk} no es una transferencia por recibir')
+
+        movimiento = MovimientoInventario.objects.only(
+            'producto_id', 'bodega_destino_id', 'cantidad_stock',
+        ).get(pk=movimiento.pk)
+        cantidad = movimiento.cantidad_stock
+        aplicar_en_stock(movimiento.producto_id, movimiento.bodega_destino_id,
+                         {'cantidad_transito': -cantidad, 'cantidad_disponible': cantidad}, fecha)
+        encolar_pares([(movimiento.producto_id, movimiento.bodega_destino_id)])
+
+    movimiento.refresh_from_db()
+    return movimiento
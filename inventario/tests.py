@@ -1,3 +1,1139 @@
-from django.test import TestCase
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from autenticacion.actividad import registro_actividad
+from autenticacion.contadores import actualizar_masivo, calcular_contadores, clave, leer_contadores
+from autenticacion.models import Rol, Usuario
+from maestros.models import Categoria, Producto, UnidadMedida
+from . import alertas, conciliacion, lotes
+from .analitica import exportar_analitica
+from .alertas import encolar_pares, evaluar_alertas_stock, reevaluar_alertas
+from .cargas import CargaInvalida, contabilizar_carga
+from .conciliacion import conciliar
+from .disponibilidad import disponibilidad, disponibilidad_total, metricas, reiniciar_metricas
+from .kardex import kardex
+from .lotes import asignar_lotes, registrar_salida
+from .models import (
+    AlertaStock, Bodega, CargaMovimientos, Lote, MovimientoInventario, ParPendienteAlerta, Reserva,
+    SaldoDiario, StockActual,
+)
+from .reservas import ReservaNoActiva, confirmar_reserva, expirar_reservas, liberar_reserva, reservar
+from .saldos import cerrar_saldos, stock_a_fecha, variaciones
+from .stock import (
+    MovimientoInvalido, MovimientoNoPendiente, StockInsuficiente,
+    confirmar_movimiento, recibir_transferencia,
+)
+from .vencimientos import procesar_vencimientos
+
+
+def crear_datos(test):
+    """Producto en unidades (compra en cajas de 12), dos bodegas y un usuario"""
+    test.und = UnidadMedida.objects.create(codigo='UND', nombre='Unidad', tipo='UNIDAD')
+    test.caja = UnidadMedida.objects.create(codigo='CJ', nombre='Caja', tipo='VOLUMEN')
+    categoria = Categoria.objects.create(nombre='Chocolates')
+    test.producto = Producto.objects.create(
+        sku='CHO-001', nombre='Chocolate', categoria=categoria,
+        uom_compra=test.caja, uom_venta=test.und, uom_stock=test.und, factor_conversion=Decimal('12'),
+    )
+    test.central = Bodega.objects.create(codigo='CEN', nombre='Central')
+    test.sala = Bodega.objects.create(codigo='SAL', nombre='Sala de ventas')
+    rol = Rol.objects.create(nombre='BODEGUERO', permisos={})
+    test.usuario = Usuario.objects.create(user=User.objects.create_user('bodega'), rol=rol)
+
+
+def movimiento(test, tipo, cantidad, unidad=None, **bodegas):
+    return MovimientoInventario.objects.create(
+        tipo_movimiento=tipo, fecha_movimiento=timezone.now(), producto=test.producto,
+        cantidad=Decimal(cantidad), unidad_medida=unidad or test.und, usuario=test.usuario, **bodegas,
+    )
+
+
+def stock(test, bodega):
+    return StockActual.objects.get(producto=test.producto, bodega=bodega)
+
+
+def assert_contadores_de_alertas(test):
+    """Los contadores de alertas coinciden con un recálculo desde la tabla"""
+    esperados = {k: v for k, v in calcular_contadores().items() if k.startswith('alertas.')}
+    test.assertEqual({k: v for k, v in leer_contadores(list(esperados)).items() if v}, esperados)
+
+
+class ConfirmarMovimientoTests(TestCase):
+    """Confirmar un movimiento lo contabiliza en StockActual"""
+
+    def setUp(self):
+        crear_datos(self)
+
+    def test_ingreso_convierte_a_unidad_de_stock(self):
+        ingreso = movimiento(self, 'INGRESO', '2', unidad=self.caja, bodega_destino=self.central)
+        ingreso = confirmar_movimiento(ingreso, self.usuario)
+
+        self.assertEqual(ingreso.estado, 'CONFIRMADO')
+        self.assertEqual(ingreso.cantidad_stock, Decimal('24'))
+        self.assertEqual(ingreso.usuario_confirmacion, self.usuario)
+        self.assertIsNotNone(ingreso.fecha_confirmacion)
+        fila = stock(self, self.central)
+        self.assertEqual(fila.cantidad_disponible, Decimal('24'))
+        self.assertEqual(fila.ultimo_ingreso, ingreso.fecha_movimiento)
+
+    def test_salida_sin_stock_suficiente_no_cambia_nada(self):
+        confirmar_movimiento(movimiento(self, 'INGRESO', '5', bodega_destino=self.central), self.usuario)
+        salida = movimiento(self, 'SALIDA', '6', bodega_origen=self.central)
+
+        with self.assertRaises(StockInsuficiente):
+            confirmar_movimiento(salida, self.usuario)
+
+        salida.refresh_from_db()
+        self.assertEqual(salida.estado, 'PENDIENTE')
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('5'))
+
+    def test_no_se_confirma_dos_veces(self):
+        ingreso = movimiento(self, 'INGRESO', '5', bodega_destino=self.central)
+        confirmar_movimiento(ingreso, self.usuario)
+        with self.assertRaises(MovimientoNoPendiente):
+            confirmar_movimiento(ingreso, self.usuario)
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('5'))
+
+    def test_transferencia_pasa_por_transito(self):
+        confirmar_movimiento(movimiento(self, 'INGRESO', '10', bodega_destino=self.central), self.usuario)
+        transferencia = movimiento(self, 'TRANSFERENCIA', '4', bodega_origen=self.central, bodega_destino=self.sala)
+
+        confirmar_movimiento(transferencia, self.usuario)
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('6'))
+        self.assertEqual(stock(self, self.sala).cantidad_transito, Decimal('4'))
+        self.assertEqual(stock(self, self.sala).cantidad_disponible, Decimal('0'))
+
+        recibir_transferencia(transferencia)
+        self.assertEqual(stock(self, self.sala).cantidad_transito, Decimal('0'))
+        self.assertEqual(stock(self, self.sala).cantidad_disponible, Decimal('4'))
+        with self.assertRaises(MovimientoNoPendiente):
+            recibir_transferencia(transferencia)
+
+    def test_salida_sin_bodega_origen_es_invalida(self):
+        with self.assertRaises(MovimientoInvalido):
+            confirmar_movimiento(movimiento(self, 'SALIDA', '1', bodega_destino=self.central), self.usuario)
+
+
+class ContabilizarCargaTests(TestCase):
+    """Las cargas masivas se contabilizan de una vez y solo una vez"""
+
+    def setUp(self):
+        crear_datos(self)
+
+    def _filas(self, n):
+        return [
+            {'tipo_movimiento': 'INGRESO', 'producto_id': self.producto.pk, 'cantidad': '1',
+             'unidad_medida_id': self.caja.pk, 'bodega_destino_id': self.central.pk},
+            {'tipo_movimiento': 'SALIDA', 'producto_id': self.producto.pk, 'cantidad': '5',
+             'bodega_origen_id': self.central.pk},
+        ] * n
+
+    def test_carga_agrega_el_stock_por_fila(self):
+        resultado = contabilizar_carga('POS-001', self._filas(50), self.usuario)
+
+        self.assertFalse(resultado.repetida)
+        self.assertEqual(resultado.carga.total_movimientos, 100)
+        self.assertEqual(resultado.carga.filas_stock, 1)
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal(50 * 12 - 50 * 5))
+        self.assertEqual(MovimientoInventario.objects.filter(estado='CONFIRMADO', carga=resultado.carga).count(), 100)
+
+    def test_un_update_por_fila_de_stock(self):
+        contabilizar_carga('POS-000', self._filas(1), self.usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            contabilizar_carga('POS-001', self._filas(600), self.usuario)
+        actualizaciones = [c['sql'] for c in consultas if c['sql'].startswith('UPDATE') and 'stock_actual' in c['sql'].split('SET')[0]]
+        self.assertEqual(len(actualizaciones), 1)
+
+    def test_reenviar_la_carga_no_la_aplica_de_nuevo(self):
+        contabilizar_carga('POS-001', self._filas(10), self.usuario)
+        resultado = contabilizar_carga('POS-001', self._filas(10), self.usuario)
+
+        self.assertTrue(resultado.repetida)
+        self.assertEqual(CargaMovimientos.objects.count(), 1)
+        self.assertEqual(MovimientoInventario.objects.count(), 20)
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal(10 * 12 - 10 * 5))
+
+    def test_carga_con_errores_no_escribe_nada(self):
+        filas = self._filas(2) + [{'tipo_movimiento': 'INGRESO', 'producto_id': 0, 'cantidad': '1'}]
+
+        with self.assertRaises(CargaInvalida) as contexto:
+            contabilizar_carga('POS-001', filas, self.usuario)
+
+        self.assertEqual([indice for indice, _ in contexto.exception.errores], [4])
+        self.assertFalse(CargaMovimientos.objects.exists())
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+    def test_carga_que_deja_stock_negativo_se_revierte(self):
+        filas = [{'tipo_movimiento': 'SALIDA', 'producto_id': self.producto.pk, 'cantidad': '1',
+                  'bodega_origen_id': self.central.pk}]
+
+        with self.assertRaises(StockInsuficiente):
+            contabilizar_carga('POS-001', filas, self.usuario)
+
+        self.assertFalse(CargaMovimientos.objects.exists())
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+    def test_rechaza_salidas_de_productos_con_lote(self):
+        contabilizar_carga('POS-000', self._filas(1)[:1], self.usuario)
+        for campos in ({'control_por_lote': True}, {'perishable': True}):
+            Producto.objects.filter(pk=self.producto.pk).update(
+                **{'control_por_lote': False, 'perishable': False, **campos})
+            with self.assertRaises(CargaInvalida) as contexto:
+                contabilizar_carga('POS-001', self._filas(2), self.usuario)
+            self.assertEqual([indice for indice, _ in contexto.exception.errores], [1, 3])
+            self.assertIn('FEFO', contexto.exception.errores[0][1])
+        self.assertEqual(CargaMovimientos.objects.count(), 1)
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('12'))
+
+
+class ConciliacionTests(TestCase):
+    """La conciliación detecta y corrige diferencias con el historial"""
+
+    def setUp(self):
+        crear_datos(self)
+        confirmar_movimiento(movimiento(self, 'INGRESO', '10', bodega_destino=self.central), self.usuario)
+        confirmar_movimiento(
+            movimiento(self, 'TRANSFERENCIA', '4', bodega_origen=self.central, bodega_destino=self.sala),
+            self.usuario,
+        )
+
+    def _diferencias(self, **opciones):
+        return [(d.bodega_id, d.campo, d.esperado, d.actual)
+                for resultado in conciliar(**opciones) for d in resultado.diferencias]
+
+    def test_stock_contabilizado_no_tiene_diferencias(self):
+        self.assertEqual(self._diferencias(), [])
+
+    def test_detecta_y_corrige_diferencias(self):
+        StockActual.objects.filter(bodega=self.central).update(cantidad_disponible=Decimal('9'))
+        StockActual.objects.filter(bodega=self.sala).delete()
+
+        self.assertEqual(sorted(self._diferencias(corregir=True)), [
+            (self.central.pk, 'disponible', Decimal('6'), Decimal('9')),
+            (self.sala.pk, 'transito', Decimal('4'), Decimal('0')),
+        ])
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('6'))
+        self.assertEqual(stock(self, self.sala).cantidad_transito, Decimal('4'))
+        self.assertEqual(self._diferencias(), [])
+
+    def test_reporta_diferencias_con_lotes(self):
+        Producto.objects.filter(pk=self.producto.pk).update(control_por_lote=True)
+        Lote.objects.create(codigo_lote='L-1', producto=self.producto, bodega=self.central,
+                            cantidad_inicial=Decimal('5'), cantidad_disponible=Decimal('5'))
+
+        self.assertEqual(self._diferencias(bodegas=[self.central.pk]), [
+            (self.central.pk, 'lotes', Decimal('6'), Decimal('5')),
+        ])
+
+    def test_perecibles_se_concilian_con_sus_lotes(self):
+        Producto.objects.filter(pk=self.producto.pk).update(perishable=True)
+        self.assertEqual(self._diferencias(bodegas=[self.central.pk]), [
+            (self.central.pk, 'lotes', Decimal('6'), Decimal('0')),
+        ])
+
+
+class ConciliacionConcurrenciaTests(TransactionTestCase):
+    """Un posting confirmado durante la conciliación no se toma por diferencia"""
+
+    def setUp(self):
+        crear_datos(self)
+        confirmar_movimiento(movimiento(self, 'INGRESO', '10', bodega_destino=self.central), self.usuario)
+
+    def test_posting_simultaneo_no_se_revierte(self):
+        ingreso = movimiento(self, 'INGRESO', '5', bodega_destino=self.central)
+
+        def contabilizar():
+            try:
+                confirmar_movimiento(MovimientoInventario.objects.get(pk=ingreso.pk), self.usuario)
+            finally:
+                connection.close()
+
+        hilo = threading.Thread(target=contabilizar)
+
+        def posting_entre_lecturas(execute, sql, params, many, context):
+            # El posting corre apenas se lee uno de los dos lados (stock o historial)
+            resultado = execute(sql, params, many, context)
+            if hilo.ident is None and ('stock_actual' in sql or 'movimientos_inventario' in sql):
+                hilo.start()
+                hilo.join(0.5)
+            return resultado
+
+        with connection.execute_wrapper(posting_entre_lecturas):
+            resultados = list(conciliar(bodegas=[self.central.pk], corregir=True))
+        hilo.join()
+
+        self.assertEqual([d for resultado in resultados for d in resultado.diferencias], [])
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('15'))
+
+
+class SaldosDiariosTests(TestCase):
+    """Los cierres diarios reproducen el historial a cualquier fecha"""
+
+    def setUp(self):
+        crear_datos(self)
+        self.hoy = timezone.localdate()
+        self._confirmado('INGRESO', '10', self._dia(-3, 9), bodega_destino=self.central)
+        transferencia = self._confirmado('TRANSFERENCIA', '4', self._dia(-2, 10),
+                                         bodega_origen=self.central, bodega_destino=self.sala)
+        recibir_transferencia(transferencia, fecha=self._dia(-1, 8))
+        self._confirmado('SALIDA', '1', self._dia(-1, 15), bodega_origen=self.sala)
+        self._confirmado('AJUSTE', '-2', self._dia(0, 0), bodega_origen=self.central)
+
+    def _dia(self, dias, hora):
+        return timezone.make_aware(datetime.combine(self.hoy + timedelta(days=dias), time(hora)))
+
+    def _confirmado(self, tipo, cantidad, fecha, **bodegas):
+        mov = movimiento(self, tipo, cantidad, **bodegas)
+        MovimientoInventario.objects.filter(pk=mov.pk).update(fecha_movimiento=fecha)
+        return confirmar_movimiento(mov, self.usuario)
+
+    def _historial(self, bodega, momento):
+        saldo = variaciones(None, momento + timedelta(microseconds=1), bodega_id=bodega.pk,
+                            producto_id=self.producto.pk)[(self.producto.pk, bodega.pk)]
+        return tuple(saldo[:2])
+
+    def _comparar(self):
+        for dias in range(-4, 1):
+            for hora in (0, 9, 12, 23):
+                for bodega in (self.central, self.sala):
+                    momento = self._dia(dias, hora)
+                    self.assertEqual(stock_a_fecha(self.producto.pk, bodega.pk, momento),
+                                     self._historial(bodega, momento), (bodega.codigo, momento))
+
+    def test_cierres_solo_de_dias_con_movimientos(self):
+        desde, hasta, creadas = cerrar_saldos()
+        self.assertEqual((desde, hasta, creadas), (self.hoy - timedelta(days=3), self.hoy - timedelta(days=1), 4))
+        sala = SaldoDiario.objects.get(producto=self.producto, bodega=self.sala, fecha=self.hoy - timedelta(days=1))
+        self.assertEqual((sala.cantidad_disponible, sala.cantidad_transito), (Decimal('3'), Decimal('0')))
+        self._comparar()
+        # Al día con el stock actual
+        self.assertEqual(stock_a_fecha(self.producto.pk, self.central.pk, timezone.now())[0],
+                         stock(self, self.central).cantidad_disponible)
+
+    def test_movimiento_tardio_recalcula_desde_su_dia(self):
+        cerrar_saldos()
+        self._confirmado('INGRESO', '5', self._dia(-3, 20), bodega_destino=self.central)
+
+        desde, _, _ = cerrar_saldos()
+        self.assertEqual(desde, self.hoy - timedelta(days=3))
+        central = SaldoDiario.objects.get(producto=self.producto, bodega=self.central,
+                                          fecha=self.hoy - timedelta(days=2))
+        self.assertEqual(central.cantidad_disponible, Decimal('11'))
+        self._comparar()
+
+    def test_sin_cambios_no_recalcula_dias_cerrados(self):
+        cerrar_saldos()
+        # Movimientos confirmados antes de la corrida anterior (fuera del margen)
+        MovimientoInventario.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        desde, hasta, creadas = cerrar_saldos()
+        self.assertGreater(desde, hasta)
+        self.assertEqual(creadas, 0)
+        self.assertEqual(SaldoDiario.objects.count(), 4)
+
+
+class KardexTests(TestCase):
+    """Saldos acumulados del kardex, por páginas y desde los cierres diarios"""
+
+    def setUp(self):
+        crear_datos(self)
+        hoy = timezone.localdate()
+        movimientos = [
+            ('INGRESO', '10', '1000', {'bodega_destino': self.central}),
+            ('SALIDA', '3', '300', {'bodega_origen': self.central}),
+            ('TRANSFERENCIA', '4', '400', {'bodega_origen': self.central, 'bodega_destino': self.sala}),
+            ('AJUSTE', '-1', None, {'bodega_origen': self.central}),
+            ('INGRESO', '6', '660', {'bodega_destino': self.central}),
+            ('SALIDA', '2', '220', {'bodega_origen': self.central}),
+        ]
+        for i, (tipo, cantidad, costo, bodegas) in enumerate(movimientos):
+            mov = movimiento(self, tipo, cantidad, **bodegas)
+            fecha = timezone.make_aware(datetime.combine(hoy - timedelta(days=5 - i), time(12)))
+            MovimientoInventario.objects.filter(pk=mov.pk).update(
+                fecha_movimiento=fecha, costo_total=costo, costo_unitario=Decimal('100'),
+            )
+            confirmar_movimiento(mov, self.usuario)
+
+    def _saldos(self, pagina):
+        return [(fila['cantidad'], fila['saldo'], fila['saldo_valor']) for fila in pagina.movimientos]
+
+    def test_saldo_acumulado(self):
+        pagina = kardex(self.producto.pk, self.central.pk)
+        self.assertIsNone(pagina.siguiente)
+        self.assertEqual(self._saldos(pagina), [
+            (Decimal('10'), Decimal('10'), Decimal('1000')),
+            (Decimal('-3'), Decimal('7'), Decimal('700')),
+            (Decimal('-4'), Decimal('3'), Decimal('300')),
+            (Decimal('-1'), Decimal('2'), Decimal('200')),
+            (Decimal('6'), Decimal('8'), Decimal('860')),
+            (Decimal('-2'), Decimal('6'), Decimal('640')),
+        ])
+        self.assertEqual(pagina.movimientos[-1]['saldo'], stock(self, self.central).cantidad_disponible)
+        # La transferencia entra a la sala (en tránsito) al despacharse
+        self.assertEqual(self._saldos(kardex(self.producto.pk, self.sala.pk)),
+                         [(Decimal('4'), Decimal('4'), Decimal('400'))])
+
+    def test_paginas_con_cursor(self):
+        completo = self._saldos(kardex(self.producto.pk, self.central.pk))
+        filas, cursor = [], None
+        while True:
+            pagina = kardex(self.producto.pk, self.central.pk, cursor=cursor, limite=4)
+            filas += self._saldos(pagina)
+            cursor = pagina.siguiente
+            if cursor is None:
+                break
+        self.assertEqual(filas, completo)
+
+    def test_desde_parte_del_cierre_diario(self):
+        completo = self._saldos(kardex(self.producto.pk, self.central.pk))
+        desde = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=2), time.min))
+        sin_cierres = kardex(self.producto.pk, self.central.pk, desde=desde)
+
+        cerrar_saldos()
+        con_cierres = kardex(self.producto.pk, self.central.pk, desde=desde)
+        self.assertEqual((con_cierres.saldo_inicial, con_cierres.valor_inicial), (Decimal('3'), Decimal('300')))
+        self.assertEqual(self._saldos(con_cierres), self._saldos(sin_cierres))
+        self.assertEqual(self._saldos(con_cierres), completo[3:])
+
+    def test_cursor_alterado(self):
+        cursor = kardex(self.producto.pk, self.central.pk, limite=2).siguiente
+        with self.assertRaises(ValueError):
+            kardex(self.producto.pk, self.central.pk, cursor=cursor[:-1] + 'x')
+
+    def test_cursor_de_otro_kardex(self):
+        cursor = kardex(self.producto.pk, self.central.pk, limite=2).siguiente
+        hasta = timezone.now() + timedelta(days=1)
+        for otro in ({'bodega_id': self.sala.pk}, {'bodega_id': self.central.pk, 'hasta': hasta}):
+            with self.assertRaises(ValueError):
+                kardex(self.producto.pk, cursor=cursor, **otro)
+
+        con_hasta = kardex(self.producto.pk, self.central.pk, hasta=hasta, limite=2).siguiente
+        self.assertEqual(len(kardex(self.producto.pk, self.central.pk, hasta=hasta, cursor=con_hasta).movimientos), 4)
+
+
+@unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow no está instalado')
+@override_settings(ANALITICA_MARGEN=0)
+class AnaliticaTests(TestCase):
+    """Exportación Parquet incremental, particionada por mes de fecha_movimiento"""
+
+    def setUp(self):
+        crear_datos(self)
+        self.destino = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destino)
+        self.marzo = movimiento(self, 'INGRESO', '10', bodega_destino=self.central)
+        self.abril = movimiento(self, 'SALIDA', '3', bodega_origen=self.central)
+        MovimientoInventario.objects.filter(pk=self.marzo.pk).update(
+            fecha_movimiento=timezone.make_aware(datetime(2026, 3, 15, 12)))
+        MovimientoInventario.objects.filter(pk=self.abril.pk).update(
+            fecha_movimiento=timezone.make_aware(datetime(2026, 4, 2, 12)))
+        StockActual.objects.create(producto=self.producto, bodega=self.central, cantidad_disponible=Decimal('7'))
+
+    def leer(self, ruta):
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(ruta).to_pylist()
+
+    def test_particiona_por_mes_y_exporta_solo_cambios(self):
+        resultado = exportar_analitica(self.destino)
+        rutas = resultado['movimientos']['archivos']
+        self.assertEqual(resultado['movimientos']['filas'], 2)
+        self.assertEqual([os.path.basename(os.path.dirname(ruta)) for ruta in rutas], ['mes=2026-03', 'mes=2026-04'])
+        marzo = self.leer(rutas[0])
+        self.assertEqual([(fila['id'], fila['producto_sku'], fila['bodega_destino_codigo'], fila['cantidad'])
+                          for fila in marzo], [(self.marzo.pk, 'CHO-001', 'CEN', Decimal('10'))])
+        self.assertFalse([nombre for _, _, archivos in os.walk(self.destino)
+                          for nombre in archivos if nombre.endswith('.tmp')])
+
+        stock_exportado = self.leer(resultado['stock']['archivos'][0])
+        self.assertEqual([(fila['bodega_codigo'], fila['cantidad_disponible']) for fila in stock_exportado],
+                         [('CEN', Decimal('7'))])
+
+        # Solo lo modificado desde la corrida anterior
+        self.assertEqual(exportar_analitica(self.destino, stock=False)['movimientos']['filas'], 0)
+        self.abril.documento_referencia = 'GD-1'
+        self.abril.save()
+        resultado = exportar_analitica(self.destino, stock=False)
+        self.assertEqual([fila['documento_referencia'] for fila in self.leer(resultado['movimientos']['archivos'][0])],
+                         ['GD-1'])
+
+    def test_descarga_del_mes(self):
+        rol = Rol.objects.create(nombre='FINANZAS', permisos={'inventario': {'exportar': True}})
+        user = User.objects.create_user('finanzas')
+        Usuario.objects.create(user=user, rol=rol)
+        self.client.force_login(user)
+        self.addCleanup(registro_actividad.flush)
+
+        respuesta = self.client.get('/inventario/analitica/movimientos/?mes=2026-04')
+        self.assertEqual(respuesta.status_code, 200)
+        ruta = os.path.join(self.destino, 'descarga.parquet')
+        with open(ruta, 'wb') as archivo:
+            archivo.write(b''.join(respuesta.streaming_content))
+        self.assertEqual([fila['id'] for fila in self.leer(ruta)], [self.abril.pk])
+
+        self.assertEqual(self.client.get('/inventario/analitica/movimientos/?mes=abril').status_code, 400)
+        self.assertEqual(self.client.get('/inventario/analitica/otros/').status_code, 404)
+
+
+class AlertasStockTests(TestCase):
+    """Alertas de stock generadas y resueltas en bloque"""
+
+    def setUp(self):
+        crear_datos(self)
+        Producto.objects.filter(pk=self.producto.pk).update(
+            stock_minimo=Decimal('10'), punto_reorden=Decimal('12'), stock_maximo=Decimal('50'),
+        )
+        StockActual.objects.create(producto=self.producto, bodega=self.central, cantidad_disponible=Decimal('3'))
+        StockActual.objects.create(producto=self.producto, bodega=self.sala, cantidad_disponible=Decimal('0'))
+
+    def _activas(self):
+        return sorted(AlertaStock.objects.filter(estado='ACTIVA').values_list(
+            'bodega__codigo', 'tipo_alerta', 'prioridad', 'cantidad_actual', 'cantidad_limite',
+        ))
+
+    def test_crea_alertas_con_prioridad(self):
+        resultado = evaluar_alertas_stock()
+        self.assertEqual((resultado.creadas, resultado.resueltas), (2, 0))
+        self.assertEqual(self._activas(), [
+            ('CEN', 'BAJO_STOCK', 'ALTA', Decimal('3'), Decimal('12')),
+            ('SAL', 'SIN_STOCK', 'CRITICA', Decimal('0'), Decimal('12')),
+        ])
+
+    def test_no_repite_alertas_pendientes(self):
+        evaluar_alertas_stock()
+        AlertaStock.objects.filter(bodega=self.sala).update(estado='IGNORADA')
+        resultado = evaluar_alertas_stock()
+        self.assertEqual((resultado.creadas, resultado.resueltas), (0, 0))
+        self.assertEqual(AlertaStock.objects.count(), 2)
+
+    def test_resuelve_las_que_ya_no_aplican(self):
+        evaluar_alertas_stock()
+        StockActual.objects.filter(bodega=self.central).update(cantidad_disponible=Decimal('20'))
+        StockActual.objects.filter(bodega=self.sala).update(cantidad_disponible=Decimal('120'))
+
+        resultado = evaluar_alertas_stock()
+        self.assertEqual((resultado.creadas, resultado.resueltas), (1, 2))
+        self.assertEqual(self._activas(), [('SAL', 'SOBRE_STOCK', 'ALTA', Decimal('120'), Decimal('50'))])
+        self.assertEqual(AlertaStock.objects.filter(estado='RESUELTA', fecha_resolucion__isnull=False).count(), 2)
+
+    def test_ajusta_los_contadores_del_dashboard(self):
+        evaluar_alertas_stock()
+        self.assertEqual(leer_contadores([clave('alertas', 'estado', 'ACTIVA')]),
+                         {clave('alertas', 'estado', 'ACTIVA'): 2})
+
+        actualizar_masivo(AlertaStock.objects.filter(bodega=self.sala), estado='IGNORADA')
+        StockActual.objects.filter(bodega=self.central).update(cantidad_disponible=Decimal('20'))
+        StockActual.objects.filter(bodega=self.sala).update(cantidad_disponible=Decimal('120'))
+        evaluar_alertas_stock()
+        assert_contadores_de_alertas(self)
+
+    def test_consultas_no_dependen_de_los_pares(self):
+        evaluar_alertas_stock()
+        AlertaStock.objects.all().delete()
+        with CaptureQueriesContext(connection) as pocas:
+            evaluar_alertas_stock()
+        AlertaStock.objects.all().delete()
+        otra = Bodega.objects.create(codigo='NOR', nombre='Norte')
+        for i in range(20):
+            producto = Producto.objects.create(
+                sku=f'CHO-{i + 2:03}', nombre='Chocolate', categoria=self.producto.categoria,
+                uom_compra=self.caja, uom_venta=self.und, uom_stock=self.und, stock_minimo=Decimal('5'),
+            )
+            StockActual.objects.create(producto=producto, bodega=otra, cantidad_disponible=Decimal('1'))
+        with CaptureQueriesContext(connection) as muchas:
+            self.assertEqual(evaluar_alertas_stock().creadas, 22)
+        self.assertEqual(len(muchas), len(pocas))
+
+
+class ReevaluacionAlertasTests(TestCase):
+    """Cada cambio de stock encola su par y la reevaluación solo mira la cola"""
+
+    def setUp(self):
+        crear_datos(self)
+        Producto.objects.filter(pk=self.producto.pk).update(stock_minimo=Decimal('10'))
+
+    def _cola(self):
+        return sorted(ParPendienteAlerta.objects.values_list('producto_id', 'bodega_id'))
+
+    def _activas(self):
+        return sorted(AlertaStock.objects.filter(estado='ACTIVA').values_list('bodega__codigo', 'tipo_alerta'))
+
+    def test_movimientos_encolan_y_reevaluan(self):
+        confirmar_movimiento(movimiento(self, 'INGRESO', '1', unidad=self.caja, bodega_destino=self.central),
+                             self.usuario)
+        confirmar_movimiento(
+            movimiento(self, 'TRANSFERENCIA', '8', bodega_origen=self.central, bodega_destino=self.sala),
+            self.usuario,
+        )
+        self.assertEqual(self._cola(), [(self.producto.pk, self.central.pk), (self.producto.pk, self.sala.pk)])
+
+        resultado = reevaluar_alertas()
+        self.assertEqual((resultado.pares, resultado.creadas), (2, 2))
+        self.assertEqual(self._activas(), [('CEN', 'BAJO_STOCK'), ('SAL', 'SIN_STOCK')])
+        self.assertEqual(self._cola(), [])
+
+        confirmar_movimiento(movimiento(self, 'INGRESO', '20', bodega_destino=self.central), self.usuario)
+        resultado = reevaluar_alertas()
+        self.assertEqual((resultado.pares, resultado.resueltas), (1, 1))
+        self.assertEqual(self._activas(), [('SAL', 'SIN_STOCK')])
+
+    def test_contadores_consistentes_tras_reevaluar(self):
+        confirmar_movimiento(movimiento(self, 'INGRESO', '4', bodega_destino=self.central), self.usuario)
+        StockActual.objects.create(producto=self.producto, bodega=self.sala)
+        encolar_pares([(self.producto.pk, self.sala.pk)])
+        reevaluar_alertas()
+        assert_contadores_de_alertas(self)
+
+        actualizar_masivo(AlertaStock.objects.filter(bodega=self.sala), estado='IGNORADA')
+        confirmar_movimiento(movimiento(self, 'INGRESO', '20', bodega_destino=self.central), self.usuario)
+        confirmar_movimiento(movimiento(self, 'INGRESO', '20', bodega_destino=self.sala), self.usuario)
+        self.assertEqual(reevaluar_alertas().resueltas, 2)
+        assert_contadores_de_alertas(self)
+        self.assertEqual(leer_contadores([clave('alertas', 'estado', 'ACTIVA')]),
+                         {clave('alertas', 'estado', 'ACTIVA'): 0})
+
+    def test_rafaga_de_una_carga_es_una_reevaluacion(self):
+        filas = [{'tipo_movimiento': 'INGRESO', 'producto_id': self.producto.pk, 'cantidad': '1',
+                  'bodega_destino_id': self.central.pk}] * 2000
+        contabilizar_carga('POS-1', filas, self.usuario)
+        for _ in range(20):
+            confirmar_movimiento(movimiento(self, 'SALIDA', '50', bodega_origen=self.central), self.usuario)
+        self.assertEqual(self._cola(), [(self.producto.pk, self.central.pk)])
+
+        resultado = reevaluar_alertas()
+        self.assertEqual((resultado.pares, resultado.creadas), (1, 0))
+
+    def test_admin_y_umbrales_encolan(self):
+        fila = StockActual.objects.create(producto=self.producto, bodega=self.sala, cantidad_disponible=Decimal('50'))
+        reevaluar_alertas()
+        self.assertEqual(self._activas(), [])
+
+        producto = Producto.objects.get(pk=self.producto.pk)
+        producto.stock_maximo = Decimal('40')
+        producto.save()
+        self.assertEqual(reevaluar_alertas().creadas, 1)
+        self.assertEqual(self._activas(), [('SAL', 'SOBRE_STOCK')])
+
+        fila.delete()
+        self.assertEqual(reevaluar_alertas().resueltas, 1)
+
+    def test_par_modificado_durante_la_evaluacion_sigue_en_la_cola(self):
+        StockActual.objects.create(producto=self.producto, bodega=self.sala)
+        ParPendienteAlerta.objects.update(cambiado_en=timezone.now() - timedelta(seconds=1))
+        evaluar = alertas._evaluar
+
+        def evaluar_con_cambio(*args, **kwargs):
+            # Otro proceso modifica el stock del par mientras se evalúa
+            evaluar(*args, **kwargs)
+            encolar_pares([(self.producto.pk, self.sala.pk)])
+
+        with mock.patch.object(alertas, '_evaluar', evaluar_con_cambio):
+            self.assertEqual(reevaluar_alertas().pares, 1)
+        self.assertEqual(self._cola(), [(self.producto.pk, self.sala.pk)])
+
+
+@override_settings(VENCIMIENTO_DIAS_AVISO=10)
+class VencimientosTests(TestCase):
+    """Vencimiento de lotes por ventanas de fecha desde la última corrida"""
+
+    def setUp(self):
+        crear_datos(self)
+        self.hoy = timezone.localdate()
+
+    def _lote(self, codigo, dias, disponible='5'):
+        return Lote.objects.create(
+            codigo_lote=codigo, producto=self.producto, bodega=self.central,
+            fecha_vencimiento=self.hoy + timedelta(days=dias),
+            cantidad_inicial=Decimal('5'), cantidad_disponible=Decimal(disponible),
+        )
+
+    def _alertas(self):
+        return sorted(AlertaStock.objects.filter(estado='ACTIVA').values_list(
+            'lote__codigo_lote', 'tipo_alerta', 'dias_vencimiento', 'prioridad',
+        ))
+
+    def test_primera_corrida(self):
+        self._lote('L-VENCIDO', -3)
+        self._lote('L-VACIO', 0, disponible='0')
+        self._lote('L-PRONTO', 4)
+        self._lote('L-LEJOS', 40)
+
+        resultado = procesar_vencimientos(self.hoy)
+        self.assertEqual((resultado.vencidos, resultado.agotados, resultado.alertas), (1, 1, 2))
+        self.assertEqual(dict(Lote.objects.values_list('codigo_lote', 'estado')), {
+            'L-VENCIDO': 'VENCIDO', 'L-VACIO': 'AGOTADO', 'L-PRONTO': 'ACTIVO', 'L-LEJOS': 'ACTIVO',
+        })
+        self.assertEqual(self._alertas(), [
+            ('L-PRONTO', 'POR_VENCER', 4, 'ALTA'),
+            ('L-VENCIDO', 'VENCIDO', -3, 'CRITICA'),
+        ])
+
+    def test_corridas_diarias_solo_ven_lo_que_cruza_un_umbral(self):
+        self._lote('L-1', 4)
+        self._lote('L-2', 12)
+        procesar_vencimientos(self.hoy)
+        self.assertEqual(self._alertas(), [('L-1', 'POR_VENCER', 4, 'ALTA')])
+
+        # Dos días después L-2 entra en aviso; L-1 no se repite
+        procesar_vencimientos(self.hoy + timedelta(days=2))
+        self.assertEqual(self._alertas(), [
+            ('L-1', 'POR_VENCER', 4, 'ALTA'),
+            ('L-2', 'POR_VENCER', 10, 'MEDIA'),
+        ])
+
+        # La misma fecha otra vez no hace nada
+        self.assertEqual(procesar_vencimientos(self.hoy + timedelta(days=2)).alertas, 0)
+
+        # Al vencer, la alerta POR_VENCER se resuelve y queda la VENCIDO
+        resultado = procesar_vencimientos(self.hoy + timedelta(days=4))
+        self.assertEqual(resultado.vencidos, 1)
+        self.assertEqual(self._alertas(), [
+            ('L-1', 'VENCIDO', 0, 'CRITICA'),
+            ('L-2', 'POR_VENCER', 10, 'MEDIA'),
+        ])
+        assert_contadores_de_alertas(self)
+
+    def test_lote_recibido_con_el_aviso_ya_cruzado(self):
+        procesar_vencimientos(self.hoy)
+        self._lote('L-PRONTO', 5)       # la ventana de aviso ya pasó por su fecha
+
+        self.assertEqual(procesar_vencimientos(self.hoy + timedelta(days=1)).alertas, 1)
+        self.assertEqual(self._alertas(), [('L-PRONTO', 'POR_VENCER', 4, 'ALTA')])
+
+    def test_lote_recibido_ya_vencido(self):
+        procesar_vencimientos(self.hoy)
+        self._lote('L-VENCIDO', -1)
+        self._lote('L-VACIO', -1, disponible='0')
+
+        resultado = procesar_vencimientos(self.hoy + timedelta(days=1))
+        self.assertEqual((resultado.vencidos, resultado.agotados), (1, 1))
+        self.assertEqual(dict(Lote.objects.values_list('codigo_lote', 'estado')),
+                         {'L-VENCIDO': 'VENCIDO', 'L-VACIO': 'AGOTADO'})
+        self.assertEqual(self._alertas(), [('L-VENCIDO', 'VENCIDO', -2, 'CRITICA')])
+
+    def test_lee_solo_la_ventana_de_fechas(self):
+        procesar_vencimientos(self.hoy)
+        self._lote('L-ANTIGUO', -30)
+        # Sin cambios desde antes de la corrida y ya fuera de la ventana: no se vuelve a mirar
+        Lote.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        with CaptureQueriesContext(connection) as consultas:
+            procesar_vencimientos(self.hoy + timedelta(days=1))
+        self.assertEqual(Lote.objects.get().estado, 'ACTIVO')
+        tabla = f'FROM {connection.ops.quote_name(Lote._meta.db_table)}'
+        lecturas = [q['sql'] for q in consultas if q['sql'].startswith('SELECT') and tabla in q['sql']]
+        self.assertTrue(lecturas)
+        self.assertTrue(all('fecha_vencimiento' in sql for sql in lecturas))
+
+
+class SalidaFefoTests(TestCase):
+    """Las salidas de productos con lote consumen primero los lotes que vencen antes"""
+
+    def setUp(self):
+        crear_datos(self)
+        Producto.objects.filter(pk=self.producto.pk).update(perishable=True)
+        self.producto.refresh_from_db()
+        self.hoy = timezone.localdate()
+        confirmar_movimiento(movimiento(self, 'INGRESO', '100', bodega_destino=self.central), self.usuario)
+
+    def _lote(self, codigo, dias, disponible='5', **campos):
+        return Lote.objects.create(
+            codigo_lote=codigo, producto=self.producto, bodega=self.central,
+            fecha_vencimiento=self.hoy + timedelta(days=dias) if dias is not None else None,
+            cantidad_inicial=Decimal(disponible), cantidad_disponible=Decimal(disponible), **campos,
+        )
+
+    def test_reparte_en_orden_de_vencimiento(self):
+        self._lote('L-SIN-FECHA', None)
+        self._lote('L-TARDE', 30, costo_unitario=Decimal('2'))
+        self._lote('L-PRONTO', 5, disponible='3', costo_unitario=Decimal('1'))
+        self._lote('L-BLOQUEADO', 1, estado='BLOQUEADO')
+        self._lote('L-VENCIDO', 2, estado='VENCIDO')
+        self._lote('L-VENCE-HOY', 0)
+        self._lote('L-RESERVADO', 10, cantidad_reservada=Decimal('5'))
+
+        salidas = registrar_salida(self.producto, self.central.pk, Decimal('10'), self.usuario,
+                                   documento_referencia='GD-1')
+
+        self.assertEqual(
+            [(s.lote.codigo_lote, s.cantidad_stock, s.costo_unitario) for s in salidas],
+            [('L-PRONTO', Decimal('3'), Decimal('1')), ('L-TARDE', Decimal('5'), Decimal('2')),
+             ('L-SIN-FECHA', Decimal('2'), None)],
+        )
+        self.assertTrue(all(s.estado == 'CONFIRMADO' and s.tipo_movimiento == 'SALIDA' for s in salidas))
+        self.assertEqual(dict(Lote.objects.values_list('codigo_lote', 'cantidad_disponible'))['L-SIN-FECHA'],
+                         Decimal('3'))
+        self.assertEqual(Lote.objects.get(codigo_lote='L-PRONTO').estado, 'AGOTADO')
+        self.assertEqual(Lote.objects.get(codigo_lote='L-TARDE').estado, 'AGOTADO')
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('90'))
+        self.assertTrue(ParPendienteAlerta.objects.filter(producto=self.producto, bodega=self.central).exists())
+
+    def test_lotes_insuficientes_no_aplican_nada(self):
+        self._lote('L-1', 5)
+        with self.assertRaises(StockInsuficiente):
+            registrar_salida(self.producto, self.central.pk, Decimal('6'), self.usuario)
+        self.assertEqual(Lote.objects.get().cantidad_disponible, Decimal('5'))
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('100'))
+        self.assertFalse(MovimientoInventario.objects.filter(tipo_movimiento='SALIDA').exists())
+
+    def test_confirmar_movimiento_rechaza_salidas_con_lote(self):
+        lote = self._lote('L-1', 5)
+        sin_lote = movimiento(self, 'SALIDA', '1', bodega_origen=self.central)
+        con_lote = movimiento(self, 'SALIDA', '1', bodega_origen=self.central, lote=lote)
+        for salida in (sin_lote, con_lote):
+            with self.assertRaises(MovimientoInvalido):
+                confirmar_movimiento(salida, self.usuario)
+            self.assertEqual(MovimientoInventario.objects.get(pk=salida.pk).estado, 'PENDIENTE')
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('100'))
+        self.assertEqual(Lote.objects.get().cantidad_disponible, Decimal('5'))
+
+    def test_producto_sin_lote(self):
+        Producto.objects.filter(pk=self.producto.pk).update(perishable=False)
+        self.producto.refresh_from_db()
+        with self.assertRaises(MovimientoInvalido):
+            registrar_salida(self.producto, self.central.pk, Decimal('1'), self.usuario)
+
+    def test_replanifica_si_otro_consume_el_lote(self):
+        primero = self._lote('L-1', 5)
+        self._lote('L-2', 10)
+        original = lotes.asignar_lotes
+
+        def consumido_entretanto(*args, **kwargs):
+            asignaciones = original(*args, **kwargs)
+            Lote.objects.filter(pk=primero.pk).update(cantidad_disponible=Decimal('1'))
+            return asignaciones
+
+        with mock.patch.object(lotes, 'asignar_lotes', side_effect=consumido_entretanto):
+            salidas = registrar_salida(self.producto, self.central.pk, Decimal('4'), self.usuario)
+        self.assertEqual([(s.lote.codigo_lote, s.cantidad_stock) for s in salidas],
+                         [('L-1', Decimal('1')), ('L-2', Decimal('3'))])
+
+    def test_sentencias_no_crecen_con_los_lotes(self):
+        Lote.objects.bulk_create([
+            Lote(codigo_lote=f'L-{i}', producto=self.producto, bodega=self.central,
+                 fecha_vencimiento=self.hoy + timedelta(days=10 + i % 50),
+                 cantidad_inicial=Decimal('0.25'), cantidad_disponible=Decimal('0.25'))
+            for i in range(400)
+        ])
+        self.assertEqual(len(asignar_lotes(self.producto.pk, self.central.pk, Decimal('100'))), 400)
+
+        with CaptureQueriesContext(connection) as consultas:
+            salidas = registrar_salida(self.producto, self.central.pk, Decimal('75'), self.usuario)
+        self.assertEqual(len(salidas), 300)
+        self.assertLess(len(consultas), 20)
+        fechas = [s.lote.fecha_vencimiento for s in salidas]
+        self.assertEqual(fechas, sorted(fechas))
+        self.assertEqual(Lote.objects.filter(estado='ACTIVO').count(), 100)
+
+
+class ReservasTests(TestCase):
+    """Las reservas apartan stock sin pasar del disponible y se liberan al vencer"""
+
+    def setUp(self):
+        crear_datos(self)
+        confirmar_movimiento(movimiento(self, 'INGRESO', '10', bodega_destino=self.central), self.usuario)
+
+    def test_reserva_solo_lo_no_reservado(self):
+        reservar(self.producto, self.central.pk, Decimal('6'))
+        with self.assertRaises(StockInsuficiente):
+            reservar(self.producto, self.central.pk, Decimal('5'))
+        reservar(self.producto, self.central.pk, Decimal('4'))
+        with self.assertRaises(StockInsuficiente):
+            reservar(self.producto, self.sala.pk, Decimal('1'))   # sin fila de stock
+        fila = stock(self, self.central)
+        self.assertEqual((fila.cantidad_disponible, fila.cantidad_reservada), (Decimal('10'), Decimal('10')))
+
+    def test_convierte_a_unidad_de_stock(self):
+        with self.assertRaises(StockInsuficiente):
+            reservar(self.producto, self.central.pk, Decimal('1'), unidad=self.caja)   # 12 unidades
+        self.assertEqual(reservar(self.producto, self.central.pk, Decimal('0.5'), unidad=self.caja).cantidad,
+                         Decimal('6'))
+
+    def test_confirmar_y_liberar(self):
+        confirmada = reservar(self.producto, self.central.pk, Decimal('3'), documento_referencia='NV-7')
+        liberada = reservar(self.producto, self.central.pk, Decimal('2'))
+
+        salida = confirmar_reserva(confirmada, self.usuario)
+        liberar_reserva(liberada)
+        with self.assertRaises(ReservaNoActiva):
+            confirmar_reserva(confirmada, self.usuario)
+        with self.assertRaises(ReservaNoActiva):
+            liberar_reserva(liberada)
+
+        self.assertEqual((salida.tipo_movimiento, salida.estado, salida.cantidad_stock, salida.documento_referencia),
+                         ('SALIDA', 'CONFIRMADO', Decimal('3'), 'NV-7'))
+        self.assertEqual(Reserva.objects.get(pk=confirmada.pk).movimiento_id, salida.pk)
+        self.assertEqual(dict(Reserva.objects.values_list('pk', 'estado')),
+                         {confirmada.pk: 'CONFIRMADA', liberada.pk: 'LIBERADA'})
+        fila = stock(self, self.central)
+        self.assertEqual((fila.cantidad_disponible, fila.cantidad_reservada), (Decimal('7'), Decimal('0')))
+
+    def test_salida_no_toma_lo_reservado(self):
+        reserva = reservar(self.producto, self.central.pk, Decimal('8'))
+        salida = movimiento(self, 'SALIDA', '3', bodega_origen=self.central)
+        with self.assertRaises(StockInsuficiente):
+            confirmar_movimiento(salida, self.usuario)
+        self.assertEqual(MovimientoInventario.objects.get(pk=salida.pk).estado, 'PENDIENTE')
+
+        confirmar_movimiento(movimiento(self, 'SALIDA', '2', bodega_origen=self.central), self.usuario)
+        confirmar_reserva(reserva, self.usuario)
+        fila = stock(self, self.central)
+        self.assertEqual((fila.cantidad_disponible, fila.cantidad_reservada), (Decimal('0'), Decimal('0')))
+
+    def test_reserva_de_lote(self):
+        Producto.objects.filter(pk=self.producto.pk).update(control_por_lote=True)
+        self.producto.refresh_from_db()
+        lote = Lote.objects.create(codigo_lote='L-1', producto=self.producto, bodega=self.central,
+                                   cantidad_inicial=Decimal('4'), cantidad_disponible=Decimal('4'))
+        otro = Lote.objects.create(codigo_lote='L-2', producto=self.producto, bodega=self.central,
+                                   cantidad_inicial=Decimal('6'), cantidad_disponible=Decimal('6'))
+        reserva = reservar(self.producto, self.central.pk, Decimal('3'), lote_id=lote.pk)
+        with self.assertRaises(StockInsuficiente):
+            reservar(self.producto, self.central.pk, Decimal('2'), lote_id=lote.pk)
+
+        # La salida FEFO no toma lo reservado del lote
+        salidas = registrar_salida(self.producto, self.central.pk, Decimal('2'), self.usuario)
+        self.assertEqual([(s.lote_id, s.cantidad_stock) for s in salidas],
+                         [(lote.pk, Decimal('1')), (otro.pk, Decimal('1'))])
+
+        confirmar_reserva(reserva, self.usuario)
+        lote.refresh_from_db()
+        self.assertEqual((lote.cantidad_disponible, lote.cantidad_reservada, lote.estado),
+                         (Decimal('0'), Decimal('0'), 'AGOTADO'))
+        self.assertEqual(Lote.objects.get(pk=otro.pk).estado, 'ACTIVO')
+
+    def test_producto_con_lote_exige_el_lote(self):
+        sin_lote = reservar(self.producto, self.central.pk, Decimal('2'))   # anterior a la regla
+        Producto.objects.filter(pk=self.producto.pk).update(perishable=True)
+        self.producto.refresh_from_db()
+
+        with self.assertRaises(MovimientoInvalido):
+            reservar(self.producto, self.central.pk, Decimal('1'))
+        with self.assertRaises(MovimientoInvalido):
+            confirmar_reserva(sin_lote, self.usuario)
+        self.assertEqual(Reserva.objects.get(pk=sin_lote.pk).estado, 'ACTIVA')
+        self.assertFalse(MovimientoInventario.objects.filter(tipo_movimiento='SALIDA').exists())
+        fila = stock(self, self.central)
+        self.assertEqual((fila.cantidad_disponible, fila.cantidad_reservada), (Decimal('10'), Decimal('2')))
+
+    def test_expira_en_bloque(self):
+        ahora = timezone.now()
+        lote = Lote.objects.create(codigo_lote='L-1', producto=self.producto, bodega=self.central,
+                                   cantidad_inicial=Decimal('5'), cantidad_disponible=Decimal('5'))
+        vencidas = [
+            reservar(self.producto, self.central.pk, Decimal('2'), minutos=5),
+            reservar(self.producto, self.central.pk, Decimal('1'), minutos=5, lote_id=lote.pk),
+            reservar(self.producto, self.central.pk, Decimal('3'), minutos=10),
+        ]
+        vigente = reservar(self.producto, self.central.pk, Decimal('4'), minutos=60)
+
+        # Vencida aunque aún no se barre: ya no se puede confirmar
+        Reserva.objects.filter(pk=vencidas[0].pk).update(expira_en=ahora - timedelta(minutes=1))
+        with self.assertRaises(ReservaNoActiva):
+            confirmar_reserva(vencidas[0], self.usuario)
+
+        resultado = expirar_reservas(ahora + timedelta(minutes=30), limite=2)
+        self.assertEqual(resultado.expiradas, 3)
+        self.assertEqual(set(Reserva.objects.filter(estado='EXPIRADA').values_list('pk', flat=True)),
+                         {reserva.pk for reserva in vencidas})
+        self.assertEqual(Reserva.objects.get(pk=vigente.pk).estado, 'ACTIVA')
+        self.assertEqual(stock(self, self.central).cantidad_reservada, Decimal('4'))
+        self.assertEqual(Lote.objects.get(pk=lote.pk).cantidad_reservada, Decimal('0'))
+        self.assertEqual(expirar_reservas(ahora + timedelta(minutes=30)).expiradas, 0)
+
+    def test_no_expira_la_que_se_libero_entretanto(self):
+        liberada = reservar(self.producto, self.central.pk, Decimal('3'), minutos=5)
+        vencida = reservar(self.producto, self.central.pk, Decimal('2'), minutos=5)
+        ahora = timezone.now
+        liberando = []
+
+        def liberar_entre_lectura_y_update():
+            # Sin SKIP LOCKED otro proceso libera la reserva ya leída por el barrido
+            if not liberando:
+                liberando.append(True)
+                liberar_reserva(liberada)
+            return ahora()
+
+        with mock.patch('django.utils.timezone.now', side_effect=liberar_entre_lectura_y_update):
+            resultado = expirar_reservas(ahora() + timedelta(minutes=30))
+
+        self.assertEqual(resultado.expiradas, 1)
+        self.assertEqual(dict(Reserva.objects.values_list('pk', 'estado')),
+                         {liberada.pk: 'LIBERADA', vencida.pk: 'EXPIRADA'})
+        self.assertEqual(stock(self, self.central).cantidad_reservada, Decimal('0'))
+
+
+class ReservasConcurrenciaTests(TransactionTestCase):
+    """Reservas simultáneas sobre un mismo SKU nunca apartan más que el disponible"""
+
+    HILOS = 24
+
+    def setUp(self):
+        crear_datos(self)
+        confirmar_movimiento(movimiento(self, 'INGRESO', '10', bodega_destino=self.central), self.usuario)
+
+    def test_reservas_concurrentes_no_sobrevenden(self):
+        errores = []
+        inicio = threading.Barrier(self.HILOS)
+
+        def reservar_una():
+            try:
+                inicio.wait()
+                reservar(self.producto, self.central.pk, Decimal('1'))
+            except Exception as error:
+                errores.append(error)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservar_una) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(errores), self.HILOS - 10)
+        self.assertTrue(all(isinstance(error, StockInsuficiente) for error in errores))
+        self.assertEqual(stock(self, self.central).cantidad_reservada, Decimal('10'))
+        self.assertEqual(Reserva.objects.filter(estado='ACTIVA').count(), 10)
+
+
+class DisponibilidadTests(TestCase):
+    """La disponibilidad se sirve de la caché hasta que el stock del producto cambia"""
+
+    def setUp(self):
+        cache.clear()
+        crear_datos(self)
+        self.otro = Producto.objects.create(
+            sku='CHO-002', nombre='Bombón', categoria=self.producto.categoria,
+            uom_compra=self.und, uom_venta=self.und, uom_stock=self.und,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmar_movimiento(movimiento(self, 'INGRESO', '10', bodega_destino=self.central), self.usuario)
+        reiniciar_metricas()
+
+    def _par(self, bodega=None):
+        return disponibilidad([(self.producto.pk, (bodega or self.central).pk)])[(self.producto.pk, (bodega or self.central).pk)]
+
+    def test_lee_de_la_cache_y_cuenta_aciertos(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self._par().disponible, Decimal('10'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self._par().libre, Decimal('10'))
+        self.assertEqual(metricas(), {'aciertos': 1, 'fallos': 1, 'invalidaciones': 0, 'tasa_aciertos': 0.5})
+
+    def test_contabilizar_y_reservar_invalidan(self):
+        self._par()
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = reservar(self.producto, self.central.pk, Decimal('3'))
+        self.assertEqual((self._par().reservada, self._par().libre), (Decimal('3'), Decimal('7')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmar_reserva(reserva, self.usuario)
+        self.assertEqual((self._par().disponible, self._par().reservada), (Decimal('7'), Decimal('0')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmar_movimiento(movimiento(self, 'TRANSFERENCIA', '2', bodega_origen=self.central,
+                                            bodega_destino=self.sala), self.usuario)
+        self.assertEqual(self._par(self.sala).transito, Decimal('2'))
+        # Una subida de versión por cada cambio de fila confirmado
+        self.assertGreaterEqual(metricas()['invalidaciones'], 3)
+
+    def test_varios_productos_en_una_llamada(self):
+        pares = [(producto.pk, bodega.pk) for producto in (self.producto, self.otro)
+                 for bodega in (self.central, self.sala)]
+        with self.assertNumQueries(1):
+            cantidades = disponibilidad(pares)
+        self.assertEqual(cantidades[(self.producto.pk, self.central.pk)].disponible, Decimal('10'))
+        self.assertEqual(cantidades[(self.otro.pk, self.sala.pk)].disponible, Decimal('0'))
+        with self.assertNumQueries(0):
+            disponibilidad(pares)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmar_movimiento(movimiento(self, 'TRANSFERENCIA', '4', bodega_origen=self.central,
+                                            bodega_destino=self.sala), self.usuario)
+        with self.assertNumQueries(1):
+            totales = disponibilidad_total([self.producto.pk, self.otro.pk])
+        self.assertEqual((totales[self.producto.pk].disponible, totales[self.producto.pk].transito),
+                         (Decimal('6'), Decimal('4')))
+        self.assertEqual(totales[self.otro.pk].disponible, Decimal('0'))
+        # Solo el producto que cambió vuelve a la base de datos
+        with self.assertNumQueries(1):
+            disponibilidad(pares)
+
+    def test_version_desalojada_no_sirve_valores_anteriores(self):
+        self._par()
+        cache.delete(f'disponibilidad:version:{self.producto.pk}')
+        StockActual.objects.filter(producto=self.producto).update(cantidad_disponible=Decimal('4'))
+        self.assertEqual(self._par().disponible, Decimal('4'))
+
+
+class ConfirmarMovimientoConcurrenciaTests(TransactionTestCase):
+    """Postings simultáneos sobre el mismo (producto, bodega) no pierden actualizaciones"""
+
+    HILOS = 24
+
+    def setUp(self):
+        crear_datos(self)
+
+    def _en_paralelo(self, movimientos):
+        errores = []
+        inicio = threading.Barrier(len(movimientos))
+
+        def confirmar(mov):
+            try:
+                inicio.wait()
+                confirmar_movimiento(mov, self.usuario)
+            except Exception as error:
+                errores.append(error)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=confirmar, args=(mov,)) for mov in movimientos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return errores
+
+    def test_ingresos_y_salidas_concurrentes(self):
+        confirmar_movimiento(movimiento(self, 'INGRESO', '100', bodega_destino=self.central), self.usuario)
+        movimientos = [
+            movimiento(self, 'INGRESO', '3', bodega_destino=self.central) if i % 2 else
+            movimiento(self, 'SALIDA', '2', bodega_origen=self.central)
+            for i in range(self.HILOS)
+        ]
+
+        self.assertEqual(self._en_paralelo(movimientos), [])
+        mitad = self.HILOS // 2
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal(100 + 3 * mitad - 2 * mitad))
+        self.assertEqual(
+            MovimientoInventario.objects.filter(estado='CONFIRMADO').count(), self.HILOS + 1,
+        )
+
+    def test_salidas_concurrentes_nunca_dejan_stock_negativo(self):
+        confirmar_movimiento(movimiento(self, 'INGRESO', '10', bodega_destino=self.central), self.usuario)
+        movimientos = [movimiento(self, 'SALIDA', '1', bodega_origen=self.central) for _ in range(self.HILOS)]
+
+        errores = self._en_paralelo(movimientos)
+        self.assertEqual(len(errores), self.HILOS - 10)
+        self.assertTrue(all(isinstance(error, StockInsuficiente) for error in errores))
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('0'))
+
+    def test_el_mismo_movimiento_confirmado_en_paralelo_se_aplica_una_vez(self):
+        ingreso = movimiento(self, 'INGRESO', '7', bodega_destino=self.central)
+
+        errores = self._en_paralelo([ingreso] * self.HILOS)
+        self.assertEqual(len(errores), self.HILOS - 1)
+        self.assertTrue(all(isinstance(error, MovimientoNoPendiente) for error in errores))
+        self.assertEqual(stock(self, self.central).cantidad_disponible, Decimal('7'))
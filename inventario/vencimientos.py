@@ -0,0 +1,140 @@
+"""
+Vencimiento de lotes: estados VENCIDO/AGOTADO y alertas POR_VENCER/VENCIDO
+
+`procesar_vencimientos` corre una vez al día. Un lote vence el día de su
+`fecha_vencimiento` y se avisa VENCIMIENTO_DIAS_AVISO días antes. La marca
+guarda el último día procesado, así cada corrida solo lee (por el índice de
+`fecha_vencimiento`) los lotes cuya fecha cruzó un umbral desde entonces:
+
+- vencen: fecha_vencimiento en (último día, hoy]
+- entran en aviso: fecha_vencimiento en (último día + aviso, hoy + aviso]
+
+Un lote recibido (o modificado) después de la corrida anterior puede haber
+cruzado ya un umbral que la ventana no vuelve a mirar: uno que llega cinco
+días antes de vencer, o ya vencido. Por eso también se revisan, por el
+índice de `updated_at`, los lotes cambiados desde la corrida anterior (la
+hora en que se guardó la marca, con un margen por las transacciones que
+confirmaron durante ella) con fecha_vencimiento <= hoy o <= hoy + aviso.
+
+Si la tarea deja de correr unos días, la siguiente toma todos los días
+pendientes. Solo cambian de estado los lotes ACTIVO (uno BLOQUEADO queda
+como está): con saldo pasan a VENCIDO y sin saldo a AGOTADO. Las alertas no
+se repiten si el lote ya tiene una pendiente (ACTIVA o IGNORADA) del mismo
+tipo, y la POR_VENCER se resuelve cuando el lote vence.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .alertas import PENDIENTES, ajustar_contadores
+from .models import AlertaStock, Lote, MarcaProceso
+from .saldos import inicio_del_dia
+
+
+MARCA_VENCIMIENTOS = 'vencimientos_lotes'
+
+TAMANO_INSERCION = 1000
+
+# Los lotes confirmados mientras corría la pasada anterior quedan antes de su marca
+MARGEN_CAMBIOS = timedelta(hours=1)
+
+
+@dataclass
+class ResultadoVencimientos:
+    desde: object = None    # primer día procesado
+    hasta: object = None    # último día procesado (hoy)
+    vencidos: int = 0
+    agotados: int = 0
+    alertas: int = 0
+
+
+def _ventana(anterior, hoy, cambiados_desde, dias=0):
+    """Lotes cuya fecha cruzó el umbral desde el último día, o cambiados desde la corrida anterior"""
+    limite = hoy + timedelta(days=dias)
+    if anterior is None:
+        return Q(fecha_vencimiento__lte=limite)
+    return (
+        Q(fecha_vencimiento__gt=anterior + timedelta(days=dias), fecha_vencimiento__lte=limite)
+        | Q(updated_at__gte=cambiados_desde, fecha_vencimiento__lte=limite)
+    )
+
+
+def _prioridad(dias):
+    if dias <= 0:
+        return 'CRITICA'
+    if dias <= 7:
+        return 'ALTA'
+    if dias <= 15:
+        return 'MEDIA'
+    return 'BAJA'
+
+
+def _alertas(lotes, tipo, hoy, ahora):
+    """Alertas nuevas del tipo para los lotes (los que ya tienen una pendiente se saltan)"""
+    lotes = list(lotes.values_list('pk', 'producto_id', 'bodega_id', 'cantidad_disponible', 'fecha_vencimiento'))
+    con_alerta = set(
+        AlertaStock.objects.filter(
+            tipo_alerta=tipo, estado__in=PENDIENTES, lote_id__in=[lote[0] for lote in lotes],
+        ).values_list('lote_id', flat=True)
+    ) if lotes else set()
+    alertas = []
+    for lote_id, producto_id, bodega_id, disponible, vencimiento in lotes:
+        if lote_id in con_alerta:
+            continue
+        dias = (vencimiento - hoy).days
+        alertas.append(AlertaStock(
+            producto_id=producto_id, bodega_id=bodega_id, lote_id=lote_id, tipo_alerta=tipo,
+            cantidad_actual=disponible, fecha_vencimiento=vencimiento, dias_vencimiento=dias,
+            prioridad=_prioridad(dias), fecha_generacion=ahora,
+        ))
+    AlertaStock.objects.bulk_create(alertas, batch_size=TAMANO_INSERCION)
+    return len(alertas)
+
+
+def procesar_vencimientos(hoy=None):
+    """Procesa los días pendientes hasta `hoy` (por defecto, hoy). Retorna un ResultadoVencimientos"""
+    ahora = timezone.now()
+    hoy = hoy or timezone.localdate(ahora)
+    aviso = settings.VENCIMIENTO_DIAS_AVISO
+
+    with transaction.atomic():
+        # Una corrida a la vez, y la marca avanza junto con los cambios
+        MarcaProceso.objects.get_or_create(nombre=MARCA_VENCIMIENTOS)
+        marca = MarcaProceso.objects.select_for_update().get(nombre=MARCA_VENCIMIENTOS)
+        anterior = timezone.localdate(marca.hasta) if marca.hasta else None
+        cambiados_desde = marca.updated_at - MARGEN_CAMBIOS
+        resultado = ResultadoVencimientos(anterior + timedelta(days=1) if anterior else None, hoy)
+        if anterior is not None and anterior >= hoy:
+            return resultado
+
+        activos = Lote.objects.filter(estado='ACTIVO')
+        vencen = activos.filter(_ventana(anterior, hoy, cambiados_desde))
+        con_saldo = vencen.filter(cantidad_disponible__gt=0)
+
+        por_vencer = AlertaStock.objects.filter(tipo_alerta='POR_VENCER', lote__in=vencen)
+        resueltas = {
+            estado: por_vencer.filter(estado=estado).update(
+                estado='RESUELTA', fecha_resolucion=ahora, motivo_resolucion='El lote venció',
+            )
+            for estado in PENDIENTES
+        }
+        resultado.alertas += _alertas(con_saldo, 'VENCIDO', hoy, ahora)
+        resultado.alertas += _alertas(
+            activos.filter(_ventana(anterior, hoy, cambiados_desde, aviso), cantidad_disponible__gt=0)
+            .exclude(fecha_vencimiento__lte=hoy),
+            'POR_VENCER', hoy, ahora,
+        )
+        # bulk_create y update no disparan las señales de los contadores del dashboard
+        ajustar_contadores(resultado.alertas, resueltas)
+
+        resultado.vencidos = con_saldo.update(estado='VENCIDO', updated_at=ahora)
+        resultado.agotados = vencen.filter(cantidad_disponible__lte=0).update(estado='AGOTADO', updated_at=ahora)
+
+        marca.hasta = inicio_del_dia(hoy)
+        marca.filas = resultado.vencidos + resultado.agotados
+        marca.save(update_fields=['hasta', 'filas', 'updated_at'])
+    return resultado
@@ -1,3 +1,424 @@
-from django.shortcuts import render
+import json
+import tempfile
+from datetime import datetime
+from decimal import Decimal
 
-# Create your views here.
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from autenticacion.permisos import obtener_permisos
+from maestros.models import Producto, UnidadMedida
+from .analitica import COLUMNAS_MOVIMIENTOS, COLUMNAS_STOCK, escribir_parquet, recorrer
+from .cargas import CargaInvalida, contabilizar_carga
+from .disponibilidad import disponibilidad, disponibilidad_total, metricas
+from .kardex import TAMANO_PAGINA, kardex
+from .lotes import registrar_salida
+from .models import MovimientoInventario, Reserva, StockActual
+from .reservas import confirmar_reserva, liberar_reserva, reservar
+from .saldos import stock_a_fecha
+from .stock import ErrorStock
+
+
+@login_required(login_url='login')
+def exportar_analitica(request, conjunto):
+    """
+    Descarga en Parquet los movimientos de un mes (?mes=AAAA-MM, por defecto
+    el actual) o la foto del stock actual
+    """
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'exportar'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para exportar inventario'
+        }, status=403)
+    
+    if conjunto == 'movimientos':
+        mes = request.GET.get('mes') or f'{timezone.localtime():%Y-%m}'
+        try:
+            inicio = timezone.make_aware(datetime.strptime(mes, '%Y-%m'))
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Mes inválido (formato AAAA-MM)'}, status=400)
+        fin = timezone.make_aware(
+            datetime(inicio.year + 1, 1, 1) if inicio.month == 12 else datetime(inicio.year, inicio.month + 1, 1)
+        )
+        movimientos = MovimientoInventario.objects.filter(fecha_movimiento__gte=inicio, fecha_movimiento__lt=fin)
+        columnas = COLUMNAS_MOVIMIENTOS
+        filas = recorrer(movimientos, columnas, orden='fecha_movimiento')
+        nombre = f'movimientos_{mes}.parquet'
+    elif conjunto == 'stock':
+        columnas = COLUMNAS_STOCK
+        filas = recorrer(StockActual.objects.all(), columnas)
+        nombre = f'stock_{timezone.localtime():%Y%m%d_%H%M%S}.parquet'
+    else:
+        return JsonResponse({'success': False, 'message': 'Conjunto inválido'}, status=404)
+    
+    # El archivo se arma en disco por grupos de filas y se envía por partes
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir_parquet(archivo, columnas, filas)
+    except ImproperlyConfigured as error:
+        archivo.close()
+        return JsonResponse({'success': False, 'message': str(error)}, status=503)
+    except BaseException:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    
+    return FileResponse(archivo, as_attachment=True, filename=nombre,
+                        content_type='application/vnd.apache.parquet')
+
+
+@login_required(login_url='login')
+def cargar_movimientos(request):
+    """
+    Contabiliza una carga masiva de movimientos (JSON):
+    {"carga": "<clave>", "movimientos": [{...}, ...]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'crear'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para registrar movimientos'
+        }, status=403)
+    
+    usuario = getattr(request.user, 'usuario_profile', None)
+    if usuario is None:
+        return JsonResponse({'success': False, 'message': 'El usuario no tiene perfil'}, status=403)
+    
+    try:
+        datos = json.loads(request.body)
+        clave, filas = str(datos['carga']).strip(), datos['movimientos']
+        if not clave or not isinstance(filas, list) or not all(isinstance(f, dict) for f in filas):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Se espera {"carga": "<clave>", "movimientos": [...]}'
+        }, status=400)
+    
+    try:
+        resultado = contabilizar_carga(clave, filas, usuario)
+    except CargaInvalida as error:
+        return JsonResponse({
+            'success': False,
+            'message': str(error),
+            'errores': [{'indice': indice, 'error': mensaje} for indice, mensaje in error.errores[:100]],
+        }, status=400)
+    except ErrorStock as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=409)
+    
+    carga = resultado.carga
+    return JsonResponse({
+        'success': True,
+        'message': 'Carga ya contabilizada' if resultado.repetida else 'Carga contabilizada',
+        'carga': carga.clave,
+        'repetida': resultado.repetida,
+        'movimientos': carga.total_movimientos,
+        'filas_stock': carga.filas_stock,
+        'segundos': round(carga.segundos, 3),
+        'movimientos_por_segundo': round(resultado.movimientos_por_segundo, 1),
+    })
+
+
+@login_required(login_url='login')
+def stock_historico(request):
+    """
+    Stock de un producto en una bodega en un momento dado:
+    ?producto=<id>&bodega=<id>&fecha=<AAAA-MM-DD o fecha y hora>
+    (solo la fecha: al cierre de ese día)
+    """
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'ver'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para ver inventario'
+        }, status=403)
+    
+    try:
+        producto_id, bodega_id = int(request.GET['producto']), int(request.GET['bodega'])
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'message': 'Se requieren producto y bodega'}, status=400)
+    
+    try:
+        momento = _fecha_parametro(request.GET.get('fecha', ''), fin_del_dia=True)
+    except ValueError as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=400)
+    
+    disponible, transito = stock_a_fecha(producto_id, bodega_id, momento)
+    return JsonResponse({
+        'success': True,
+        'producto': producto_id,
+        'bodega': bodega_id,
+        'fecha': momento.isoformat(),
+        'cantidad_disponible': str(disponible),
+        'cantidad_transito': str(transito),
+    })
+
+
+def _fecha_parametro(valor, fin_del_dia=False):
+    """Fecha y hora de un parámetro GET (solo la fecha: inicio o fin del día)"""
+    momento = parse_datetime(valor)
+    if momento is None and parse_date(valor) is not None:
+        momento = datetime.combine(parse_date(valor), datetime.max.time() if fin_del_dia else datetime.min.time())
+    if momento is None:
+        raise ValueError(f'Fecha inválida: {valor}')
+    return timezone.make_aware(momento) if timezone.is_naive(momento) else momento
+
+
+@login_required(login_url='login')
+def kardex_producto(request, producto_id, bodega_id):
+    """
+    Kardex de un producto en una bodega con saldo acumulado:
+    ?desde=&hasta=&limite=&cursor=<siguiente de la página anterior>
+    """
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'ver'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para ver inventario'
+        }, status=403)
+    
+    try:
+        desde = _fecha_parametro(request.GET['desde']) if request.GET.get('desde') else None
+        hasta = _fecha_parametro(request.GET['hasta'], fin_del_dia=True) if request.GET.get('hasta') else None
+        pagina = kardex(producto_id, bodega_id, desde=desde, hasta=hasta, cursor=request.GET.get('cursor'),
+                        limite=request.GET.get('limite') or TAMANO_PAGINA)
+    except ValueError as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'producto': producto_id,
+        'bodega': bodega_id,
+        'saldo_inicial': str(pagina.saldo_inicial),
+        'valor_inicial': str(pagina.valor_inicial),
+        'movimientos': [
+            {
+                **fila,
+                'fecha_movimiento': fila['fecha_movimiento'].isoformat(),
+                **{campo: str(fila[campo]) for campo in ('cantidad', 'valor', 'saldo', 'saldo_valor')},
+            }
+            for fila in pagina.movimientos
+        ],
+        'siguiente': pagina.siguiente,
+    })
+
+
+@login_required(login_url='login')
+def salida_fefo(request):
+    """
+    Salida de un producto con lote, asignada por FEFO (JSON):
+    {"producto_id", "bodega_id", "cantidad", "unidad_medida_id"?, "documento_referencia"?, "observaciones"?}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'crear'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para registrar movimientos'
+        }, status=403)
+    
+    usuario = getattr(request.user, 'usuario_profile', None)
+    if usuario is None:
+        return JsonResponse({'success': False, 'message': 'El usuario no tiene perfil'}, status=403)
+    
+    try:
+        datos = json.loads(request.body)
+        producto = Producto.objects.select_related('uom_stock').get(pk=datos['producto_id'])
+        unidad = UnidadMedida.objects.get(pk=datos['unidad_medida_id']) if datos.get('unidad_medida_id') else None
+        cantidad = Decimal(str(datos['cantidad']))
+        bodega_id = int(datos['bodega_id'])
+    except (ValueError, KeyError, TypeError, ArithmeticError, Producto.DoesNotExist, UnidadMedida.DoesNotExist):
+        return JsonResponse({
+            'success': False,
+            'message': 'Se espera {"producto_id", "bodega_id", "cantidad"} válidos'
+        }, status=400)
+    
+    try:
+        movimientos = registrar_salida(
+            producto, bodega_id, cantidad, usuario, unidad=unidad,
+            **{campo: datos[campo] for campo in ('documento_referencia', 'observaciones') if datos.get(campo)},
+        )
+    except ErrorStock as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=409)
+    
+    return JsonResponse({
+        'success': True,
+        'message': 'Salida registrada',
+        'movimientos': [
+            {'lote': mov.lote_id, 'cantidad': str(mov.cantidad_stock), 'costo_unitario': str(mov.costo_unitario) if mov.costo_unitario is not None else None}
+            for mov in movimientos
+        ],
+    })
+
+
+def _reserva_json(reserva):
+    return {
+        'id': reserva.pk,
+        'producto': reserva.producto_id,
+        'bodega': reserva.bodega_id,
+        'lote': reserva.lote_id,
+        'cantidad': str(reserva.cantidad),
+        'estado': reserva.estado,
+        'expira_en': reserva.expira_en.isoformat(),
+    }
+
+
+@login_required(login_url='login')
+def crear_reserva(request):
+    """
+    Reserva stock para un pedido (JSON):
+    {"producto_id", "bodega_id", "cantidad", "lote_id"?, "minutos"?, "documento_referencia"?}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'crear'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para reservar stock'
+        }, status=403)
+    
+    try:
+        datos = json.loads(request.body)
+        producto = Producto.objects.select_related('uom_stock').get(pk=datos['producto_id'])
+        cantidad = Decimal(str(datos['cantidad']))
+        bodega_id = int(datos['bodega_id'])
+        lote_id = int(datos['lote_id']) if datos.get('lote_id') else None
+        minutos = int(datos['minutos']) if datos.get('minutos') else None
+    except (ValueError, KeyError, TypeError, ArithmeticError, Producto.DoesNotExist):
+        return JsonResponse({
+            'success': False,
+            'message': 'Se espera {"producto_id", "bodega_id", "cantidad"} válidos'
+        }, status=400)
+    
+    try:
+        reserva = reservar(
+            producto, bodega_id, cantidad, usuario=getattr(request.user, 'usuario_profile', None),
+            lote_id=lote_id, minutos=minutos, documento_referencia=datos.get('documento_referencia'),
+        )
+    except ErrorStock as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=409)
+    
+    return JsonResponse({'success': True, 'message': 'Stock reservado', 'reserva': _reserva_json(reserva)})
+
+
+@login_required(login_url='login')
+def terminar_reserva(request, reserva_id, accion):
+    """Confirma (registra la salida) o libera una reserva activa"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'crear'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para modificar reservas'
+        }, status=403)
+    
+    usuario = getattr(request.user, 'usuario_profile', None)
+    if usuario is None:
+        return JsonResponse({'success': False, 'message': 'El usuario no tiene perfil'}, status=403)
+    
+    reserva = Reserva.objects.filter(pk=reserva_id).first()
+    if reserva is None:
+        return JsonResponse({'success': False, 'message': 'Reserva no encontrada'}, status=404)
+    
+    try:
+        if accion == 'confirmar':
+            confirmar_reserva(reserva, usuario)
+        elif accion == 'liberar':
+            liberar_reserva(reserva)
+        else:
+            return JsonResponse({'success': False, 'message': f'Acción desconocida: {accion}'}, status=404)
+    except ErrorStock as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=409)
+    
+    reserva.refresh_from_db()
+    return JsonResponse({
+        'success': True,
+        'message': 'Reserva confirmada' if accion == 'confirmar' else 'Reserva liberada',
+        'reserva': _reserva_json(reserva),
+    })
+
+
+# Productos por consulta de disponibilidad
+MAXIMO_DISPONIBILIDAD = 1000
+
+
+def _ids(valor):
+    return sorted({int(parte) for parte in valor.split(',') if parte.strip()})
+
+
+def _disponibilidad_json(cantidades):
+    return {
+        'disponible': str(cantidades.disponible),
+        'reservada': str(cantidades.reservada),
+        'transito': str(cantidades.transito),
+        'libre': str(cantidades.libre),
+    }
+
+
+@login_required(login_url='login')
+def consultar_disponibilidad(request):
+    """
+    Disponibilidad (cacheada) de varios productos: ?productos=1,2,3 suma
+    todas las bodegas; con &bodegas=4,5 se entrega por bodega
+    """
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'ver'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para ver inventario'
+        }, status=403)
+    
+    try:
+        productos = _ids(request.GET.get('productos', ''))
+        bodegas = _ids(request.GET.get('bodegas', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Se esperan ids separados por coma'}, status=400)
+    if not productos or len(productos) * max(len(bodegas), 1) > MAXIMO_DISPONIBILIDAD:
+        return JsonResponse({
+            'success': False,
+            'message': f'Indica entre 1 y {MAXIMO_DISPONIBILIDAD} combinaciones de producto y bodega'
+        }, status=400)
+    
+    if bodegas:
+        cantidades = disponibilidad((producto_id, bodega_id) for producto_id in productos for bodega_id in bodegas)
+        resultado = [
+            {'producto': producto_id, 'bodega': bodega_id, **_disponibilidad_json(cantidades[(producto_id, bodega_id)])}
+            for producto_id in productos for bodega_id in bodegas
+        ]
+    else:
+        totales = disponibilidad_total(productos)
+        resultado = [
+            {'producto': producto_id, **_disponibilidad_json(totales[producto_id])} for producto_id in productos
+        ]
+    return JsonResponse({'success': True, 'disponibilidad': resultado})
+
+
+@login_required(login_url='login')
+def metricas_disponibilidad(request):
+    """Aciertos y fallos de la caché de disponibilidad, para dimensionarla"""
+    
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('inventario', 'ver'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para ver inventario'
+        }, status=403)
+    
+    return JsonResponse({'success': True, **metricas()})
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from autenticacion.contadores import actualizar_masivo
 from .models import Categoria, Marca, UnidadMedida, Proveedor, Producto, ProductoProveedor
 
 
@@ -119,13 +120,13 @@ class ProductoAdmin(admin.ModelAdmin):
     
     # Acción personalizada para activar productos
     def activar_productos(self, request, queryset):
-        updated = queryset.update(estado='ACTIVO')
+        updated = actualizar_masivo(queryset, estado='ACTIVO')
         self.message_user(request, f'{updated} productos activados correctamente.')
     activar_productos.short_description = "Activar productos seleccionados"
     
     # Acción personalizada para descontinuar productos
     def descontinuar_productos(self, request, queryset):
-        updated = queryset.update(estado='DESCONTINUADO')
+        updated = actualizar_masivo(queryset, estado='DESCONTINUADO')
         self.message_user(request, f'{updated} productos descontinuados correctamente.')
     descontinuar_productos.short_description = "Descontinuar productos seleccionados"
     
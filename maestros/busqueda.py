@@ -0,0 +1,162 @@
+"""
+Búsqueda indexada de proveedores
+
+Cada proveedor guarda en `texto_busqueda` sus campos buscables normalizados
+(minúsculas y sin tildes, así "Nestlé" se encuentra con "nestle"). Sobre
+esa columna hay un índice de texto completo según el motor:
+
+- SQLite: tabla virtual FTS5 `proveedores_fts` con tokenizador trigram,
+  sincronizada con `proveedores` mediante triggers.
+- MySQL: índice FULLTEXT con el parser ngram.
+
+Los resultados se anotan con `relevancia` (mayor es mejor). Si el índice no
+existe o el término es muy corto para el índice de trigramas, se busca con
+LIKE sobre `texto_busqueda`.
+"""
+import unicodedata
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, StrIndex
+
+
+CAMPOS_BUSCABLES = ['rut_nif', 'razon_social', 'nombre_fantasia', 'email', 'telefono', 'ciudad']
+
+# Largo mínimo de cada palabra para usar el índice de trigramas
+LARGO_MINIMO = 3
+
+TABLA_FTS = 'proveedores_fts'
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes ni espacios repetidos"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def texto_busqueda(proveedor):
+    """Contenido de `Proveedor.texto_busqueda`"""
+    return normalizar(' '.join(str(getattr(proveedor, campo) or '') for campo in CAMPOS_BUSCABLES))
+
+
+# --- Índice -----------------------------------------------------------------
+
+SQL_INDICE_SQLITE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        texto_busqueda, content='proveedores', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON proveedores BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON proveedores BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF texto_busqueda ON proveedores BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda);
+        INSERT INTO {TABLA_FTS}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda);
+    END""",
+    f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')",
+]
+
+SQL_INDICE_MYSQL = [
+    'ALTER TABLE proveedores ADD FULLTEXT INDEX proveedores_texto_ft (texto_busqueda) WITH PARSER ngram',
+]
+
+
+def crear_indice(conexion):
+    """
+    Crea (o reconstruye) el índice de texto completo. Es idempotente en
+    SQLite; conviene volver a ejecutarlo si una migración recrea la tabla
+    `proveedores`, porque SQLite descarta sus triggers.
+    Retorna False si el motor no lo soporta.
+    """
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            try:
+                for sql in SQL_INDICE_SQLITE:
+                    cursor.execute(sql)
+            except Exception:
+                # SQLite sin FTS5 o anterior a 3.34 (sin tokenizador trigram)
+                return False
+            return True
+        if conexion.vendor == 'mysql':
+            cursor.execute(
+                "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                "AND table_name = 'proveedores' AND index_name = 'proveedores_texto_ft'"
+            )
+            if not cursor.fetchone()[0]:
+                for sql in SQL_INDICE_MYSQL:
+                    cursor.execute(sql)
+            return True
+    return False
+
+
+def eliminar_indice(conexion):
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            for sufijo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}')
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLA_FTS}')
+        elif conexion.vendor == 'mysql':
+            cursor.execute('ALTER TABLE proveedores DROP INDEX proveedores_texto_ft')
+
+
+_indice_disponible = {}
+
+
+def indice_disponible():
+    """Si la base de datos actual tiene el índice (se consulta una vez por base)"""
+    clave = (connection.vendor, connection.settings_dict['NAME'])
+    if clave not in _indice_disponible:
+        if connection.vendor == 'sqlite':
+            _indice_disponible[clave] = TABLA_FTS in connection.introspection.table_names()
+        else:
+            _indice_disponible[clave] = connection.vendor == 'mysql'
+    return _indice_disponible[clave]
+
+
+# --- Consulta ---------------------------------------------------------------
+
+def _relevancia_por_posicion(palabras):
+    """
+    Relevancia según dónde aparece cada palabra en `texto_busqueda`: el RUT y
+    la razón social van primero, así que una coincidencia temprana pesa más.
+    Solo se evalúa sobre las filas que ya pasaron el filtro.
+    """
+    relevancia = Value(0.0, output_field=FloatField())
+    for palabra in palabras:
+        posicion = Cast(StrIndex('texto_busqueda', Value(palabra)), FloatField())
+        relevancia = relevancia + Value(1.0, output_field=FloatField()) / posicion
+    return relevancia
+
+
+def buscar_proveedores(queryset, termino):
+    """
+    Filtra `queryset` por el término y lo anota con `relevancia`.
+
+    Todas las palabras del término deben aparecer (en cualquier campo).
+    """
+    palabras = normalizar(termino).split()
+    if not palabras:
+        return queryset.annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+    if connection.vendor == 'mysql' and indice_disponible():
+        consulta = ' '.join('+"{}"'.format(p.replace('"', '')) for p in palabras)
+        relevancia = RawSQL(
+            'MATCH(proveedores.texto_busqueda) AGAINST (%s IN BOOLEAN MODE)', [consulta],
+            output_field=FloatField(),
+        )
+        return queryset.annotate(relevancia=relevancia).filter(relevancia__gt=0)
+
+    if indice_disponible() and min(len(p) for p in palabras) >= LARGO_MINIMO:
+        # Cada palabra como frase entre comillas: FTS5 no interpreta operadores
+        consulta = ' '.join('"{}"'.format(p.replace('"', '""')) for p in palabras)
+        queryset = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [consulta])
+        )
+    else:
+        for palabra in palabras:
+            queryset = queryset.filter(texto_busqueda__contains=palabra)
+    return queryset.annotate(relevancia=_relevancia_por_posicion(palabras))
@@ -0,0 +1,158 @@
+"""
+Índice en memoria de códigos EAN/SKU para los lectores de código de barras
+
+Cada proceso mantiene un diccionario código -> producto con los datos que
+necesita el escáner, así resolver un código no toca la base de datos ni
+toma locks. El índice lo mantiene un hilo de fondo que arranca con la
+primera búsqueda: carga todo una vez (solo esa primera búsqueda espera) y
+luego cada ESCANER_REFRESCO segundos aplica los productos cuyo `updated_at`
+cambió. Cada ESCANER_RECARGA_COMPLETA segundos recarga entero para
+descartar productos eliminados.
+
+La búsqueda de cambios relee MARGEN_CAMBIOS hacia atrás desde el mayor
+`updated_at` visto: un guardado que confirma tarde puede quedar con una
+hora anterior a la de otro ya indexado. Lo releído que no cambió (mismo
+`updated_at` ya indexado) se salta.
+
+El hilo es el único que escribe. La recarga completa arma diccionarios
+nuevos y los reemplaza de una vez; la incremental modifica los actuales
+producto por producto, primero agregando los códigos nuevos y después
+quitando los que ya no aplican, así una búsqueda simultánea ve el dato
+anterior o el nuevo, nunca un código faltante.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Producto
+
+
+logger = logging.getLogger(__name__)
+
+# Cuánto se relee antes del mayor updated_at visto (transacciones lentas)
+MARGEN_CAMBIOS = timedelta(seconds=60)
+
+CAMPOS = ['id', 'sku', 'ean_upc', 'nombre', 'precio_venta', 'impuesto_iva',
+          'estado', 'uom_venta__codigo', 'updated_at']
+
+
+class IndiceNoDisponible(Exception):
+    """La carga inicial del índice falló; el hilo de fondo la reintenta"""
+
+
+class IndiceProductos:
+    """Índice código (EAN o SKU) -> atributos del producto"""
+
+    def __init__(self):
+        self._por_codigo = {}   # código -> datos del producto
+        self._codigos = {}      # producto_id -> (sku, ean) indexados
+        self._desde = None      # mayor updated_at visto
+        self._vistos = {}       # id -> updated_at indexado, dentro del margen
+        self._ultima_carga = None
+        self._cargado = False
+        self._listo = threading.Event()     # primera carga intentada
+        self._lock = threading.Lock()       # solo para arrancar el hilo una vez
+        self._hilo = None
+        self._detener = threading.Event()
+
+    def buscar(self, codigo):
+        """Datos del producto con ese EAN o SKU, o None"""
+        if not self._listo.is_set():
+            self._arrancar()
+        if not self._cargado:
+            raise IndiceNoDisponible('El índice de productos aún no está cargado')
+        return self._por_codigo.get(codigo.strip())
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._mantener, name='indice-escaner', daemon=True)
+                self._hilo.start()
+        self._listo.wait()
+
+    def _mantener(self):
+        while True:
+            try:
+                self.refrescar()
+            except Exception:
+                logger.exception('No se pudo refrescar el índice de productos del escáner')
+            finally:
+                self._listo.set()
+                connection.close()
+            if self._detener.wait(getattr(settings, 'ESCANER_REFRESCO', 5)):
+                return
+
+    def detener(self):
+        """Termina el hilo de fondo (p. ej. al cerrar el proceso o en las pruebas)"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def refrescar(self):
+        """Aplica los cambios desde el último refresco, o recarga todo si corresponde"""
+        recarga = getattr(settings, 'ESCANER_RECARGA_COMPLETA', 600)
+        ahora = time.monotonic()
+        if not self._cargado or ahora - self._ultima_carga >= recarga:
+            self._cargar_todo()
+            self._ultima_carga = ahora
+            self._cargado = True
+            self._listo.set()
+        else:
+            self._cargar_cambios()
+
+    def _cargar_todo(self):
+        por_codigo, codigos = {}, {}
+        self._desde, self._vistos = None, {}
+        for fila in Producto.objects.values(*CAMPOS).iterator(chunk_size=2000):
+            self._indexar(fila, por_codigo, codigos)
+        # Las búsquedas pasan a los diccionarios nuevos de una vez
+        self._por_codigo, self._codigos = por_codigo, codigos
+        self._podar()
+
+    def _cargar_cambios(self):
+        filas = Producto.objects.values(*CAMPOS)
+        if self._desde is not None:
+            # Sin nada indexado (catálogo vacío en la última carga) todo es nuevo
+            filas = filas.filter(updated_at__gte=self._desde - MARGEN_CAMBIOS)
+        for fila in filas:
+            if self._vistos.get(fila['id']) != fila['updated_at']:
+                self._indexar(fila, self._por_codigo, self._codigos)
+        self._podar()
+
+    def _podar(self):
+        """Olvida los vistos que ya quedaron antes del margen"""
+        if self._desde is not None:
+            limite = self._desde - MARGEN_CAMBIOS
+            self._vistos = {pk: updated_at for pk, updated_at in self._vistos.items() if updated_at >= limite}
+
+    def _indexar(self, fila, por_codigo, codigos):
+        datos = {
+            'id': fila['id'],
+            'sku': fila['sku'],
+            'ean_upc': fila['ean_upc'],
+            'nombre': fila['nombre'],
+            'precio_venta': fila['precio_venta'],
+            'impuesto_iva': fila['impuesto_iva'],
+            'unidad': fila['uom_venta__codigo'],
+            'estado': fila['estado'],
+        }
+        nuevos = tuple(c for c in (fila['sku'], fila['ean_upc']) if c)
+        for codigo in nuevos:
+            por_codigo[codigo] = datos
+        for codigo in set(codigos.get(fila['id'], ())) - set(nuevos):
+            # Si el código ya pasó a otro producto, se deja el del otro
+            if por_codigo.get(codigo, {}).get('id') == fila['id']:
+                del por_codigo[codigo]
+        codigos[fila['id']] = nuevos
+
+        self._vistos[fila['id']] = fila['updated_at']
+        if self._desde is None or fila['updated_at'] > self._desde:
+            self._desde = fila['updated_at']
+
+
+# Un índice por proceso
+indice_productos = IndiceProductos()
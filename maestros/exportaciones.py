@@ -0,0 +1,73 @@
+"""
+Listados de maestros exportables a Excel (ver LiliProject.exportacion)
+"""
+from LiliProject.exportacion import Hoja
+from .busqueda import buscar_proveedores
+from .models import Proveedor
+
+
+def proveedores(parametros):
+    """Proveedores con los mismos filtros y orden que el listado"""
+    queryset = Proveedor.objects.all()
+
+    search = parametros.get('search', '').strip()
+    if search:
+        queryset = buscar_proveedores(queryset, search)
+
+    if parametros.get('estado'):
+        queryset = queryset.filter(estado=parametros['estado'])
+
+    if parametros.get('condicion_pago'):
+        queryset = queryset.filter(condiciones_pago=parametros['condicion_pago'])
+
+    sort_fields = {
+        'rut_nif': 'rut_nif',
+        'razon_social': 'razon_social',
+        'email': 'email',
+        'telefono': 'telefono',
+        'ciudad': 'ciudad',
+        'condiciones_pago': 'condiciones_pago',
+        'estado': 'estado',
+        'created_at': 'created_at',
+    }
+    if search:
+        sort_fields['relevancia'] = 'relevancia'
+    sort_by = parametros.get('sort', 'relevancia' if search else 'created_at')
+    if sort_by in sort_fields:
+        order_field = sort_fields[sort_by]
+        if parametros.get('order', 'desc') == 'desc':
+            order_field = f'-{order_field}'
+        queryset = queryset.order_by(order_field)
+
+    condiciones = dict(Proveedor.CONDICIONES_PAGO_CHOICES)
+
+    def fila(tupla):
+        (rut_nif, razon_social, nombre_fantasia, email, telefono, ciudad, pais,
+         condiciones_pago, moneda, estado, created_at) = tupla
+        return [
+            rut_nif,
+            razon_social,
+            nombre_fantasia or '-',
+            email or '-',
+            telefono or '-',
+            ciudad or '-',
+            pais,
+            condiciones.get(condiciones_pago, condiciones_pago),
+            moneda,
+            'Activo' if estado == 'ACTIVO' else 'Bloqueado',
+            created_at.strftime('%d/%m/%Y %H:%M') if created_at else '-',
+        ]
+
+    return Hoja(
+        titulo='Proveedores',
+        columnas=[
+            ('RUT/NIF', 15), ('Razón Social', 35), ('Nombre Fantasía', 30), ('Email', 30),
+            ('Teléfono', 15), ('Ciudad', 20), ('País', 15), ('Condiciones Pago', 18),
+            ('Moneda', 10), ('Estado', 12), ('Fecha Creación', 20),
+        ],
+        queryset=queryset.values_list(
+            'rut_nif', 'razon_social', 'nombre_fantasia', 'email', 'telefono', 'ciudad', 'pais',
+            'condiciones_pago', 'moneda', 'estado', 'created_at',
+        ),
+        fila=fila,
+    )
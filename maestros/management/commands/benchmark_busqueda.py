@@ -0,0 +1,96 @@
+"""
+Compara la búsqueda indexada de proveedores con la búsqueda LIKE anterior
+
+Inserta proveedores sintéticos dentro de una transacción que se revierte al
+final, así que no deja datos en la base.
+
+Uso:
+    python manage.py benchmark_busqueda
+    python manage.py benchmark_busqueda --filas 500000 --repeticiones 5
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from maestros.busqueda import buscar_proveedores, indice_disponible, texto_busqueda
+from maestros.models import Proveedor
+
+
+NOMBRES = ['Nestlé', 'Dulces', 'Confitería', 'Chocolates', 'Golosinas', 'Caramelos', 'Alimentos',
+           'Distribuidora', 'Comercial', 'Importadora', 'Azúcar', 'Cacao', 'Maní', 'Almendras']
+CIUDADES = ['Santiago', 'Valparaíso', 'Concepción', 'Antofagasta', 'Arica', 'Temuco', 'Punta Arenas']
+TERMINOS = ['nestle', 'confiteria arica', 'valparaiso', 'cacao mani', 'prov123']
+
+
+def _like(queryset, search):
+    """Búsqueda anterior: icontains sobre seis columnas"""
+    return queryset.filter(
+        Q(rut_nif__icontains=search) |
+        Q(razon_social__icontains=search) |
+        Q(nombre_fantasia__icontains=search) |
+        Q(email__icontains=search) |
+        Q(telefono__icontains=search) |
+        Q(ciudad__icontains=search)
+    ).order_by('-created_at')
+
+
+def _indexada(queryset, search):
+    return buscar_proveedores(queryset, search).order_by('-relevancia')
+
+
+class Command(BaseCommand):
+    help = 'Mide la búsqueda de proveedores (LIKE vs índice de texto completo) sobre datos sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=500000,
+                            help='Proveedores sintéticos a insertar (default: 500000)')
+        parser.add_argument('--repeticiones', type=int, default=5,
+                            help='Ejecuciones por término (default: 5)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Motor: {connection.vendor} | índice disponible: {indice_disponible()}')
+
+        with transaction.atomic():
+            self._poblar(options['filas'])
+
+            for termino in TERMINOS:
+                for nombre, buscar in (('LIKE', _like), ('índice', _indexada)):
+                    tiempos = []
+                    for _ in range(options['repeticiones']):
+                        inicio = time.perf_counter()
+                        queryset = buscar(Proveedor.objects.all(), termino)
+                        total = queryset.count()
+                        list(queryset[:10])
+                        tiempos.append((time.perf_counter() - inicio) * 1000)
+                    self.stdout.write(
+                        f'{termino!r:22} {nombre:7} {total:>8} resultados  '
+                        f'mediana {statistics.median(tiempos):8.1f} ms'
+                    )
+
+            transaction.set_rollback(True)
+
+    def _poblar(self, filas):
+        inicio = time.perf_counter()
+        lote = []
+        for i in range(filas):
+            razon_social = f'{random.choice(NOMBRES)} {random.choice(NOMBRES)} Ltda'
+            proveedor = Proveedor(
+                rut_nif=f'BENCH-{i}',
+                razon_social=razon_social,
+                nombre_fantasia=f'Prov{i}',
+                email=f'contacto{i}@proveedor.cl',
+                telefono=f'+56 9 {random.randint(10000000, 99999999)}',
+                ciudad=random.choice(CIUDADES),
+                condiciones_pago='30_DIAS',
+            )
+            proveedor.texto_busqueda = texto_busqueda(proveedor)
+            lote.append(proveedor)
+            if len(lote) == 5000:
+                Proveedor.objects.bulk_create(lote)
+                lote = []
+        Proveedor.objects.bulk_create(lote)
+        self.stdout.write(f'{filas} proveedores insertados en {time.perf_counter() - inicio:.1f}s')
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+def poblar_texto_busqueda(apps, schema_editor):
+    """Calcula `texto_busqueda` de los proveedores existentes y crea el índice"""
+    from maestros.busqueda import CAMPOS_BUSCABLES, crear_indice, texto_busqueda
+
+    Proveedor = apps.get_model('maestros', 'Proveedor')
+    proveedores = list(Proveedor.objects.only('pk', *CAMPOS_BUSCABLES))
+    for proveedor in proveedores:
+        proveedor.texto_busqueda = texto_busqueda(proveedor)
+    Proveedor.objects.bulk_update(proveedores, ['texto_busqueda'], batch_size=1000)
+
+    crear_indice(schema_editor.connection)
+
+
+def eliminar_indice(apps, schema_editor):
+    from maestros.busqueda import eliminar_indice
+
+    eliminar_indice(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maestros', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proveedor',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Campos buscables normalizados (ver maestros.busqueda)'),
+        ),
+        migrations.RunPython(poblar_texto_busqueda, eliminar_indice),
+    ]
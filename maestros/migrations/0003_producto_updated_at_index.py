@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maestros', '0002_proveedor_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['updated_at'], name='productos_updated_238212_idx'),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.utils import timezone
 from decimal import Decimal
 
+from .busqueda import texto_busqueda
+
 
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
@@ -100,6 +102,8 @@ class Proveedor(models.Model):
     observaciones = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    texto_busqueda = models.TextField(blank=True, default='', editable=False,
+                                      help_text='Campos buscables normalizados (ver maestros.busqueda)')
 
     class Meta:
         db_table = 'proveedores'
@@ -113,6 +117,14 @@ class Proveedor(models.Model):
     def __str__(self):
         return f"{self.razon_social} ({self.rut_nif})"
 
+    def save(self, *args, **kwargs):
+        """Mantiene `texto_busqueda` (y con él el índice de búsqueda) al día"""
+        self.texto_busqueda = texto_busqueda(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'texto_busqueda'}
+        super().save(*args, **kwargs)
+
 
 class Producto(models.Model):
     ESTADO_CHOICES = [
@@ -166,6 +178,7 @@ class Producto(models.Model):
             models.Index(fields=['sku']),
             models.Index(fields=['categoria']),
             models.Index(fields=['estado']),
+            models.Index(fields=['updated_at']),
         ]
 
     def __str__(self):
@@ -1,3 +1,377 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from io import BytesIO
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from LiliProject.exportacion import escribir_xlsx, obtener_hoja
+from LiliProject.paginacion import PaginadorCursor, total_listado
+from autenticacion.actividad import registro_actividad
+from autenticacion.contadores import clave, leer_contadores
+from autenticacion.models import Rol, Usuario
+from inventario.models import Bodega, StockActual
+from .busqueda import buscar_proveedores, indice_disponible, normalizar
+from .escaner import IndiceNoDisponible, IndiceProductos
+from .models import Categoria, Producto, Proveedor, UnidadMedida
+
+
+def crear_producto(sku, ean=None, **campos):
+    unidad, _ = UnidadMedida.objects.get_or_create(codigo='UND', defaults={'nombre': 'Unidad'})
+    categoria, _ = Categoria.objects.get_or_create(nombre='Chocolates')
+    return Producto.objects.create(
+        sku=sku, ean_upc=ean, nombre=f'Producto {sku}', categoria=categoria,
+        uom_compra=unidad, uom_venta=unidad, uom_stock=unidad, **campos,
+    )
+
+
+def crear_proveedor(rut, razon_social=None, **campos):
+    campos.setdefault('condiciones_pago', 'CONTADO')
+    return Proveedor.objects.create(rut_nif=rut, razon_social=razon_social or f'Proveedor {rut}',
+                                    email='contacto@lilis.cl', **campos)
+
+
+def iniciar_sesion(test, permisos=None):
+    """Usuario con rol que puede ver proveedores; el middleware escribe su actividad en la prueba"""
+    rol = Rol.objects.create(nombre='COMPRAS', permisos=permisos or {'proveedores': {'ver': True}})
+    user = User.objects.create_user('compras')
+    Usuario.objects.create(user=user, rol=rol)
+    test.client.force_login(user)
+    test.addCleanup(registro_actividad.flush)
+
+
+class TotalListadoTests(TestCase):
+    """El total del listado sale de los contadores o de un COUNT cacheado"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for i in range(3):
+            crear_proveedor(f'{i}-K', estado='BLOQUEADO' if i == 0 else 'ACTIVO',
+                            condiciones_pago='30_DIAS' if i < 2 else 'CONTADO')
+        self.claves = [clave('proveedores'), clave('proveedores', 'estado', 'ACTIVO'),
+                       clave('proveedores', 'condiciones_pago', '30_DIAS')]
+
+    def _total(self, filtros, **otros):
+        queryset = Proveedor.objects.filter(**{campo: valor for campo, valor in filtros.items() if valor})
+        if otros.get('search'):
+            queryset = queryset.filter(razon_social__icontains=otros['search'])
+        return total_listado(queryset, 'proveedores', leer_contadores(self.claves), filtros, **otros)
+
+    def test_sin_filtros_o_uno_con_contador_no_cuenta(self):
+        contadores = leer_contadores(self.claves)
+        with self.assertNumQueries(0):
+            self.assertEqual(total_listado(Proveedor.objects.all(), 'proveedores', contadores,
+                                           {'estado': '', 'condiciones_pago': None}, search=''), 3)
+            self.assertEqual(total_listado(Proveedor.objects.filter(estado='ACTIVO'), 'proveedores', contadores,
+                                           {'estado': 'ACTIVO', 'condiciones_pago': None}, search=''), 2)
+
+    def test_count_cacheado_hasta_que_cambian_los_contadores(self):
+        filtros = {'estado': 'ACTIVO', 'condiciones_pago': '30_DIAS'}
+        with self.assertNumQueries(2):   # contadores + COUNT
+            self.assertEqual(self._total(filtros, search=''), 1)
+        with self.assertNumQueries(1):   # solo contadores
+            self.assertEqual(self._total(filtros, search=''), 1)
+        with self.assertNumQueries(2):   # otra búsqueda, otra entrada
+            self.assertEqual(self._total({}, search='Proveedor 2'), 1)
+
+        crear_proveedor('9-K', condiciones_pago='30_DIAS')
+        self.assertEqual(self._total(filtros, search=''), 2)
+
+    def test_estadisticas_del_listado(self):
+        iniciar_sesion(self)
+        respuesta = self.client.get('/proveedores/', {'estado': 'ACTIVO'})
+        self.assertEqual(respuesta.status_code, 200)
+        contexto = respuesta.context
+        self.assertEqual((contexto['total_proveedores'], contexto['proveedores_activos'],
+                          contexto['proveedores_bloqueados'], contexto['proveedores_30_dias']), (3, 2, 1, 2))
+        self.assertEqual(contexto['page_obj'].total, 2)
+
+
+class PaginadorCursorTests(TestCase):
+    """Las páginas por cursor recorren todo el listado, en ambos sentidos, sin repetir filas"""
+
+    def setUp(self):
+        ciudades = ['Talca', None, 'Arica', 'Talca', None, 'Osorno', 'Talca']
+        self.proveedores = [crear_proveedor(f'{i}-K', ciudad=ciudad) for i, ciudad in enumerate(ciudades)]
+
+    def _recorrer(self, paginador):
+        pagina = paginador.page()
+        paginas = [[p.pk for p in pagina]]
+        while pagina.has_next:
+            pagina = paginador.page(pagina.cursor_siguiente)
+            paginas.append([p.pk for p in pagina])
+        atras = [[p.pk for p in pagina]]
+        while pagina.has_previous:
+            pagina = paginador.page(pagina.cursor_anterior)
+            atras.insert(0, [p.pk for p in pagina])
+        return paginas, atras
+
+    def test_orden_con_empates_y_nulos(self):
+        esperado = [p.pk for p in sorted(self.proveedores, key=lambda p: (p.ciudad or '', p.pk))]
+        paginas, atras = self._recorrer(PaginadorCursor(Proveedor.objects.all(), 'ciudad', 3))
+        self.assertEqual(paginas, [esperado[:3], esperado[3:6], esperado[6:]])
+        self.assertEqual(atras, paginas)
+
+        # Descendente por una fecha con empates: desempata por id descendente
+        Proveedor.objects.update(created_at=timezone.now())
+        paginas, atras = self._recorrer(PaginadorCursor(Proveedor.objects.all(), '-created_at', 4))
+        self.assertEqual(paginas, [[p.pk for p in self.proveedores[::-1][:4]], [p.pk for p in self.proveedores[2::-1]]])
+        self.assertEqual(atras, paginas)
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        paginador = PaginadorCursor(Proveedor.objects.all(), 'razon_social', 3)
+        primera = paginador.page()
+        cursor = primera.cursor_siguiente
+        self.assertFalse(primera.has_previous)
+
+        for invalido in ('basura', cursor[:-2] + 'xx'):
+            self.assertEqual([p.pk for p in paginador.page(invalido)], [p.pk for p in primera])
+        # Un cursor de otro orden no se aplica
+        otro = PaginadorCursor(Proveedor.objects.all(), '-razon_social', 3)
+        self.assertEqual([p.pk for p in otro.page(cursor)], [p.pk for p in otro.page()])
+
+    def test_listado_acota_per_page_y_sigue_el_cursor(self):
+        iniciar_sesion(self)
+        for i in range(7, 12):
+            crear_proveedor(f'{i}-K')
+        respuesta = self.client.get('/proveedores/', {'per_page': '1000'})
+        self.assertEqual(respuesta.context['per_page'], 10)
+        primera = respuesta.context['page_obj']
+        self.assertEqual((len(primera), primera.total), (10, 12))
+
+        segunda = self.client.get('/proveedores/', {'cursor': primera.cursor_siguiente}).context['page_obj']
+        self.assertEqual(len(segunda), 2)
+        self.assertFalse(set(p.pk for p in segunda) & set(p.pk for p in primera))
+
+        manipulado = self.client.get('/proveedores/', {'cursor': primera.cursor_siguiente + 'x', 'per_page': 'x'})
+        self.assertEqual(manipulado.status_code, 200)
+        self.assertEqual([p.pk for p in manipulado.context['page_obj']], [p.pk for p in primera])
+
+
+class BusquedaProveedoresTests(TestCase):
+    """La búsqueda ignora tildes y mayúsculas, usa el índice y ordena por relevancia"""
+
+    def setUp(self):
+        self.nestle = crear_proveedor('76.123.456-7', 'Nestlé Chile S.A.', ciudad='Santiago')
+        self.dulces = crear_proveedor('77.000.111-2', 'Dulces del Sur', ciudad='Concepción')
+        self.sur = crear_proveedor('78.222.333-4', 'Importadora Sur', ciudad='Ñuñoa')
+
+    def _buscar(self, termino):
+        return list(buscar_proveedores(Proveedor.objects.all(), termino)
+                    .order_by('-relevancia', 'pk').values_list('pk', flat=True))
+
+    def test_normaliza_el_texto(self):
+        self.assertEqual(normalizar('  Nestlé   CHILE\tÑuñoa '), 'nestle chile nunoa')
+        self.assertEqual(self.nestle.texto_busqueda, '76.123.456-7 nestle chile s.a. contacto@lilis.cl santiago')
+
+    def test_sin_tildes_con_el_indice(self):
+        if connection.vendor == 'sqlite':
+            self.assertTrue(indice_disponible(), 'SQLite sin FTS5 trigram')
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self._buscar('NESTLE'), [self.nestle.pk])
+        self.assertIn('MATCH', consultas.captured_queries[0]['sql'])
+
+        self.assertEqual(self._buscar('concepción dulces'), [self.dulces.pk])   # todas las palabras
+        self.assertEqual(self._buscar('nunoa'), [self.sur.pk])
+        self.assertEqual(self._buscar('sur'), [self.dulces.pk, self.sur.pk])    # relevancia por posición
+        self.assertEqual(self._buscar('chocolate'), [])
+
+    def test_terminos_cortos_sin_indice(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self._buscar('sa nestlé'), [self.nestle.pk])
+        self.assertNotIn('MATCH', consultas.captured_queries[0]['sql'])
+        self.assertEqual(len(self._buscar('  ')), 3)
+
+    def test_cambios_llegan_al_indice(self):
+        self.nestle.razon_social = 'Nestlé Perú'
+        self.nestle.save(update_fields=['razon_social'])
+        self.assertEqual(self._buscar('peru'), [self.nestle.pk])
+        self.assertEqual(self._buscar('chile'), [])
+        self.dulces.delete()
+        self.assertEqual(self._buscar('dulces'), [])
+
+
+class ExportacionProveedoresTests(TestCase):
+    """El Excel de proveedores se escribe fila a fila con los filtros y el orden del listado"""
+
+    def setUp(self):
+        crear_proveedor('1-9', 'Arcor', ciudad='Santiago', condiciones_pago='30_DIAS')
+        crear_proveedor('2-7', 'Nestlé Chile', estado='BLOQUEADO')
+        crear_proveedor('3-5', 'Dulces del Sur')
+
+    def test_escribe_la_hoja_filtrada_y_ordenada(self):
+        hoja = obtener_hoja('proveedores', {'estado': 'ACTIVO', 'sort': 'razon_social', 'order': 'asc'})
+        archivo, avances = BytesIO(), []
+        self.assertEqual(escribir_xlsx(archivo, hoja, progreso=avances.append, cada=1), 2)
+        self.assertEqual(avances, [1, 2])
+
+        archivo.seek(0)
+        ws = load_workbook(archivo)['Proveedores']
+        filas = list(ws.iter_rows(values_only=True))
+        self.assertEqual(filas[0][:3], ('RUT/NIF', 'Razón Social', 'Nombre Fantasía'))
+        self.assertEqual([(fila[0], fila[1], fila[5], fila[7], fila[9]) for fila in filas[1:]], [
+            ('1-9', 'Arcor', 'Santiago', '30 días', 'Activo'),
+            ('3-5', 'Dulces del Sur', '-', 'Contado', 'Activo'),
+        ])
+        self.assertEqual((ws['A1'].style, ws['A1'].font.b, ws['A2'].style), ('encabezado', True, 'celda'))
+        self.assertEqual(ws.column_dimensions['B'].width, 35)
+
+    def test_busqueda_ordena_por_relevancia(self):
+        archivo = BytesIO()
+        escribir_xlsx(archivo, obtener_hoja('proveedores', {'search': 'sur'}))
+        archivo.seek(0)
+        ws = load_workbook(archivo).active
+        self.assertEqual([fila[1] for fila in ws.iter_rows(min_row=2, values_only=True)], ['Dulces del Sur'])
+
+
+class IndiceProductosTests(TestCase):
+    """El índice del escáner resuelve EAN y SKU en memoria y sigue los cambios"""
+
+    def setUp(self):
+        self.producto = crear_producto('CHO-001', '7800000000011', precio_venta=Decimal('990'))
+        self.indice = IndiceProductos()
+        self.indice.refrescar()
+
+    def test_busca_por_sku_y_ean_sin_consultas(self):
+        with self.assertNumQueries(0):
+            por_ean = self.indice.buscar(' 7800000000011 ')
+            por_sku = self.indice.buscar('CHO-001')
+            self.assertIsNone(self.indice.buscar('NO-EXISTE'))
+        self.assertEqual(por_ean, por_sku)
+        self.assertEqual((por_ean['id'], por_ean['unidad'], por_ean['precio_venta']),
+                         (self.producto.pk, 'UND', Decimal('990')))
+        self.assertIsNone(self.indice._hilo)   # cargado a mano: no arranca el hilo
+
+    def test_refresco_incremental(self):
+        self.producto.ean_upc = '7800000000028'
+        self.producto.nombre = 'Chocolate amargo'
+        self.producto.save()
+        nuevo = crear_producto('CHO-002')
+
+        self.indice.refrescar()
+        self.assertIsNone(self.indice.buscar('7800000000011'))
+        self.assertEqual(self.indice.buscar('7800000000028')['nombre'], 'Chocolate amargo')
+        self.assertEqual(self.indice.buscar('CHO-002')['id'], nuevo.pk)
+
+        # Sin cambios no se vuelve a indexar nada
+        with mock.patch.object(self.indice, '_indexar') as indexar:
+            self.indice.refrescar()
+        indexar.assert_not_called()
+
+    def test_guardado_confirmado_tarde(self):
+        # Un producto confirmado después del refresco pero con hora anterior a lo ya visto
+        otro = crear_producto('CHO-002')
+        self.indice.refrescar()
+        tardio = crear_producto('CHO-003')
+        Producto.objects.filter(pk=tardio.pk).update(updated_at=otro.updated_at - timedelta(seconds=30))
+
+        self.indice.refrescar()
+        self.assertEqual(self.indice.buscar('CHO-003')['id'], tardio.pk)
+        with mock.patch.object(self.indice, '_indexar') as indexar:
+            self.indice.refrescar()   # lo releído dentro del margen no se vuelve a indexar
+        indexar.assert_not_called()
+
+    def test_catalogo_vacio_en_la_carga_completa(self):
+        Producto.objects.all().delete()
+        indice = IndiceProductos()
+        indice.refrescar()
+        self.assertIsNone(indice.buscar('CHO-001'))
+
+        nuevo = crear_producto('CHO-002', '7800000000028')
+        indice.refrescar()   # incremental sin marca previa
+        self.assertEqual(indice.buscar('7800000000028')['id'], nuevo.pk)
+
+    def test_codigo_que_pasa_a_otro_producto(self):
+        self.producto.ean_upc = None
+        self.producto.save()
+        otro = crear_producto('CHO-002', '7800000000011')
+        self.indice.refrescar()
+        self.assertEqual(self.indice.buscar('7800000000011')['id'], otro.pk)
+
+    def test_recarga_completa_descarta_eliminados(self):
+        self.producto.delete()
+        self.indice.refrescar()
+        self.assertIsNotNone(self.indice.buscar('CHO-001'))   # el incremental no ve borrados
+
+        with override_settings(ESCANER_RECARGA_COMPLETA=0):
+            self.indice.refrescar()
+        self.assertIsNone(self.indice.buscar('CHO-001'))
+
+
+class IndiceProductosHiloTests(TransactionTestCase):
+    """El hilo de fondo carga el índice en la primera búsqueda y lo mantiene al día"""
+
+    def test_hilo_carga_y_refresca(self):
+        crear_producto('CHO-001')
+        indice = IndiceProductos()
+        try:
+            with override_settings(ESCANER_REFRESCO=0.05):
+                self.assertEqual(indice.buscar('CHO-001')['sku'], 'CHO-001')
+                crear_producto('CHO-002')
+                limite = time.monotonic() + 5
+                while indice.buscar('CHO-002') is None and time.monotonic() < limite:
+                    time.sleep(0.05)
+            self.assertIsNotNone(indice.buscar('CHO-002'))
+        finally:
+            indice.detener()
+
+    def test_falla_de_la_carga_inicial(self):
+        indice = IndiceProductos()
+        try:
+            with mock.patch.object(indice, '_cargar_todo', side_effect=RuntimeError('sin base de datos')), \
+                    self.assertLogs('maestros.escaner', 'ERROR'):
+                with self.assertRaises(IndiceNoDisponible):
+                    indice.buscar('CHO-001')
+        finally:
+            indice.detener()
+
+
+class EscanearProductoViewTests(TestCase):
+    """GET /productos/escanear/<codigo>/ responde producto y stock"""
+
+    def setUp(self):
+        self.producto = crear_producto('CHO-001', '7800000000011')
+        self.bodega = Bodega.objects.create(codigo='CEN', nombre='Central')
+        otra = Bodega.objects.create(codigo='SAL', nombre='Sala')
+        StockActual.objects.create(producto=self.producto, bodega=self.bodega, cantidad_disponible=Decimal('7'))
+        StockActual.objects.create(producto=self.producto, bodega=otra, cantidad_disponible=Decimal('3'))
+        rol = Rol.objects.create(nombre='BODEGUERO', permisos={'productos': {'ver': True}})
+        user = User.objects.create_user('bodega')
+        Usuario.objects.create(user=user, rol=rol)
+        self.client.force_login(user)
+        # Lo que anota el middleware se escribe dentro de la prueba y no al salir del proceso
+        self.addCleanup(registro_actividad.flush)
+
+        self.indice = IndiceProductos()
+        self.indice.refrescar()
+        parche = mock.patch('maestros.views.indice_productos', self.indice)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_producto_y_stock_de_la_bodega(self):
+        respuesta = self.client.get(f'/productos/escanear/7800000000011/?bodega={self.bodega.pk}')
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos['producto']['sku'], 'CHO-001')
+        self.assertEqual([(fila['bodega__codigo'], fila['cantidad_disponible']) for fila in datos['stock']],
+                         [('CEN', '7.000000')])
+
+    def test_errores(self):
+        self.assertEqual(self.client.get('/productos/escanear/NO-EXISTE/').status_code, 404)
+        self.assertEqual(self.client.get('/productos/escanear/CHO-001/?bodega=x').status_code, 400)
+        with mock.patch.object(self.indice, 'buscar', side_effect=IndiceNoDisponible('aún no')):
+            self.assertEqual(self.client.get('/productos/escanear/CHO-001/').status_code, 503)
+
+    def test_sin_permiso(self):
+        rol = Rol.objects.get(nombre='BODEGUERO')
+        rol.permisos = {'productos': {'ver': False}}
+        rol.save()
+        self.assertEqual(self.client.get('/productos/escanear/CHO-001/').status_code, 403)
@@ -1,12 +1,15 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
+from LiliProject.exportacion import parametros_de
+from LiliProject.paginacion import PaginadorCursor, tamano_pagina, total_listado
+from autenticacion.contadores import leer_contadores, clave
+from autenticacion.permisos import obtener_permisos
+from autenticacion.trabajos import ExportacionOcupada, encolar_exportacion, estado_trabajo
+from inventario.models import StockActual
+from .busqueda import buscar_proveedores
+from .escaner import IndiceNoDisponible, indice_productos
 from .models import Proveedor
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from datetime import datetime
 
 
 @login_required(login_url='login')
@@ -16,23 +19,10 @@ def proveedores_list(request):
     # Obtener proveedores
     proveedores = Proveedor.objects.all()
     
-    # Estadísticas generales (sin filtros)
-    total_proveedores = Proveedor.objects.count()
-    proveedores_activos = Proveedor.objects.filter(estado='ACTIVO').count()
-    proveedores_bloqueados = Proveedor.objects.filter(estado='BLOQUEADO').count()
-    proveedores_30_dias = Proveedor.objects.filter(condiciones_pago='30_DIAS').count()
-    
     # Búsqueda
     search = request.GET.get('search', '').strip()
     if search:
-        proveedores = proveedores.filter(
-            Q(rut_nif__icontains=search) |
-            Q(razon_social__icontains=search) |
-            Q(nombre_fantasia__icontains=search) |
-            Q(email__icontains=search) |
-            Q(telefono__icontains=search) |
-            Q(ciudad__icontains=search)
-        )
+        proveedores = buscar_proveedores(proveedores, search)
     
     # Filtros
     estado_filter = request.GET.get('estado')
@@ -43,8 +33,26 @@ def proveedores_list(request):
     if condicion_pago_filter:
         proveedores = proveedores.filter(condiciones_pago=condicion_pago_filter)
     
-    # Ordenamiento
-    sort_by = request.GET.get('sort', 'created_at')
+    # Estadísticas generales y contadores de los filtros activos (una sola
+    # consulta a la tabla de contadores, compartida con el paginador)
+    claves_stats = [
+        clave('proveedores'),
+        clave('proveedores', 'estado', 'ACTIVO'),
+        clave('proveedores', 'estado', 'BLOQUEADO'),
+        clave('proveedores', 'condiciones_pago', '30_DIAS'),
+    ]
+    if estado_filter:
+        claves_stats.append(clave('proveedores', 'estado', estado_filter))
+    if condicion_pago_filter:
+        claves_stats.append(clave('proveedores', 'condiciones_pago', condicion_pago_filter))
+    stats = leer_contadores(claves_stats)
+    total_proveedores = stats[clave('proveedores')]
+    proveedores_activos = stats[clave('proveedores', 'estado', 'ACTIVO')]
+    proveedores_bloqueados = stats[clave('proveedores', 'estado', 'BLOQUEADO')]
+    proveedores_30_dias = stats[clave('proveedores', 'condiciones_pago', '30_DIAS')]
+    
+    # Ordenamiento (al buscar, por defecto por relevancia)
+    sort_by = request.GET.get('sort', 'relevancia' if search else 'created_at')
     sort_order = request.GET.get('order', 'desc')
     
     sort_fields = {
@@ -57,39 +65,27 @@ def proveedores_list(request):
         'estado': 'estado',
         'created_at': 'created_at',
     }
-    
-    if sort_by in sort_fields:
-        order_field = sort_fields[sort_by]
-        if sort_order == 'desc':
-            order_field = f'-{order_field}'
-        proveedores = proveedores.order_by(order_field)
-    
-    # Paginación
-    per_page = request.GET.get('per_page', 10)
-    try:
-        per_page = int(per_page)
-    except:
-        per_page = 10
-    
-    paginator = Paginator(proveedores, per_page)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    if search:
+        sort_fields['relevancia'] = 'relevancia'
+    
+    if sort_by not in sort_fields:
+        sort_by, sort_order = 'created_at', 'desc'
+    order_field = sort_fields[sort_by]
+    if sort_order == 'desc':
+        order_field = f'-{order_field}'
+    
+    # Paginación por cursor (total aproximado desde los contadores)
+    per_page = tamano_pagina(request.GET.get('per_page'))
+    total = total_listado(
+        proveedores, 'proveedores', stats,
+        {'estado': estado_filter, 'condiciones_pago': condicion_pago_filter},
+        search=search,
+    )
+    paginator = PaginadorCursor(proveedores, order_field, per_page, total=total)
+    page_obj = paginator.page(request.GET.get('cursor'))
     
     # Obtener permisos del usuario actual
-    permisos = {
-        'ver': True,
-        'crear': True,
-        'editar': True,
-        'eliminar': True,
-        'exportar': True
-    }
-    
-    if hasattr(request.user, 'usuario_profile'):
-        usuario = request.user.usuario_profile
-        if usuario.rol and usuario.rol.permisos and isinstance(usuario.rol.permisos, dict):
-            rol_permisos = usuario.rol.permisos.get('proveedores', {})
-            if rol_permisos:
-                permisos = rol_permisos
+    permisos = obtener_permisos(request.user).de_modulo('proveedores')
     
     context = {
         'active_menu': 'proveedores',
@@ -120,15 +116,11 @@ def proveedor_create(request):
     """Crear nuevo proveedor"""
     
     # Verificar permisos
-    if hasattr(request.user, 'usuario_profile'):
-        usuario = request.user.usuario_profile
-        if usuario.rol and usuario.rol.permisos and isinstance(usuario.rol.permisos, dict):
-            permisos = usuario.rol.permisos.get('proveedores', {})
-            if not permisos.get('crear', True):
-                return JsonResponse({
-                    'success': False,
-                    'message': 'No tienes permisos para crear proveedores'
-                }, status=403)
+    if not obtener_permisos(request.user).puede('proveedores', 'crear'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para crear proveedores'
+        }, status=403)
     
     if request.method == 'POST':
         try:
@@ -183,15 +175,11 @@ def proveedor_edit(request, proveedor_id):
     
     # Verificar permisos para edición
     if request.method == 'POST':
-        if hasattr(request.user, 'usuario_profile'):
-            usuario = request.user.usuario_profile
-            if usuario.rol and usuario.rol.permisos and isinstance(usuario.rol.permisos, dict):
-                permisos = usuario.rol.permisos.get('proveedores', {})
-                if not permisos.get('editar', True):
-                    return JsonResponse({
-                        'success': False,
-                        'message': 'No tienes permisos para editar proveedores'
-                    }, status=403)
+        if not obtener_permisos(request.user).puede('proveedores', 'editar'):
+            return JsonResponse({
+                'success': False,
+                'message': 'No tienes permisos para editar proveedores'
+            }, status=403)
     
     if request.method == 'GET':
         # Retornar datos del proveedor
@@ -265,15 +253,11 @@ def proveedor_delete(request, proveedor_id):
     """Bloquear proveedor"""
     
     # Verificar permisos
-    if hasattr(request.user, 'usuario_profile'):
-        usuario = request.user.usuario_profile
-        if usuario.rol and usuario.rol.permisos and isinstance(usuario.rol.permisos, dict):
-            permisos = usuario.rol.permisos.get('proveedores', {})
-            if not permisos.get('eliminar', True):
-                return JsonResponse({
-                    'success': False,
-                    'message': 'No tienes permisos para bloquear proveedores'
-                }, status=403)
+    if not obtener_permisos(request.user).puede('proveedores', 'eliminar'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para bloquear proveedores'
+        }, status=403)
     
     if request.method == 'POST':
         try:
@@ -296,119 +280,57 @@ def proveedor_delete(request, proveedor_id):
 
 
 @login_required(login_url='login')
-def exportar_proveedores_excel(request):
-    """Exportar listado de proveedores a Excel"""
-    
-    # Obtener proveedores con los mismos filtros
-    proveedores = Proveedor.objects.all()
-    
-    # Aplicar filtros
-    search = request.GET.get('search', '').strip()
-    if search:
-        proveedores = proveedores.filter(
-            Q(rut_nif__icontains=search) |
-            Q(razon_social__icontains=search) |
-            Q(nombre_fantasia__icontains=search) |
-            Q(email__icontains=search) |
-            Q(telefono__icontains=search) |
-            Q(ciudad__icontains=search)
-        )
-    
-    estado_filter = request.GET.get('estado')
-    if estado_filter:
-        proveedores = proveedores.filter(estado=estado_filter)
-    
-    condicion_pago_filter = request.GET.get('condicion_pago')
-    if condicion_pago_filter:
-        proveedores = proveedores.filter(condiciones_pago=condicion_pago_filter)
+def escanear_producto(request, codigo):
+    """Resuelve un código EAN o SKU escaneado: producto y stock (JSON)"""
     
-    # Aplicar ordenamiento
-    sort_by = request.GET.get('sort', 'created_at')
-    sort_order = request.GET.get('order', 'desc')
-    
-    sort_fields = {
-        'rut_nif': 'rut_nif',
-        'razon_social': 'razon_social',
-        'email': 'email',
-        'telefono': 'telefono',
-        'ciudad': 'ciudad',
-        'condiciones_pago': 'condiciones_pago',
-        'estado': 'estado',
-        'created_at': 'created_at',
-    }
-    
-    if sort_by in sort_fields:
-        order_field = sort_fields[sort_by]
-        if sort_order == 'desc':
-            order_field = f'-{order_field}'
-        proveedores = proveedores.order_by(order_field)
-    
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Proveedores"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Encabezados
-    headers = ['RUT/NIF', 'Razón Social', 'Nombre Fantasía', 'Email', 'Teléfono', 
-               'Ciudad', 'País', 'Condiciones Pago', 'Moneda', 'Estado', 'Fecha Creación']
-    ws.append(headers)
-    
-    # Aplicar estilos a encabezados
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
-    
-    # Ajustar ancho de columnas
-    column_widths = [15, 35, 30, 30, 15, 20, 15, 18, 10, 12, 20]
-    for i, width in enumerate(column_widths, 1):
-        ws.column_dimensions[ws.cell(1, i).column_letter].width = width
-    
-    # Agregar datos
-    for proveedor in proveedores:
-        # Traducir condiciones de pago
-        condiciones_dict = dict(Proveedor.CONDICIONES_PAGO_CHOICES)
-        condiciones_text = condiciones_dict.get(proveedor.condiciones_pago, proveedor.condiciones_pago)
-        
-        row = [
-            proveedor.rut_nif,
-            proveedor.razon_social,
-            proveedor.nombre_fantasia or '-',
-            proveedor.email or '-',
-            proveedor.telefono or '-',
-            proveedor.ciudad or '-',
-            proveedor.pais,
-            condiciones_text,
-            proveedor.moneda,
-            'Activo' if proveedor.estado == 'ACTIVO' else 'Bloqueado',
-            proveedor.created_at.strftime('%d/%m/%Y %H:%M') if proveedor.created_at else '-'
-        ]
-        ws.append(row)
-        
-        # Aplicar bordes y alineación
-        for cell in ws[ws.max_row]:
-            cell.border = border
-            cell.alignment = Alignment(vertical='center')
-    
-    # Configurar respuesta HTTP
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('productos', 'ver'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para consultar productos'
+        }, status=403)
     
-    filename = f'proveedores_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename={filename}'
+    try:
+        producto = indice_productos.buscar(codigo)
+    except IndiceNoDisponible as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=503)
+    if producto is None:
+        return JsonResponse({
+            'success': False,
+            'message': f'No existe un producto con código "{codigo}"'
+        }, status=404)
+    
+    # Stock de la bodega pedida (o de todas), en una sola consulta por índice
+    stock = StockActual.objects.filter(producto_id=producto['id'])
+    bodega_id = request.GET.get('bodega')
+    if bodega_id:
+        if not bodega_id.isdigit():
+            return JsonResponse({'success': False, 'message': 'Bodega inválida'}, status=400)
+        stock = stock.filter(bodega_id=bodega_id)
+    
+    return JsonResponse({
+        'success': True,
+        'producto': producto,
+        'stock': list(stock.values(
+            'bodega_id', 'bodega__codigo', 'cantidad_disponible',
+            'cantidad_reservada', 'cantidad_transito',
+        )),
+    })
+
+
+@login_required(login_url='login')
+def exportar_proveedores_excel(request):
+    """Encola la exportación del listado de proveedores a Excel (con los filtros actuales)"""
     
-    wb.save(response)
+    # Verificar permisos
+    if not obtener_permisos(request.user).puede('proveedores', 'exportar'):
+        return JsonResponse({
+            'success': False,
+            'message': 'No tienes permisos para exportar proveedores'
+        }, status=403)
     
-    return response
+    try:
+        trabajo = encolar_exportacion('proveedores', parametros_de('proveedores', request.GET), request.user)
+    except ExportacionOcupada as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=503)
+    return JsonResponse({'success': True, **estado_trabajo(trabajo)})
@@ -79,6 +79,58 @@ window.LiliUtils = {
             clearTimeout(timeout);
             timeout = setTimeout(later, wait);
         };
+    },
+    
+    /**
+     * Exportar a Excel en segundo plano: encola el trabajo, muestra el
+     * avance y descarga el archivo cuando está listo
+     */
+    exportarExcel: async function(url) {
+        Swal.fire({
+            title: 'Exportando...',
+            html: 'Preparando archivo Excel<br><span id="exportacion-progreso">En cola</span>',
+            icon: 'info',
+            allowOutsideClick: false,
+            allowEscapeKey: false,
+            didOpen: () => {
+                Swal.showLoading();
+            }
+        });
+        
+        try {
+            let trabajo = await this.request(url);
+            while (trabajo.success && (trabajo.estado === 'PENDIENTE' || trabajo.estado === 'PROCESANDO')) {
+                const progreso = document.getElementById('exportacion-progreso');
+                if (progreso && trabajo.estado === 'PROCESANDO') {
+                    progreso.textContent = trabajo.filas_totales
+                        ? `${trabajo.filas_procesadas} de ${trabajo.filas_totales} registros`
+                        : `${trabajo.filas_procesadas} registros`;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                trabajo = await this.request(trabajo.estado_url);
+            }
+            
+            if (!trabajo.success || trabajo.estado !== 'COMPLETADO') {
+                throw new Error(trabajo.message || trabajo.error || 'No se pudo generar el archivo');
+            }
+            
+            window.location.href = trabajo.descarga_url;
+            Swal.fire({
+                title: '¡Exportado!',
+                text: 'El archivo Excel se está descargando',
+                icon: 'success',
+                confirmButtonColor: '#198754',
+                timer: 2000,
+                timerProgressBar: true
+            });
+        } catch (error) {
+            Swal.fire({
+                title: 'Error',
+                text: error.message,
+                icon: 'error',
+                confirmButtonColor: '#dc3545'
+            });
+        }
     }
 };
 
@@ -410,7 +410,18 @@ function deleteProveedor(id, razon_social) {
 function changePerPage(value) {
     const url = new URL(window.location.href);
     url.searchParams.set('per_page', value);
-    url.searchParams.set('page', 1);
+    url.searchParams.delete('cursor');
+    window.location.href = url.toString();
+}
+
+// Navegar a otra página del listado (sin cursor: primera página)
+function irACursor(cursor) {
+    const url = new URL(window.location.href);
+    if (cursor) {
+        url.searchParams.set('cursor', cursor);
+    } else {
+        url.searchParams.delete('cursor');
+    }
     window.location.href = url.toString();
 }
 
@@ -430,30 +441,8 @@ function exportarExcel() {
     const url = new URL(window.location.href);
     const params = url.searchParams.toString();
     
-    Swal.fire({
-        title: 'Exportando...',
-        html: 'Generando archivo Excel<br>Por favor espere',
-        icon: 'info',
-        allowOutsideClick: false,
-        allowEscapeKey: false,
-        didOpen: () => {
-            Swal.showLoading();
-        }
-    });
-    
-    const exportUrl = `/proveedores/exportar-excel/${params ? '?' + params : ''}`;
-    window.location.href = exportUrl;
-    
-    setTimeout(() => {
-        Swal.fire({
-            title: '¡Exportado!',
-            text: 'El archivo Excel se ha descargado correctamente',
-            icon: 'success',
-            confirmButtonColor: '#198754',
-            timer: 2000,
-            timerProgressBar: true
-        });
-    }, 1500);
+    // Encolar la exportación con los mismos filtros y esperar el archivo
+    LiliUtils.exportarExcel(`/proveedores/exportar-excel/${params ? '?' + params : ''}`);
 }
 
 // Función para ordenar tabla
@@ -469,7 +458,7 @@ function sortTable(field) {
         url.searchParams.set('order', 'asc');
     }
     
-    url.searchParams.set('page', 1);
+    url.searchParams.delete('cursor');
     window.location.href = url.toString();
 }
 
@@ -555,6 +544,14 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Paginación por cursor
+    document.querySelectorAll('.pagination [data-cursor]').forEach(function(link) {
+        link.addEventListener('click', function(e) {
+            e.preventDefault();
+            irACursor(this.dataset.cursor);
+        });
+    });
+    
     // Actualizar iconos de ordenamiento según estado actual
     const urlParams = new URLSearchParams(window.location.search);
     const currentSort = urlParams.get('sort');
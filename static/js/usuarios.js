@@ -384,7 +384,18 @@ function deleteUsuario(id, username) {
 function changePerPage(value) {
     const url = new URL(window.location.href);
     url.searchParams.set('per_page', value);
-    url.searchParams.set('page', 1);
+    url.searchParams.delete('cursor');
+    window.location.href = url.toString();
+}
+
+// Navegar a otra página del listado (sin cursor: primera página)
+function irACursor(cursor) {
+    const url = new URL(window.location.href);
+    if (cursor) {
+        url.searchParams.set('cursor', cursor);
+    } else {
+        url.searchParams.delete('cursor');
+    }
     window.location.href = url.toString();
 }
 
@@ -394,35 +405,8 @@ function exportarExcel() {
     const url = new URL(window.location.href);
     const params = url.searchParams.toString();
     
-    // Mostrar mensaje de exportación
-    Swal.fire({
-        title: 'Exportando...',
-        html: 'Generando archivo Excel<br>Por favor espere',
-        icon: 'info',
-        allowOutsideClick: false,
-        allowEscapeKey: false,
-        didOpen: () => {
-            Swal.showLoading();
-        }
-    });
-    
-    // Construir URL de exportación con los mismos filtros
-    const exportUrl = `/usuarios/exportar-excel/${params ? '?' + params : ''}`;
-    
-    // Descargar archivo
-    window.location.href = exportUrl;
-    
-    // Cerrar mensaje después de un momento
-    setTimeout(() => {
-        Swal.fire({
-            title: '¡Exportado!',
-            text: 'El archivo Excel se ha descargado correctamente',
-            icon: 'success',
-            confirmButtonColor: '#198754',
-            timer: 2000,
-            timerProgressBar: true
-        });
-    }, 1500);
+    // Encolar la exportación con los mismos filtros y esperar el archivo
+    LiliUtils.exportarExcel(`/usuarios/exportar-excel/${params ? '?' + params : ''}`);
 }
 
 // Exportar a PDF
@@ -446,8 +430,8 @@ function sortTable(field) {
         url.searchParams.set('order', 'asc');
     }
     
-    // Resetear a página 1 al ordenar
-    url.searchParams.set('page', 1);
+    // Volver a la primera página al ordenar (el cursor depende del orden)
+    url.searchParams.delete('cursor');
     
     window.location.href = url.toString();
 }
@@ -528,6 +512,14 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Paginación por cursor
+    document.querySelectorAll('.pagination [data-cursor]').forEach(function(link) {
+        link.addEventListener('click', function(e) {
+            e.preventDefault();
+            irACursor(this.dataset.cursor);
+        });
+    });
+    
     // Actualizar iconos de ordenamiento según estado actual
     const urlParams = new URLSearchParams(window.location.search);
     const currentSort = urlParams.get('sort');